@@ -5,11 +5,16 @@
 import time
 import logging
 from datetime import datetime, timedelta
+from sqlalchemy.schema import CreateTable, CreateIndex
 
 from hive.db.schema import (setup, reset_autovac, build_metadata,
                             build_metadata_community, teardown, DB_VERSION,
                             build_metadata_blacklist, build_trxid_block_num,
-                            build_temp_cache_metadata)
+                            build_temp_cache_metadata, build_votes_metadata,
+                            build_undo_metadata, create_undo_triggers,
+                            drop_undo_triggers, create_temp_cache_partitions,
+                            build_post_data_metadata, TEMP_CACHE_DAYS,
+                            UNDO_TABLES, UNDO_APPENDED)
 from hive.db.adapter import Db
 
 log = logging.getLogger(__name__)
@@ -139,6 +144,9 @@ class DbState:
             log.info("Drop index %s.%s", index.table, index.name)
             index.drop(engine)
 
+        # initial sync only processes irreversible blocks
+        drop_undo_triggers(cls.db())
+
         # TODO: #111
         #for key in cls._all_foreign_keys():
         #    log.info("Drop fk %s", key.name)
@@ -160,6 +168,8 @@ class DbState:
             log.info("Create index %s.%s", index.table, index.name)
             index.create(engine)
 
+        create_undo_triggers(cls.db())
+
         # TODO: #111
         #for key in cls._all_foreign_keys():
         #    log.info("Create fk %s", key.name)
@@ -396,23 +406,16 @@ class DbState:
                 # One-time cold-start backfill (90-day window); disable statement_timeout for long run
                 cls.db().query("SET LOCAL statement_timeout = '0'")
                 cutoff = datetime.now() - timedelta(days=90)
+                create_temp_cache_partitions(cls.db(), cutoff)
+                cols = ', '.join(col.name for col in
+                                 build_temp_cache_metadata().tables['hive_posts_cache_temp'].columns
+                                 if col.name != '_synced_at')
                 backfill_sql = """
-                    INSERT INTO hive_posts_cache_temp (
-                        post_id, author, permlink, category, community_id, depth, children,
-                        author_rep, flag_weight, total_votes, up_votes, title, preview, img_url,
-                        payout, promoted, created_at, payout_at, updated_at, is_paidout,
-                        is_nsfw, is_declined, is_full_power, is_hidden, is_grayed,
-                        rshares, sc_trend, sc_hot, body, votes, json, raw_json, _synced_at
-                    )
-                    SELECT post_id, author, permlink, category, community_id, depth, children,
-                           author_rep, flag_weight, total_votes, up_votes, title, preview, img_url,
-                           payout, promoted, created_at, payout_at, updated_at, is_paidout,
-                           is_nsfw, is_declined, is_full_power, is_hidden, is_grayed,
-                           rshares, sc_trend, sc_hot, body, votes, json, raw_json,
-                           NOW() as _synced_at
+                    INSERT INTO hive_posts_cache_temp (%s, _synced_at)
+                    SELECT %s, NOW() as _synced_at
                     FROM hive_posts_cache
                     WHERE created_at >= :cutoff
-                """
+                """ % (cols, cols)
                 result = cls.db().query(backfill_sql, cutoff=cutoff)
                 n = result.rowcount if hasattr(result, 'rowcount') else 0
                 log.info("[HIVE] hive_posts_cache_temp cold-start backfill done, rows=%s", n)
@@ -420,8 +423,10 @@ class DbState:
 
         if cls._ver == 25:
             # Tune autovacuum for hive_posts_cache_temp and hive_posts_cache
+            # (if created partitioned, see v32, its partitions are already tuned)
             log.info("[HIVE] Tuning autovacuum for hive_posts_cache_temp...")
-            cls.db().query("""ALTER TABLE hive_posts_cache_temp SET (
+            if not cls._is_temp_cache_partitioned():
+                cls.db().query("""ALTER TABLE hive_posts_cache_temp SET (
                 autovacuum_vacuum_scale_factor = 0,
                 autovacuum_vacuum_threshold = 25000,
                 autovacuum_analyze_scale_factor = 0,
@@ -451,21 +456,23 @@ class DbState:
             # Reference: beta-hivemind-slow-query-analysis.md
             log.info("[HIVE] Creating slow query optimization indexes...")
 
-            # 1. hive_posts_cache_temp depth+trending index
-            # Optimizes trending/new queries with depth=0 filter
-            cls.db().query("""
-                CREATE INDEX CONCURRENTLY IF NOT EXISTS hive_posts_cache_temp_ix6b
-                ON hive_posts_cache_temp (depth, sc_trend DESC, post_id)
-                WHERE is_paidout = '0' AND depth = 0
-            """)
-
-            # 2. hive_posts_cache_temp community+depth+trending index
-            # Optimizes community trending queries
-            cls.db().query("""
-                CREATE INDEX CONCURRENTLY IF NOT EXISTS hive_posts_cache_temp_ix30b
-                ON hive_posts_cache_temp (community_id, depth, sc_trend DESC, post_id)
-                WHERE community_id IS NOT NULL AND is_grayed = '0' AND depth = 0
-            """)
+            # (if created partitioned, see v32, these are already defined)
+            if not cls._is_temp_cache_partitioned():
+                # 1. hive_posts_cache_temp depth+trending index
+                # Optimizes trending/new queries with depth=0 filter
+                cls.db().query("""
+                    CREATE INDEX CONCURRENTLY IF NOT EXISTS hive_posts_cache_temp_ix6b
+                    ON hive_posts_cache_temp (depth, sc_trend DESC, post_id)
+                    WHERE is_paidout = '0' AND depth = 0
+                """)
+
+                # 2. hive_posts_cache_temp community+depth+trending index
+                # Optimizes community trending queries
+                cls.db().query("""
+                    CREATE INDEX CONCURRENTLY IF NOT EXISTS hive_posts_cache_temp_ix30b
+                    ON hive_posts_cache_temp (community_id, depth, sc_trend DESC, post_id)
+                    WHERE community_id IS NOT NULL AND is_grayed = '0' AND depth = 0
+                """)
 
             # 3. hive_feed_cache account+created index (if not exists from v23)
             # Optimizes feed/blog ORDER BY created_at DESC queries
@@ -525,6 +532,59 @@ class DbState:
             log.info("[HIVE] hive_follows index optimization complete")
             cls._set_ver(29)
 
+        if cls._ver == 29:
+            # vote ledger: lets vote-only post refreshes skip get_content
+            build_votes_metadata().create_all(cls.db().engine())
+            cls._set_ver(30)
+
+        if cls._ver == 30:
+            # undo journal for fork recovery; triggers are only needed
+            # once following head (see `_after_initial_sync`)
+            build_undo_metadata().create_all(cls.db().engine())
+            if not cls._is_feed_cache_empty():
+                # tables added in later versions get theirs when created
+                create_undo_triggers(cls.db(), [table for table in UNDO_TABLES
+                                                if table != 'hive_post_data'])
+            cls._set_ver(31)
+
+        if cls._ver == 31:
+            # range-partition hive_posts_cache_temp by week, so that expired
+            # rows are dropped with their partition rather than DELETEd
+            if not cls._is_temp_cache_partitioned():
+                cls._partition_temp_cache()
+            cls._set_ver(32)
+
+        if cls._ver == 32:
+            # move large text columns out of the cache tables, so that
+            # vote updates only rewrite the narrow ranking row
+            log.info("[HIVE] Moving post body/json to hive_post_data...")
+            cls.db().query("SET LOCAL statement_timeout = '0'")
+            build_post_data_metadata().create_all(cls.db().engine())
+            cls.db().query("""INSERT INTO hive_post_data (post_id, body, json, raw_json)
+                                   SELECT post_id, body, json, raw_json
+                                     FROM hive_posts_cache""")
+            for table in ['hive_posts_cache', 'hive_posts_cache_temp']:
+                cls.db().query("ALTER TABLE %s DROP COLUMN IF EXISTS body,"
+                               " DROP COLUMN IF EXISTS json,"
+                               " DROP COLUMN IF EXISTS raw_json" % table)
+            if not cls._is_feed_cache_empty():
+                create_undo_triggers(cls.db(), ['hive_post_data'])
+            log.info("[HIVE] hive_post_data created")
+            cls._set_ver(33)
+
+        if cls._ver == 33:
+            # stop journaling vote-derived cache columns; skip trigger calls
+            # outside journaled blocks
+            if not cls._is_feed_cache_empty():
+                create_undo_triggers(cls.db())
+            cls._set_ver(34)
+
+        if cls._ver == 34:
+            # append-only tables are no longer journaled (see `UNDO_APPENDED`)
+            for table in UNDO_APPENDED:
+                cls.db().query("DROP TRIGGER IF EXISTS hive_undo_trg ON %s" % table)
+            cls._set_ver(35)
+
         reset_autovac(cls.db())
 
         log.info("[HIVE] db version: %d", cls._ver)
@@ -535,6 +595,49 @@ class DbState:
         #    cls._set_ver(2)
 
 
+    @classmethod
+    def _is_temp_cache_partitioned(cls):
+        sql = "SELECT relkind FROM pg_class WHERE relname = 'hive_posts_cache_temp'"
+        return cls.db().query_one(sql) == 'p'
+
+    @classmethod
+    def _partition_temp_cache(cls):
+        """Rebuild hive_posts_cache_temp as a partitioned table.
+
+        Runs as one transaction on the shared connection (DDL included),
+        so that an interrupted rebuild leaves the old table in place.
+        """
+        db = cls.db()
+        log.info("[HIVE] Partitioning hive_posts_cache_temp...")
+        table = build_temp_cache_metadata().tables['hive_posts_cache_temp']
+        dialect = db.engine().dialect
+        db.query("START TRANSACTION")
+        db.query("SET LOCAL statement_timeout = '0'")
+        db.query("ALTER TABLE hive_posts_cache_temp RENAME TO hive_posts_cache_temp_old")
+        # free up index names for the new table
+        for index in table.indexes:
+            db.query("DROP INDEX IF EXISTS %s" % index.name)
+        db.query("ALTER TABLE hive_posts_cache_temp_old"
+                 " DROP CONSTRAINT hive_posts_cache_temp_pkey")
+
+        db.query(str(CreateTable(table).compile(dialect=dialect)).strip())
+        for index in table.indexes:
+            db.query(str(CreateIndex(index).compile(dialect=dialect)))
+        cutoff = datetime.now() - timedelta(days=TEMP_CACHE_DAYS)
+        create_temp_cache_partitions(db, cutoff)
+        cols = ', '.join(col.name for col in table.columns)
+        db.query("""INSERT INTO hive_posts_cache_temp (%s)
+                    SELECT %s FROM hive_posts_cache_temp_old
+                     WHERE created_at >= :cutoff""" % (cols, cols), cutoff=cutoff)
+        db.query("DROP TABLE hive_posts_cache_temp_old")
+
+        # journal trigger went with the old table
+        if not cls._is_feed_cache_empty():
+            create_undo_triggers(db, ['hive_posts_cache_temp'])
+        db.query("COMMIT")
+        db.query("ANALYZE hive_posts_cache_temp")
+        log.info("[HIVE] hive_posts_cache_temp partitioned")
+
     @classmethod
     def _set_ver(cls, ver):
         """Sets the db/schema version number. Enforce sequential."""
@@ -1,5 +1,7 @@
 """Db schema definitions and setup routines."""
 
+from datetime import datetime, timedelta
+
 import sqlalchemy as sa
 from sqlalchemy.sql import text as sql_text
 from sqlalchemy.types import SMALLINT
@@ -7,10 +9,11 @@ from sqlalchemy.types import CHAR
 from sqlalchemy.types import VARCHAR
 from sqlalchemy.types import TEXT
 from sqlalchemy.types import BOOLEAN
+from sqlalchemy.dialects.postgresql import JSONB
 
 #pylint: disable=line-too-long, too-many-lines, bad-whitespace
 
-DB_VERSION = 29
+DB_VERSION = 35
 
 def build_metadata():
     """Build schema def with SqlAlchemy"""
@@ -200,11 +203,8 @@ def build_metadata():
         sa.Column('sc_trend', sa.Float(precision=6), nullable=False, server_default='0'),
         sa.Column('sc_hot', sa.Float(precision=6), nullable=False, server_default='0'),
 
-        # bulk data
-        sa.Column('body', TEXT),
+        # bulk data (body, json, raw_json: see hive_post_data)
         sa.Column('votes', TEXT),
-        sa.Column('json', sa.Text),
-        sa.Column('raw_json', sa.Text),
 
         # index: misc
         sa.Index('hive_posts_cache_ix3',  'payout_at', 'post_id',           postgresql_where=sql_text("is_paidout = '0'")),         # core: payout sweep
@@ -251,11 +251,188 @@ def build_metadata():
 
     metadata = build_temp_cache_metadata(metadata)
 
+    metadata = build_votes_metadata(metadata)
+
+    metadata = build_undo_metadata(metadata)
+
+    metadata = build_post_data_metadata(metadata)
+
+    return metadata
+
+def build_post_data_metadata(metadata=None):
+    """Build hive_post_data: large text payloads of cached posts.
+
+    Kept out of hive_posts_cache(_temp) so that frequent vote updates
+    only rewrite the narrow ranking row; written on insert, update and
+    payout levels only.
+    """
+    if not metadata:
+        metadata = sa.MetaData()
+
+    sa.Table(
+        'hive_post_data', metadata,
+        sa.Column('post_id', sa.Integer, primary_key=True, autoincrement=False),
+        sa.Column('body', TEXT),
+        sa.Column('json', sa.Text),
+        sa.Column('raw_json', sa.Text),
+    )
+
+    return metadata
+
+def build_votes_metadata(metadata=None):
+    """Build hive_votes: active votes of posts pending payout."""
+    if not metadata:
+        metadata = sa.MetaData()
+
+    sa.Table(
+        'hive_votes', metadata,
+        sa.Column('post_id', sa.Integer, nullable=False),
+        sa.Column('voter_id', sa.Integer, nullable=False),
+        sa.Column('rshares', sa.BigInteger, nullable=False, server_default='0'),
+        sa.Column('percent', SMALLINT, nullable=False, server_default='0'),
+        sa.Column('reputation', sa.BigInteger, nullable=False, server_default='0'),
+        sa.Column('created_at', sa.DateTime, nullable=False),
+
+        sa.PrimaryKeyConstraint('post_id', 'voter_id', name='hive_votes_pk'),
+    )
+
     return metadata
 
 
+def build_undo_metadata(metadata=None):
+    """Build hive_undo: inverse of each write made by a reversible block."""
+    if not metadata:
+        metadata = sa.MetaData()
+
+    sa.Table(
+        'hive_undo', metadata,
+        sa.Column('id', sa.BigInteger, primary_key=True),
+        sa.Column('block_num', sa.Integer, nullable=False),
+        sa.Column('table_name', VARCHAR(32), nullable=False),
+        sa.Column('op', CHAR(1), nullable=False), # I, U or D
+        sa.Column('pk', JSONB, nullable=False),
+        sa.Column('data', JSONB), # old values (changed cols only on U)
+
+        sa.Index('hive_undo_ix1', 'block_num', 'id'),
+    )
+
+    return metadata
+
+# journaled tables and their key columns, parents first; see `hive.indexer.undo`
+UNDO_TABLES = {
+    'hive_blocks':           ['num'],
+    'hive_accounts':         ['id'],
+    'hive_posts':            ['id'],
+    'hive_post_tags':        ['tag', 'post_id'],
+    'hive_follows':          ['following', 'follower'],
+    'hive_reblogs':          ['account', 'post_id'],
+    'hive_posts_cache':      ['post_id'],
+    'hive_posts_cache_temp': ['post_id'],
+    'hive_post_data':        ['post_id'],
+    'hive_votes':            ['post_id', 'voter_id'],
+    'hive_communities':      ['id'],
+    'hive_roles':            ['account_id', 'community_id'],
+    'hive_subscriptions':    ['account_id', 'community_id'],
+}
+
+# append-only tables and the column their rows are dated by. Not journaled;
+# a revert deletes their rows from the reverted blocks on.
+UNDO_APPENDED = {
+    'hive_payments':         'block_num',
+    'hive_trxid_block_num':  'block_num',
+    'hive_feed_cache':       'created_at',
+    'hive_notifs':           'created_at',
+}
+
+# vote-derived cache columns. Not journaled: vote refreshes would log the
+# old `votes` csv of main + temp on every upvote, and a revert refetches
+# the posts it touched anyway (see `UndoLog.touched_posts`).
+UNDO_DERIVED = ['flag_weight', 'total_votes', 'up_votes', 'payout',
+                'rshares', 'sc_trend', 'sc_hot', 'votes']
+
+# journals a row write if `hive.undo_block` is set for the transaction.
+# Trigger args are the key columns, then '-'-prefixed columns to skip.
+UNDO_FUNCTION = """
+CREATE OR REPLACE FUNCTION hive_undo_log() RETURNS trigger AS $$
+DECLARE
+    block INTEGER := NULLIF(current_setting('hive.undo_block', true), '')::INTEGER;
+    cur JSONB;
+    old_data JSONB;
+    pk JSONB := '{}';
+    skip TEXT[] := '{}';
+    col TEXT;
+BEGIN
+    IF block IS NULL THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP = 'DELETE' THEN
+        cur := to_jsonb(OLD);
+        old_data := cur;
+    ELSE
+        cur := to_jsonb(NEW);
+    END IF;
+    FOREACH col IN ARRAY TG_ARGV LOOP
+        IF LEFT(col, 1) = '-' THEN
+            skip := skip || SUBSTR(col, 2);
+        ELSE
+            pk := pk || jsonb_build_object(col, cur -> col);
+        END IF;
+    END LOOP;
+    IF TG_OP = 'UPDATE' THEN
+        SELECT jsonb_object_agg(o.key, o.value) INTO old_data
+          FROM jsonb_each(to_jsonb(OLD)) o
+         WHERE o.value IS DISTINCT FROM cur -> o.key
+           AND o.key <> ALL(skip);
+        IF old_data IS NULL THEN
+            RETURN NULL;
+        END IF;
+    END IF;
+    INSERT INTO hive_undo (block_num, table_name, op, pk, data)
+         VALUES (block, TG_TABLE_NAME, LEFT(TG_OP, 1), pk, old_data);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql"""
+
+def _undo_trigger_sql(table):
+    """Build the journal trigger of `table`.
+
+    Writes outside a journaled block skip the trigger call entirely, as
+    do cache updates which only touch `UNDO_DERIVED` columns.
+    """
+    args = list(UNDO_TABLES[table])
+    events = "INSERT OR UPDATE OR DELETE"
+    if table in ('hive_posts_cache', 'hive_posts_cache_temp'):
+        if table == 'hive_posts_cache':
+            columns = build_metadata().tables[table].columns
+        else:
+            columns = build_temp_cache_metadata().tables[table].columns
+        tracked = [col.name for col in columns if col.name not in UNDO_DERIVED]
+        events = "INSERT OR DELETE OR UPDATE OF %s" % ', '.join(tracked)
+        args.extend('-' + col for col in UNDO_DERIVED)
+    return ("CREATE TRIGGER hive_undo_trg AFTER %s ON %s FOR EACH ROW"
+            " WHEN (current_setting('hive.undo_block', true) <> '')"
+            " EXECUTE PROCEDURE hive_undo_log(%s)"
+            % (events, table, ', '.join("'%s'" % arg for arg in args)))
+
+def create_undo_triggers(db, tables=None):
+    """Journal writes to `UNDO_TABLES`, or just `tables` (see `UNDO_FUNCTION`)."""
+    db.query(UNDO_FUNCTION)
+    for table in tables or UNDO_TABLES:
+        db.query("DROP TRIGGER IF EXISTS hive_undo_trg ON %s" % table)
+        db.query(_undo_trigger_sql(table))
+
+def drop_undo_triggers(db):
+    """Stop journaling writes (no forks below the irreversible block)."""
+    for table in UNDO_TABLES:
+        db.query("DROP TRIGGER IF EXISTS hive_undo_trg ON %s" % table)
+
 def build_temp_cache_metadata(metadata=None):
-    """Build hive_posts_cache_temp table for hot-data queries (90-day window)."""
+    """Build hive_posts_cache_temp table for hot-data queries (90-day window).
+
+    Range-partitioned by week of `created_at` (see `create_temp_cache_partitions`),
+    so that expired rows are dropped a partition at a time. Postgres requires
+    the partition key in the primary key, hence (post_id, created_at).
+    """
     if not metadata:
         metadata = sa.MetaData()
 
@@ -277,7 +454,7 @@ def build_temp_cache_metadata(metadata=None):
         sa.Column('img_url', sa.String(1024), nullable=False, server_default=''),
         sa.Column('payout', sa.types.DECIMAL(10, 3), nullable=False, server_default='0'),
         sa.Column('promoted', sa.types.DECIMAL(10, 3), nullable=False, server_default='0'),
-        sa.Column('created_at', sa.DateTime, nullable=False, server_default='1990-01-01'),
+        sa.Column('created_at', sa.DateTime, primary_key=True, server_default='1990-01-01'),
         sa.Column('payout_at', sa.DateTime, nullable=False, server_default='1990-01-01'),
         sa.Column('updated_at', sa.DateTime, nullable=False, server_default='1990-01-01'),
         sa.Column('is_paidout', BOOLEAN, nullable=False, server_default='0'),
@@ -289,10 +466,7 @@ def build_temp_cache_metadata(metadata=None):
         sa.Column('rshares', sa.BigInteger, nullable=False, server_default='0'),
         sa.Column('sc_trend', sa.Float(precision=6), nullable=False, server_default='0'),
         sa.Column('sc_hot', sa.Float(precision=6), nullable=False, server_default='0'),
-        sa.Column('body', TEXT),
         sa.Column('votes', TEXT),
-        sa.Column('json', sa.Text),
-        sa.Column('raw_json', sa.Text),
         sa.Column('_synced_at', sa.DateTime, nullable=True),
         sa.Index('hive_posts_cache_temp_ix6a', 'sc_trend', 'post_id',
                  postgresql_where=sql_text("is_paidout = '0'")),
@@ -310,9 +484,86 @@ def build_temp_cache_metadata(metadata=None):
         # Optimizes community trending queries
         sa.Index('hive_posts_cache_temp_ix30b', 'community_id', 'depth', 'sc_trend', 'post_id',
                  postgresql_where=sql_text("community_id IS NOT NULL AND is_grayed = '0' AND depth = 0")),
+        postgresql_partition_by='RANGE (created_at)',
     )
     return metadata
 
+TEMP_CACHE_DAYS = 90
+TEMP_CACHE_PARTITION_DAYS = 7
+TEMP_CACHE_PARTITIONS_AHEAD = 4
+
+# per-partition; storage params cannot be set on the partitioned parent
+TEMP_CACHE_AUTOVAC = ("autovacuum_vacuum_scale_factor = 0, autovacuum_vacuum_threshold = 25000,"
+                      " autovacuum_analyze_scale_factor = 0, autovacuum_analyze_threshold = 25000,"
+                      " autovacuum_vacuum_cost_delay = 20, autovacuum_vacuum_cost_limit = 200")
+
+def temp_cache_partitions(start, end):
+    """List (name, lbound, ubound) of weekly partitions covering [start, end]."""
+    day = datetime(start.year, start.month, start.day)
+    lbound = day - timedelta(days=day.weekday())
+    out = []
+    while lbound <= end:
+        ubound = lbound + timedelta(days=TEMP_CACHE_PARTITION_DAYS)
+        name = 'hive_posts_cache_temp_p%s' % lbound.strftime('%Y%m%d')
+        out.append((name, lbound, ubound))
+        lbound = ubound
+    return out
+
+def _temp_cache_partition_bound(name):
+    """Get the lower bound of a weekly partition from its name."""
+    return datetime.strptime(name[-8:], '%Y%m%d')
+
+def create_temp_cache_partitions(db, cutoff, now=None):
+    """Create missing partitions of hive_posts_cache_temp, from the week of
+    `cutoff` up to `TEMP_CACHE_PARTITIONS_AHEAD` weeks past `now`.
+
+    A new partition is filled and attached separately, so that any rows of
+    its range which landed in the default partition are moved into it.
+    Returns names of the partitions created.
+    """
+    now = now or datetime.now()
+    ahead = now + timedelta(days=TEMP_CACHE_PARTITION_DAYS * TEMP_CACHE_PARTITIONS_AHEAD)
+    db.query("CREATE TABLE IF NOT EXISTS hive_posts_cache_temp_default"
+             " PARTITION OF hive_posts_cache_temp DEFAULT WITH (%s)" % TEMP_CACHE_AUTOVAC)
+    existing = set(_temp_cache_partition_names(db))
+    created = []
+    for name, lbound, ubound in temp_cache_partitions(cutoff, ahead):
+        if name in existing:
+            continue
+        db.query("CREATE TABLE %s (LIKE hive_posts_cache_temp INCLUDING DEFAULTS)"
+                 " WITH (%s)" % (name, TEMP_CACHE_AUTOVAC))
+        moved = "hive_posts_cache_temp_default WHERE created_at >= :lbound AND created_at < :ubound"
+        db.query("INSERT INTO %s SELECT * FROM %s" % (name, moved),
+                 lbound=lbound, ubound=ubound)
+        db.query("DELETE FROM %s" % moved, lbound=lbound, ubound=ubound)
+        db.query("ALTER TABLE hive_posts_cache_temp ATTACH PARTITION %s"
+                 " FOR VALUES FROM ('%s') TO ('%s')" % (name, lbound, ubound))
+        created.append(name)
+    return created
+
+def drop_temp_cache_partitions(db, cutoff):
+    """Drop partitions of hive_posts_cache_temp entirely older than `cutoff`,
+    and prune older rows from the default partition. Returns names dropped."""
+    dropped = []
+    for name in _temp_cache_partition_names(db):
+        lbound = _temp_cache_partition_bound(name)
+        if lbound + timedelta(days=TEMP_CACHE_PARTITION_DAYS) > cutoff:
+            continue
+        db.query("ALTER TABLE hive_posts_cache_temp DETACH PARTITION %s" % name)
+        db.query("DROP TABLE %s" % name)
+        dropped.append(name)
+    db.query("DELETE FROM hive_posts_cache_temp_default WHERE created_at < :cutoff",
+             cutoff=cutoff)
+    return dropped
+
+def _temp_cache_partition_names(db):
+    """Get names of the weekly partitions of hive_posts_cache_temp."""
+    sql = """SELECT c.relname FROM pg_inherits i
+                JOIN pg_class c ON c.oid = i.inhrelid
+               WHERE i.inhparent = 'hive_posts_cache_temp'::regclass
+                 AND c.relname <> 'hive_posts_cache_temp_default'"""
+    return db.query_col(sql)
+
 
 def build_metadata_community(metadata=None):
     """Build community schema defs"""
@@ -449,6 +700,8 @@ def setup(db):
     for sql in sqls:
         db.query(sql)
 
+    create_temp_cache_partitions(db, datetime.now() - timedelta(days=TEMP_CACHE_DAYS))
+
     sql = "CREATE INDEX hive_communities_ft1 ON hive_communities USING GIN (to_tsvector('english', title || ' ' || about))"
     db.query(sql)
 
@@ -467,7 +720,7 @@ def reset_autovac(db):
     autovac_config = { #                      vacuum  analyze cost_delay cost_limit
         'hive_accounts':        (50000, 100000, None,  None),
         'hive_posts_cache':     (25000, 25000,  20,    200),
-        'hive_posts_cache_temp':(25000, 25000,  20,    200),
+        'hive_post_data':       (25000, 25000,  None,  None),
         'hive_posts':           (2500,  10000,  None,  None),
         'hive_post_tags':       (5000,  10000,  None,  None),
         'hive_follows':         (5000,  5000,   None,  None),
@@ -475,6 +728,7 @@ def reset_autovac(db):
         'hive_blocks':          (5000,  25000,  None,  None),
         'hive_reblogs':         (5000,  5000,   None,  None),
         'hive_payments':        (5000,  5000,   None,  None),
+        'hive_undo':            (5000,  5000,   None,  None),
     }
 
     for table, (n_vacuum, n_analyze, cost_delay, cost_limit) in autovac_config.items():
@@ -1,6 +1,7 @@
 """Accounts indexer."""
 
 import logging
+import os
 
 from datetime import datetime
 from toolz import partition_all
@@ -12,6 +13,8 @@ from hive.utils.normalize import rep_log10, vests_amount
 from hive.utils.timer import Timer
 from hive.utils.account import safe_profile_metadata
 from hive.utils.unique_fifo import UniqueFIFO
+from hive.utils.namemap import NameIdMap
+from hive.utils.ranks import RankIndex
 
 log = logging.getLogger(__name__)
 
@@ -21,22 +24,66 @@ class Accounts:
     """Manages account id map, dirty queue, and `hive_accounts` table."""
 
     # name->id map
-    _ids = {}
+    _ids = NameIdMap()
 
     # fifo queue
     _dirty = UniqueFIFO()
 
-    # in-mem id->rank map
-    _ranks = {}
+    # in-mem id->rank index, kept current as accounts are updated
+    _ranks = RankIndex()
 
     # account core methods
     # --------------------
 
     @classmethod
-    def load_ids(cls):
-        """Load a full (name: id) dict into memory."""
+    def load_ids(cls, snapshot=None):
+        """Load the full name->id map into memory.
+
+        If a `snapshot` path is given and the file there matches the
+        db, it is mmapped and only accounts created since are queried;
+        otherwise the map is built from the db and the snapshot saved.
+        """
         assert not cls._ids, "id map already loaded"
-        cls._ids = dict(DB.query_all("SELECT name, id FROM hive_accounts"))
+        if snapshot and os.path.exists(snapshot):
+            cls._ids = cls._load_snapshot(snapshot)
+            if cls._ids:
+                return
+
+        sql = "SELECT name, id FROM hive_accounts"
+        cls._ids = NameIdMap.from_rows((name, _id) for name, _id
+                                       in DB.query_all(sql))
+        if snapshot:
+            cls._ids.save(snapshot)
+            log.info("saved account snapshot %s (%d names)",
+                     snapshot, len(cls._ids))
+
+    @classmethod
+    def _load_snapshot(cls, path):
+        """Map an id snapshot and apply newer accounts; None if stale."""
+        loaded = NameIdMap.load(path)
+        if not loaded:
+            return None
+        ids, max_id = loaded
+
+        # snapshot must be a prefix of the db: same account at max id
+        db_max = DB.query_one("SELECT MAX(id) FROM hive_accounts") or 0
+        newest = ids.max_name()
+        if newest:
+            name, _id = newest
+            sql = "SELECT id FROM hive_accounts WHERE name = :name"
+            if max_id > db_max or DB.query_one(sql, name=name) != _id:
+                log.warning("account snapshot %s does not match db", path)
+                return None
+
+        sql = "SELECT name, id FROM hive_accounts WHERE id > :max_id"
+        for name, _id in DB.query_all(sql, max_id=max_id):
+            ids.add(name, _id)
+        log.info("loaded account snapshot %s (%d names, %d newer)",
+                 path, len(ids), ids.overlay_size())
+
+        if ids.overlay_size() > len(ids) * 0.05:
+            ids.save(path)
+        return ids
 
     @classmethod
     def clear_ids(cls):
@@ -47,7 +94,7 @@ class Accounts:
     def default_score(cls, name):
         """Return default notification score based on rank."""
         _id = cls.get_id(name)
-        rank = cls._ranks[_id] if _id in cls._ranks else 1000000
+        rank = cls._ranks.rank(_id) or 1000000
         if rank < 200: return 70    # 0.02% 100k
         if rank < 1000: return 60   # 0.1%  10k
         if rank < 6500: return 50   # 0.5%  1k
@@ -58,8 +105,9 @@ class Accounts:
     @classmethod
     def get_id(cls, name):
         """Get account id by name. Throw if not found."""
-        assert name in cls._ids, "account does not exist or was not registered"
-        return cls._ids[name]
+        _id = cls._ids.get(name)
+        assert _id, "account does not exist or was not registered"
+        return _id
 
     @classmethod
     def exists(cls, name):
@@ -89,9 +137,9 @@ class Accounts:
                      "VALUES (:name, :date)", name=name, date=block_date)
 
         # pull newly-inserted ids and merge into our map
-        sql = "SELECT name, id FROM hive_accounts WHERE name IN :names"
-        for name, _id in DB.query_all(sql, names=tuple(new_names)):
-            cls._ids[name] = _id
+        sql = "SELECT name, id FROM hive_accounts WHERE name = ANY(:names)"
+        for name, _id in DB.query_all(sql, names=list(new_names)):
+            cls._ids.add(name, _id)
 
         # post-insert: pass to communities to check for new registrations
         from hive.indexer.community import Community, START_DATE
@@ -119,8 +167,13 @@ class Accounts:
     @classmethod
     def dirty_oldest(cls, limit=50000):
         """Flag `limit` least-recently updated accounts for update."""
+        return cls.dirty_set(cls.oldest(limit))
+
+    @classmethod
+    def oldest(cls, limit, db=None):
+        """Get names of the `limit` least-recently updated accounts."""
         sql = "SELECT name FROM hive_accounts ORDER BY cached_at LIMIT :limit"
-        return cls.dirty_set(set(DB.query_col(sql, limit=limit)))
+        return set((db or DB).query_col(sql, limit=limit))
 
     @classmethod
     def flush(cls, steem, trx=False, spread=1):
@@ -143,10 +196,13 @@ class Accounts:
 
     @classmethod
     def fetch_ranks(cls):
-        """Rebuild account ranks and store in memory for next update."""
-        sql = "SELECT id FROM hive_accounts ORDER BY vote_weight DESC"
-        for rank, _id in enumerate(DB.query_col(sql)):
-            cls._ranks[_id] = rank + 1
+        """Load account weights into the in-memory rank index.
+
+        Only needed at startup; afterwards `_sql` updates the index
+        with each account's new vote weight.
+        """
+        sql = "SELECT id, vote_weight FROM hive_accounts"
+        cls._ranks.load(DB.query_all(sql))
 
     @classmethod
     def _cache_accounts(cls, accounts, steem, trx=True):
@@ -217,10 +273,10 @@ class Accounts:
 
             'raw_json': json.dumps(account)}
 
-        # update rank field, if present
+        # update rank index and field
         _id = cls.get_id(account['name'])
-        if _id in cls._ranks:
-            values['rank'] = cls._ranks[_id]
+        cls._ranks.update(_id, vote_weight)
+        values['rank'] = cls._ranks.rank(_id)
 
         bind = ', '.join([k+" = :"+k for k in list(values.keys())][1:])
         return ("UPDATE hive_accounts SET %s WHERE name = :name" % bind, values)
@@ -0,0 +1,105 @@
+"""Parallel JSON decoding of checkpoint blocks.
+
+Checkpoint replay is single-writer: blocks must be applied in order,
+and post/account ids are assigned as they are. Decoding, though, is
+independent per line. This module parses raw block lines in a process
+pool and strips everything `Blocks._process` ignores during initial
+sync, handing back compact blocks in their original order.
+
+Kept free of db imports so that pool workers can load it cheaply.
+"""
+
+import logging
+import multiprocessing
+from collections import deque
+import ujson as json
+
+log = logging.getLogger(__name__)
+
+# op types acted upon by `Blocks._process` when `is_initial_sync`
+# (votes and account updates are skipped until initial sync is done)
+INITIAL_SYNC_OPS = frozenset([
+    'pow_operation',
+    'pow2_operation',
+    'account_create_operation',
+    'account_create_with_delegation_operation',
+    'create_claimed_account_operation',
+    'comment_operation',
+    'delete_comment_operation',
+    'transfer_operation',
+    'custom_json_operation',
+])
+
+# custom_json ids handled by `CustomOp.process_ops`
+CUSTOM_JSON_IDS = frozenset(['follow', 'community', 'notify'])
+
+def _wanted(operation):
+    """Check if an op has any effect on initial sync."""
+    op_type = operation['type']
+    if op_type not in INITIAL_SYNC_OPS:
+        return False
+    if op_type == 'transfer_operation':
+        return operation['value']['to'] == 'null'
+    if op_type == 'custom_json_operation':
+        return operation['value']['id'] in CUSTOM_JSON_IDS
+    return True
+
+def prefilter(block):
+    """Reduce a block to the fields needed for initial sync.
+
+    Transactions are kept (emptied if irrelevant) so that tx indexes and
+    `transaction_ids` still line up; the original op count is preserved
+    in `op_count` for `hive_blocks.ops`.
+    """
+    op_count = 0
+    txs = []
+    for tx in block['transactions']:
+        op_count += len(tx['operations'])
+        txs.append({'operations': [op for op in tx['operations'] if _wanted(op)]})
+    return {'block_id': block['block_id'],
+            'previous': block['previous'],
+            'timestamp': block['timestamp'],
+            'transaction_ids': block['transaction_ids'],
+            'transactions': txs,
+            'op_count': op_count}
+
+def decode_lines(lines):
+    """Decode and prefilter a list of raw block lines (pool task)."""
+    return [prefilter(json.loads(line)) for line in lines]
+
+class BlockDecoder:
+    """Process pool which decodes chunks of lines, preserving order.
+
+    At most `workers * 2` chunks are in flight at a time, so memory use
+    stays bounded regardless of input size.
+    """
+
+    def __init__(self, workers):
+        assert workers > 0, "decoder needs at least one worker"
+        self._workers = workers
+        self._pool = None
+
+    def __enter__(self):
+        ctx = multiprocessing.get_context('spawn')
+        self._pool = ctx.Pool(self._workers)
+        log.info("[SYNC] decoding blocks with %d workers", self._workers)
+        return self
+
+    def __exit__(self, exc_type, value, traceback):
+        if exc_type:
+            self._pool.terminate()
+        else:
+            self._pool.close()
+        self._pool.join()
+        self._pool = None
+
+    def decode(self, chunks):
+        """Yield decoded block lists, one per input chunk, in order."""
+        assert self._pool, "use BlockDecoder as a context manager"
+        pending = deque()
+        for chunk in chunks:
+            pending.append(self._pool.apply_async(decode_lines, (list(chunk),)))
+            if len(pending) >= self._workers * 2:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
@@ -3,6 +3,7 @@
 import logging
 
 from hive.db.adapter import Db
+from hive.utils.normalize import load_json_key
 
 from hive.indexer.accounts import Accounts
 from hive.indexer.posts import Posts
@@ -10,6 +11,10 @@ from hive.indexer.cached_post import CachedPost
 from hive.indexer.custom_op import CustomOp
 from hive.indexer.payments import Payments
 from hive.indexer.follow import Follow
+from hive.indexer.bulk_writer import BulkWriter
+from hive.indexer.notify import Notify
+from hive.indexer.undo import UndoLog
+from hive.indexer.votes import Votes
 
 log = logging.getLogger(__name__)
 
@@ -32,30 +37,105 @@ class Blocks:
 
     @classmethod
     def process(cls, block):
-        """Process a single block. Has wrap in a transaction out of this func!"""
+        """Process a single block. Has wrap in a transaction out of this func!
+
+        Writes made until the transaction commits are journaled, so that
+        the block can be popped on a fork (see `UndoLog`).
+        """
         #assert is_trx_active(), "Block.process must be in a trx"
-        return cls._process(block, is_initial_sync=False)
+        return cls.process_group([block])
+
+    @classmethod
+    def process_group(cls, blocks):
+        """Process consecutive blocks in one (externally wrapped) transaction.
+
+        The group is journaled as a unit under its last block number, so
+        popping it on a fork pops every block of the group.
+        """
+        UndoLog.begin(int(blocks[-1]['block_id'][:8], base=16))
+        for block in blocks:
+            num = cls._process(block, is_initial_sync=False)
+        return num
 
     @classmethod
     def process_multi(cls, blocks, is_initial_sync=False):
-        """Batch-process blocks; wrapped in a transaction."""
+        """Batch-process blocks; wrapped in a transaction.
+
+        During initial sync, rows for append-only tables are buffered
+        and bulk-loaded once per batch (see `BulkWriter`).
+        """
+        blocks = list(blocks)
         DB.query("START TRANSACTION")
+        if is_initial_sync:
+            BulkWriter.start()
 
         last_num = 0
         try:
+            Posts.warm_ids(cls._post_refs(blocks, is_initial_sync))
             for block in blocks:
                 last_num = cls._process(block, is_initial_sync)
         except Exception as e:
             log.error("exception encountered block %d", last_num + 1)
+            BulkWriter.abort()
             raise e
+        finally:
+            Posts.forget_missing()
+
+        if is_initial_sync:
+            BulkWriter.finish()
 
         # Follows flushing needs to be atomic because recounts are
         # expensive. So is tracking follows at all; hence we track
         # deltas in memory and update follow/er counts in bulk.
         Follow.flush(trx=False)
+        Notify.flush()
 
         DB.query("COMMIT")
 
+    @classmethod
+    def _post_refs(cls, blocks, is_initial_sync):
+        """Collect `(author, permlink)` of posts referenced by `blocks`.
+
+        Covers the ops whose handlers look up post ids: comments (and
+        their parents), deletes, votes, reblogs and promotions.
+        """
+        refs = set()
+        for block in blocks:
+            for tx in block['transactions']:
+                for operation in tx['operations']:
+                    op_type = operation['type']
+                    op = operation['value']
+                    if op_type == 'comment_operation':
+                        refs.add((op['author'], op['permlink']))
+                        if op['parent_author']:
+                            refs.add((op['parent_author'], op['parent_permlink']))
+                    elif op_type == 'delete_comment_operation':
+                        refs.add((op['author'], op['permlink']))
+                    elif op_type == 'vote_operation':
+                        if not is_initial_sync:
+                            refs.add((op['author'], op['permlink']))
+                    elif op_type == 'transfer_operation':
+                        memo = op['memo']
+                        if (op['to'] == 'null' and memo and memo[0] == '@'
+                                and memo.count('/') == 1):
+                            refs.add(tuple(memo[1:].split('/')))
+                    elif op_type == 'custom_json_operation':
+                        if op['id'] == 'follow' and 'reblog' in op['json']:
+                            refs.update(cls._reblog_ref(op))
+        return refs
+
+    @staticmethod
+    def _reblog_ref(op):
+        """Get the post referenced by a reblog op, if well-formed."""
+        op_json = load_json_key(op, 'json')
+        if (isinstance(op_json, list) and len(op_json) == 2
+                and op_json[0] == 'reblog' and isinstance(op_json[1], dict)):
+            author = op_json[1].get('author')
+            permlink = op_json[1].get('permlink')
+            if isinstance(author, str) and isinstance(permlink, str):
+                return [(author, permlink)]
+        return []
+
     @classmethod
     def _process(cls, block, is_initial_sync=False):
         """Process a single block. Assumes a trx is open."""
@@ -67,7 +147,7 @@ class Blocks:
         json_ops = []
         trxids = set()
         for tx_idx, tx in enumerate(block['transactions']):
-            trxids.add("('%s', %s)" % (block['transaction_ids'][tx_idx], num))
+            trxids.add((block['transaction_ids'][tx_idx], num))
             for operation in tx['operations']:
                 op_type = operation['type']
                 op = operation['value']
@@ -129,7 +209,7 @@ class Blocks:
         to_pop = []
         cursor = hive_head
         while True:
-            assert hive_head - cursor < 25, "fork too deep"
+            assert hive_head - cursor < 25 or UndoLog.has(cursor), "fork too deep"
             hive_block = cls._get(cursor)
             steem_hash = steem.get_block(cursor)['block_id']
             match = hive_block['hash'] == steem_hash
@@ -165,21 +245,28 @@ class Blocks:
         """Insert a row in `hive_blocks`."""
         num = int(block['block_id'][:8], base=16)
         txs = block['transactions']
-        DB.query("INSERT INTO hive_blocks (num, hash, prev, txs, ops, created_at) "
-                 "VALUES (:num, :hash, :prev, :txs, :ops, :date)", **{
-                     'num': num,
-                     'hash': block['block_id'],
-                     'prev': block['previous'],
-                     'txs': len(txs),
-                     'ops': sum([len(tx['operations']) for tx in txs]),
-                     'date': block['timestamp']})
+        values = {'num': num,
+                  'hash': block['block_id'],
+                  'prev': block['previous'],
+                  'txs': len(txs),
+                  'ops': block.get('op_count',
+                                   sum([len(tx['operations']) for tx in txs])),
+                  'created_at': block['timestamp']}
+        if BulkWriter.is_active():
+            BulkWriter.add('hive_blocks', values, key=num)
+        else:
+            DB.query("INSERT INTO hive_blocks (num, hash, prev, txs, ops, created_at) "
+                     "VALUES (:num, :hash, :prev, :txs, :ops, :created_at)", **values)
         return num
 
     @classmethod
     def _pop(cls, blocks):
         """Pop head blocks to navigate head to a point prior to fork.
 
-        Without an undo database, there is a limit to how fully we can recover.
+        Blocks processed in live mode are reverted exactly from their undo
+        journal. Others (e.g. synced before the journal existed) fall back
+        to deleting recent records, and without an undo database there is
+        a limit to how fully we can recover.
 
         If consistency is critical, run hive with TRAIL_BLOCKS=-1 to only index
         up to last irreversible. Otherwise use TRAIL_BLOCKS=2 to stay closer
@@ -202,12 +289,23 @@ class Blocks:
         for block in blocks:
             num = block['num']
             date = block['date']
+            head = cls.head_num()
+            if num > head:
+                continue # already popped along with its group
             log.warning("[FORK] popping block %d @ %s", num, date)
-            assert num == cls.head_num(), "can only pop head block"
+            assert num == head, "can only pop head block"
+
+            if UndoLog.has(num):
+                post_ids = UndoLog.touched_posts(num)
+                count = UndoLog.revert(num)
+                cls._refetch_posts(post_ids)
+                log.warning("[FORK] reverted %d writes of block %d (new head %d)",
+                            count, num, cls.head_num())
+                continue
 
             # get all affected post_ids in this block
             sql = "SELECT id FROM hive_posts WHERE created_at >= :date"
-            post_ids = tuple(DB.query_col(sql, date=date))
+            post_ids = DB.query_col(sql, date=date)
 
             # remove all recent records -- communities
             DB.query("DELETE FROM hive_notifs        WHERE created_at >= :date", date=date)
@@ -222,27 +320,49 @@ class Blocks:
 
             # remove posts: core, tags, cache entries
             if post_ids:
-                DB.query("DELETE FROM hive_posts_cache WHERE post_id IN :ids", ids=post_ids)
-                DB.query("DELETE FROM hive_posts_cache_temp WHERE post_id IN :ids", ids=post_ids)
-                DB.query("DELETE FROM hive_post_tags   WHERE post_id IN :ids", ids=post_ids)
-                DB.query("DELETE FROM hive_posts       WHERE id      IN :ids", ids=post_ids)
+                DB.query("DELETE FROM hive_posts_cache WHERE post_id = ANY(:ids)", ids=post_ids)
+                # cache created_at >= the post's, so the temp delete can prune
+                DB.query("DELETE FROM hive_posts_cache_temp WHERE post_id = ANY(:ids)"
+                         " AND created_at >= :date", ids=post_ids, date=date)
+                DB.query("DELETE FROM hive_post_data   WHERE post_id = ANY(:ids)", ids=post_ids)
+                DB.query("DELETE FROM hive_post_tags   WHERE post_id = ANY(:ids)", ids=post_ids)
+                DB.query("DELETE FROM hive_votes       WHERE post_id = ANY(:ids)", ids=post_ids)
+                Votes.evict(post_ids)
+                DB.query("DELETE FROM hive_posts       WHERE id      = ANY(:ids)", ids=post_ids)
 
             DB.query("DELETE FROM hive_payments    WHERE block_num = :num", num=num)
             DB.query("DELETE FROM hive_blocks      WHERE num = :num", num=num)
             DB.query("DELETE FROM hive_trxid_block_num WHERE block_num = :num", num=num)
 
         DB.query("COMMIT")
+        # notif rows of popped blocks are gone; drop their dedup keys
+        Notify.reset()
         log.warning("[FORK] recovery complete")
         # TODO: manually re-process here the blocks which were just popped.
 
+    @classmethod
+    def _refetch_posts(cls, post_ids):
+        """Queue a full fetch of reverted posts (derived columns are not
+        journaled; see `UndoLog`)."""
+        if not post_ids:
+            return
+        sql = """SELECT id, author, permlink FROM hive_posts
+                  WHERE id = ANY(:ids) AND is_deleted = '0'"""
+        for pid, author, permlink in DB.query_all(sql, ids=post_ids):
+            CachedPost.update(author, permlink, pid)
+
     @classmethod
     def _save_trxids(cls, trxids):
         is_collector_open = cls._conf.get('txid_collector')
         if is_collector_open == False:
             return
-        data = ','.join(trxids)
-        if data == '':
+        if not trxids:
+            return
+        if BulkWriter.is_active():
+            for trx_id, num in trxids:
+                BulkWriter.add('hive_trxid_block_num',
+                               {'trx_id': trx_id, 'block_num': num}, key=trx_id)
             return
-        insert_sql = "INSERT INTO hive_trxid_block_num (trx_id, block_num) VALUES "
-        insert_sql = insert_sql + ','.join(trxids)
-        DB.query(insert_sql)
+        sql = """INSERT INTO hive_trxid_block_num (trx_id, block_num)
+                 SELECT * FROM unnest(CAST(:ids AS varchar[]), CAST(:nums AS integer[]))"""
+        DB.query(sql, ids=[tup[0] for tup in trxids], nums=[tup[1] for tup in trxids])
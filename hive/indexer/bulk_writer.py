@@ -0,0 +1,163 @@
+"""Buffered bulk writes for append-only tables during initial sync."""
+
+import logging
+from collections import OrderedDict
+from time import perf_counter as perf
+
+from toolz import partition_all
+from hive.db.adapter import Db
+
+log = logging.getLogger(__name__)
+
+DB = Db.instance()
+
+# Buffered tables, in flush order (foreign keys: posts before payments
+# and reblogs). `serial` names the column whose sequence must be bumped
+# past explicitly-assigned ids; `conflict` forces a multi-row INSERT
+# (COPY cannot skip duplicates) with the given clause.
+TABLES = OrderedDict([
+    ('hive_blocks', dict(
+        cols=('num', 'hash', 'prev', 'txs', 'ops', 'created_at'))),
+    ('hive_trxid_block_num', dict(
+        cols=('trx_id', 'block_num'))),
+    ('hive_posts', dict(
+        cols=('id', 'is_valid', 'is_muted', 'is_deleted', 'is_pinned',
+              'parent_id', 'author', 'permlink', 'category',
+              'community_id', 'depth', 'promoted', 'created_at'),
+        serial='id')),
+    ('hive_payments', dict(
+        cols=('block_num', 'tx_idx', 'post_id', 'from_account',
+              'to_account', 'amount', 'token'))),
+    ('hive_reblogs', dict(
+        cols=('account', 'post_id', 'created_at'),
+        conflict='ON CONFLICT (account, post_id) DO NOTHING')),
+    ('hive_follows', dict(
+        cols=('follower', 'following', 'state', 'created_at'))),
+])
+
+class BulkWriter:
+    """Collects rows for append-only tables and writes them in bulk.
+
+    During initial sync each of these tables used to receive one INSERT
+    per row. While active (inside `Blocks.process_multi`), producers
+    `add` rows here instead and the whole chunk is written with one
+    `COPY` per table on `finish`. Rows stay addressable by key until
+    flushed, so that indexers can read or amend their own pending
+    writes (e.g. a post deleted in the same chunk it was created in).
+    """
+
+    _active = False
+    _rows = {table: OrderedDict() for table in TABLES}
+    _seq = 0
+
+    # last id handed out per `serial` table
+    _ids = {}
+
+    @classmethod
+    def is_active(cls):
+        """Check if writes are currently being buffered."""
+        return cls._active
+
+    @classmethod
+    def start(cls):
+        """Begin buffering; discards anything left from a failed chunk."""
+        cls._rows = {table: OrderedDict() for table in TABLES}
+        cls._ids = {}
+        cls._active = True
+
+    @classmethod
+    def finish(cls):
+        """Flush all buffered rows and stop buffering."""
+        count = cls.flush()
+        cls._active = False
+        return count
+
+    @classmethod
+    def abort(cls):
+        """Discard buffered rows and stop buffering."""
+        cls._rows = {table: OrderedDict() for table in TABLES}
+        cls._active = False
+
+    @classmethod
+    def add(cls, table, row, key=None):
+        """Buffer a row (dict) for `table`. Returns False if key exists."""
+        assert cls._active, "bulk writer not active"
+        rows = cls._rows[table]
+        if key is None:
+            cls._seq += 1
+            key = cls._seq
+        elif key in rows:
+            return False
+        rows[key] = row
+        return True
+
+    @classmethod
+    def next_id(cls, table):
+        """Allocate the next serial id for a pending row of `table`.
+
+        The first id per chunk is drawn from the table's sequence; the
+        rest are assigned locally and the sequence is moved past them
+        when the chunk is flushed.
+        """
+        assert cls._active, "bulk writer not active"
+        if table not in cls._ids:
+            sql = "SELECT nextval(pg_get_serial_sequence(:table, :col))"
+            cls._ids[table] = DB.query_one(sql, table=table,
+                                           col=TABLES[table]['serial'])
+        else:
+            cls._ids[table] += 1
+        return cls._ids[table]
+
+    @classmethod
+    def get(cls, table, key):
+        """Get a pending (mutable) row by key, or None."""
+        if not cls._active:
+            return None
+        return cls._rows[table].get(key)
+
+    @classmethod
+    def remove(cls, table, key):
+        """Drop a pending row. Returns True if it was buffered."""
+        if not cls._active:
+            return False
+        return cls._rows[table].pop(key, None) is not None
+
+    @classmethod
+    def flush(cls):
+        """Write all buffered rows, in table dependency order."""
+        total = 0
+        start = perf()
+        for table, spec in TABLES.items():
+            rows = cls._rows[table]
+            if not rows:
+                continue
+            tuples = [tuple(row[col] for col in spec['cols'])
+                      for row in rows.values()]
+            if 'conflict' in spec:
+                cls._insert_multi(table, spec['cols'], tuples, spec['conflict'])
+            else:
+                DB.copy_rows(table, spec['cols'], tuples)
+            if 'serial' in spec:
+                sql = "SELECT setval(pg_get_serial_sequence(:table, :col), :id)"
+                DB.query_one(sql, table=table, col=spec['serial'],
+                             id=cls._ids[table])
+            total += len(tuples)
+            cls._rows[table] = OrderedDict()
+
+        if total:
+            log.debug("[BULK] flushed %d rows in %.3fs", total, perf() - start)
+        return total
+
+    @classmethod
+    def _insert_multi(cls, table, cols, tuples, suffix, batch=1000):
+        """Multi-row INSERT for tables which need a conflict clause."""
+        for part in partition_all(batch, tuples):
+            values = []
+            params = {}
+            for idx, tup in enumerate(part):
+                keys = ['%s_%d' % (col, idx) for col in cols]
+                params.update(zip(keys, tup))
+                values.append('(%s)' % ', '.join(':' + k for k in keys))
+            sql = "INSERT INTO %s (%s) VALUES %s %s" % (
+                table, ', '.join(cols), ', '.join(values), suffix)
+            DB.query(sql, **params)
@@ -5,6 +5,8 @@ import threading
 from datetime import datetime, timedelta
 
 from hive.db.adapter import Db
+from hive.db.schema import (TEMP_CACHE_DAYS, create_temp_cache_partitions,
+                            drop_temp_cache_partitions)
 
 log = logging.getLogger(__name__)
 
@@ -12,14 +14,18 @@ log = logging.getLogger(__name__)
 class CacheSync:
     """Sync hive_posts_cache to temp table (non-blocking).
 
-    Runs every 60s (20 blocks). DELETE steps only (remove rows outside 90-day window).
+    Runs every 60s (20 blocks). The temp table is partitioned by week of
+    created_at: each run creates upcoming partitions and drops those which
+    fell out of the 90-day window, instead of DELETEing expired rows.
+    Runs on a background connection (`Db.background`), never on the shared
+    connection of the block transaction.
     Orphan rows (post_id not in hive_posts_cache) are removed at delete time in
     cached_post.delete() and blocks fork recovery; no NOT IN sweep here.
     Cold-start backfill is done once in db_state migration (version 24).
     """
 
     SYNC_WINDOW = 60
-    HOT_DAYS = 90
+    HOT_DAYS = TEMP_CACHE_DAYS
 
     _syncing = False
     _lock = threading.Lock()
@@ -40,6 +46,11 @@ class CacheSync:
         thread = threading.Thread(target=cls._do_sync, daemon=True)
         thread.start()
 
+    @classmethod
+    def run(cls, db):
+        """Run one sync on `db`, blocking (e.g. from a `JobScheduler`)."""
+        return cls._sync(db)
+
     @classmethod
     def _do_sync(cls):
         """Run actual sync logic (background thread)."""
@@ -50,31 +61,33 @@ class CacheSync:
                 cls._syncing = False
 
     @classmethod
-    def _sync(cls):
-        """Core sync logic (one run). DELETE steps only (out-of-window rows)."""
-        try:
-            db = Db.instance()
-        except AssertionError:
-            # Db shared instance may not be initialized yet (or in unit tests).
-            log.debug("CacheSync: Db shared instance not initialized, skip")
-            return {'inserted': 0, 'updated': 0, 'deleted': 0}
+    def _sync(cls, db=None):
+        """Core sync logic (one run): partition maintenance only."""
+        if db is None:
+            try:
+                shared = Db.instance()
+            except AssertionError:
+                # Db shared instance may not be initialized yet (or in unit tests).
+                log.debug("CacheSync: Db shared instance not initialized, skip")
+                return {'created': 0, 'dropped': 0}
+            with shared.background() as conn:
+                return cls._sync(conn)
 
         now = datetime.now()
         cutoff = now - timedelta(days=cls.HOT_DAYS)
 
-        stats = {'inserted': 0, 'updated': 0, 'deleted': 0}
+        stats = {'created': 0, 'dropped': 0}
 
         try:
-            # Orphan rows in temp are now removed at delete time (cached_post.delete + blocks fork).
-            # Only prune rows outside the 90-day hot window.
-            sql = """
-                DELETE FROM hive_posts_cache_temp
-                WHERE created_at < :cutoff
-            """
-            result = db.query(sql, cutoff=cutoff)
-            stats['deleted'] += result.rowcount if hasattr(result, 'rowcount') else 0
-
-            log.info("CacheSync: deleted=%d", stats['deleted'])
+            # attach/detach lock the table; rather retry next run than queue readers
+            db.query("SET LOCAL lock_timeout = '5s'")
+            # Orphan rows in temp are removed at delete time (cached_post.delete + blocks fork).
+            # Rows outside the 90-day hot window go with their partition.
+            stats['created'] = len(create_temp_cache_partitions(db, cutoff, now))
+            stats['dropped'] = len(drop_temp_cache_partitions(db, cutoff))
+
+            log.info("CacheSync: partitions created=%d dropped=%d",
+                     stats['created'], stats['dropped'])
         except Exception as e:
             log.error("CacheSync failed: %s", str(e))
 
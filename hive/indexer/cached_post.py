@@ -3,15 +3,20 @@
 import math
 import collections
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter as perf, time
 import ujson as json
 
 from toolz import partition_all
 from hive.db.adapter import Db
 
+from hive.utils.payouts import PayoutSchedule
 from hive.utils.post import post_basic, post_legacy, post_payout, post_stats, mentions
 from hive.utils.timer import Timer
 from hive.indexer.accounts import Accounts
 from hive.indexer.notify import Notify
+from hive.indexer.follow import Follow
+from hive.indexer.votes import Votes
 from hive.server.common.mutes import Mutes
 
 # pylint: disable=too-many-lines
@@ -23,8 +28,8 @@ DB = Db.instance()
 # levels of post dirtiness, in order of decreasing priority
 LEVELS = ['insert', 'payout', 'update', 'upvote', 'recount']
 
-def _keyify(items):
-    return dict(map(lambda x: ("val_%d" % x[0], x[1]), enumerate(items)))
+# levels which may be deferred by the coalescing window
+COALESCED = ('upvote', 'recount')
 
 class CachedPost:
     """Maintain update queue and writing to `hive_posts_cache`."""
@@ -41,12 +46,28 @@ class CachedPost:
     # dirty posts; {key: dirty_level}
     _queue = collections.OrderedDict()
 
+    # when each dirty post was queued; {key: (flush_round, time)}
+    _since = {}
+
+    # number of flushes so far (one per block when following head)
+    _round = 0
+
+    # min. age of `COALESCED` entries before refresh; 0 = immediate
+    _window = {'blocks': 0, 'secs': 0}
+
     # new promoted values, pending write
     _pending_promoted = {}
 
+    # unpaid posts by payout time; loaded on first payout sweep
+    _payouts = None
+
     # pending vote notifs {pid: [voters]}
     _votes = {}
 
+    # queued posts with a recount merged into a higher level; an upvote
+    # among them is flushed as a recount (full fetch, for `children`)
+    _recounts = set()
+
     @classmethod
     def update_promoted_amount(cls, post_id, amount):
         """Set a new pending amount for a post for its next update."""
@@ -58,10 +79,13 @@ class CachedPost:
         assert level in LEVELS, "invalid level {}".format(level)
         mode = LEVELS.index(level)
         url = author + '/' + permlink
+        if level == 'recount':
+            cls._recounts.add(url)
 
         # add to appropriate queue.
         if url not in cls._queue:
             cls._queue[url] = mode
+            cls._since[url] = (cls._round, time())
         # upgrade priority if needed
         elif cls._queue[url] > mode:
             cls._queue[url] = mode
@@ -116,21 +140,32 @@ class CachedPost:
          - author/permlink is unique and always references the same post
          - you can always get_content on any author/permlink you see in an op
         """
-        DB.query("DELETE FROM hive_posts_cache WHERE post_id = :id", id=post_id)
-        DB.query("DELETE FROM hive_posts_cache_temp WHERE post_id = :id", id=post_id)
+        sql = "DELETE FROM hive_posts_cache WHERE post_id = :id RETURNING created_at"
+        created_at = DB.query_one(sql, id=post_id)
+        if created_at:
+            sql = """DELETE FROM hive_posts_cache_temp
+                      WHERE post_id = :id AND created_at = :created_at"""
+            DB.query(sql, id=post_id, created_at=created_at)
+        DB.query("DELETE FROM hive_post_data   WHERE post_id = :id", id=post_id)
         DB.query("DELETE FROM hive_post_tags   WHERE post_id = :id", id=post_id)
+        for sql in Votes.forget(post_id):
+            DB.query(sql)
+        if cls._payouts is not None:
+            cls._payouts.remove(post_id)
 
         # if it was queued for a write, remove it
         url = author+'/'+permlink
         log.warning("deleting %s", url) #173
         if url in cls._queue:
             del cls._queue[url]
+            del cls._since[url]
+            cls._recounts.discard(url)
             log.warning("deleted %s", url) #173
             if url in cls._ids:
                 del cls._ids[url]
 
     @classmethod
-    def undelete(cls, post_id, author, permlink, category):
+    def undelete(cls, post_id, author, permlink, category, date):
         """Handle a post 'undeleted' by a `comment` op.
 
         'Undeletion' occurs when hive detects that a previously deleted
@@ -159,18 +194,51 @@ class CachedPost:
         # force-create dummy row to ensure cache is aware. only needed when
         # cache already spans this id, in case in-mem buffer is lost. default
         # value for payout_at ensures that it will get picked up for update.
+        # created_at is the op's date, which the update will match on.
         for (sql, params) in cls._insert({
                 'post_id': post_id,
                 'author': author,
                 'permlink': permlink,
-                'category': category}):
+                'category': category,
+                'created_at': date}):
             DB.query(sql, **params)
         cls.update(author, permlink, post_id)
         log.warning("undeleted %s/%s", author, permlink) #173
 
+    @classmethod
+    def set_coalesce(cls, blocks=0, secs=0):
+        """Defer upvote/recount refreshes until `blocks` flushes or `secs`
+        seconds have passed since a post was first dirtied.
+
+        Repeated votes on a post within the window then cost a single
+        refresh. Higher levels (insert, payout, update) stay immediate and
+        also carry any pending lower-level refresh along.
+        """
+        cls._window = {'blocks': blocks or 0, 'secs': secs or 0}
+
+    @classmethod
+    def _due(cls, url, level, now):
+        """Check if a queued entry has left its coalescing window."""
+        blocks, secs = cls._window['blocks'], cls._window['secs']
+        if level not in COALESCED or not (blocks or secs):
+            return True
+        since_round, since_time = cls._since[url]
+        return ((blocks and cls._round - since_round >= blocks)
+                or (secs and now - since_time >= secs))
+
+    @classmethod
+    def queue_stats(cls):
+        """Get `{level: (depth, age of oldest entry in secs)}` of the queue."""
+        now = time()
+        stats = {level: (0, 0.0) for level in LEVELS}
+        for url, mode in cls._queue.items():
+            depth, age = stats[LEVELS[mode]]
+            stats[LEVELS[mode]] = (depth + 1, max(age, now - cls._since[url][1]))
+        return stats
+
     @classmethod
     def flush(cls, steem, trx=False, spread=1, full_total=None):
-        """Process all posts which have been marked as dirty."""
+        """Process all posts which have been marked as dirty (and are due)."""
         cls._load_noids() # load missing ids
         assert spread == 1, "not fully tested, use with caution"
 
@@ -187,8 +255,13 @@ class CachedPost:
             summary = ', '.join(summary) if summary else 'none'
             log.info("[PREP] posts cache process (main+temp): %s", summary)
 
+        tuples = [(url, pid, 'recount' if level == 'upvote' and url in cls._recounts
+                   else level) for url, pid, level in tuples]
         for url, _, _ in tuples:
             del cls._queue[url]
+            del cls._since[url]
+            cls._recounts.discard(url)
+        cls._round += 1
 
         cls._update_batch(steem, tuples, trx, full_total=full_total)
 
@@ -204,10 +277,13 @@ class CachedPost:
 
         Given a specific flush level (insert, payout, update, upvote),
         returns a list of tuples to be passed to _update_batch, in the
-        form of: `[(url, id, level)*]`
+        form of: `[(url, id, level)*]`. Entries still within their
+        coalescing window are skipped.
         """
         mode = LEVELS.index(level)
-        urls = [url for url, i in cls._queue.items() if i == mode]
+        now = time()
+        urls = [url for url, i in cls._queue.items()
+                if i == mode and cls._due(url, level, now)]
         if fraction > 1 and level != 'insert': # inserts must be full flush
             urls = urls[0:math.ceil(len(urls) / fraction)]
         return [(url, cls._get_id(url), level) for url in urls]
@@ -230,29 +306,41 @@ class CachedPost:
         cls._noids = set()
         return len(tuples)
 
+    @classmethod
+    def load_payouts(cls):
+        """Load the payout schedule of all unpaid posts from the db."""
+        sql = """SELECT post_id, payout_at, author || '/' || permlink
+                   FROM hive_posts_cache WHERE is_paidout = '0'"""
+        cls._payouts = PayoutSchedule()
+        cls._payouts.load(DB.query_all(sql))
+        log.info("[PREP] loaded payout schedule of %d posts", len(cls._payouts))
+
+    @classmethod
+    def _schedule_payout(cls, pid, post, basic):
+        """Track the payout time of a freshly written post."""
+        if cls._payouts is None:
+            return # not loaded yet; the initial load will see this write
+        if basic['is_paidout']:
+            cls._payouts.remove(pid)
+        else:
+            url = post['author'] + '/' + post['permlink']
+            cls._payouts.add(pid, basic['payout_at'], url)
+
     @classmethod
     def _select_paidout_tuples(cls, date):
-        """Query hive_posts_cache for payout sweep.
+        """Pop posts due for payout sweep from the payout schedule.
 
         Select all posts which should have been paid out before `date`
         yet do not have the `is_paidout` flag set. We perform this
         sweep to ensure that we always have accurate final payout
         state. Since payout values vary even between votes, we'd have
         stale data if we didn't sweep, and only waited for incoming
-        votes before an update.
+        votes before an update. A post still unpaid after its refresh
+        is rescheduled by `_sql`, so it is swept again.
         """
-        from hive.indexer.posts import Posts
-
-        sql = """SELECT post_id FROM hive_posts_cache
-                  WHERE is_paidout = '0' AND payout_at <= :date"""
-        ids = DB.query_col(sql, date=date)
-        if not ids:
-            return []
-
-        sql = """SELECT id, author, permlink
-                 FROM hive_posts WHERE id IN :ids"""
-        results = DB.query_all(sql, ids=tuple(ids))
-        return Posts.save_ids_from_tuples(results)
+        if cls._payouts is None:
+            cls.load_payouts()
+        return [(pid, *url.split('/', 1)) for pid, url in cls._payouts.pop_due(date)]
 
     @classmethod
     def dirty_paidouts(cls, date):
@@ -331,23 +419,95 @@ class CachedPost:
         seen the delete op yet). So even when the post is not found
         (i.e. `not post['author']`), it's important to advance _last_id,
         because this cursor is used to deduce any missing cache entries.
+
+        When there is more than one batch, the next batch is fetched from
+        steemd in a background thread while the current one is written.
+        Batches are still processed strictly in order of ascending id.
         """
         # pylint: disable=too-many-locals
 
+        last_id = cls.last_id()
+        votes = [tup for tup in tuples if tup[2] == 'upvote' and tup[1] <= last_id]
+        if votes:
+            tuples = [tup for tup in tuples if tup[2] != 'upvote' or tup[1] > last_id]
+            tuples.extend(cls._update_votes(steem, votes, trx))
+        if not tuples:
+            return
+
         timer = Timer(total=len(tuples), entity='post',
                       laps=['rps', 'wps'], full_total=full_total)
         tuples = sorted(tuples, key=lambda x: x[1]) # enforce ASC id's
+        batches = list(partition_all(1000, tuples))
+
+        def _fetch(tups):
+            start = perf()
+            posts = steem.get_content_batch([tup[0].split('/') for tup in tups])
+            return posts, perf() - start
+
+        pool = ThreadPoolExecutor(max_workers=1) if len(batches) > 1 else None
+        try:
+            cls._write_batches(batches, _fetch, pool, timer, trx, len(tuples))
+        finally:
+            if pool:
+                pool.shutdown(wait=True)
 
-        for tups in partition_all(1000, tuples):
+    @classmethod
+    def _update_votes(cls, steem, tuples, trx):
+        """Refresh vote-derived columns of posts from `get_active_votes`.
+
+        Much lighter than a full `get_content`: the remaining columns
+        are derived from the votes and the post's last full fetch (see
+        `Votes`). Returns tuples which need a full fetch instead.
+        """
+        fallback = []
+        for tups in partition_all(1000, sorted(tuples, key=lambda x: x[1])):
+            Votes.load([tup[1] for tup in tups])
+            results = steem.get_active_votes_batch([tup[0].split('/') for tup in tups])
+            # one list per statement kind; posts are independent, so these
+            # can run kind by kind, letting each batch as one executemany
+            mains, temps, ledger = [], [], []
+            for tup, active_votes in zip(tups, results):
+                url, pid, _ = tup
+                refresh = Votes.refresh(pid, active_votes)
+                if refresh is None:
+                    fallback.append(tup)
+                    continue
+                values, vote_sqls, payout, created_at = refresh
+                rshares = dict(values)['rshares']
+                author_id = Accounts.get_id(url.split('/')[0])
+                cls._vote_notifs(pid, url, author_id, active_votes,
+                                 float(rshares), payout)
+                main, temp = cls._update(values, created_at)
+                mains.append(main)
+                temps.append(temp)
+                ledger.extend(vote_sqls)
+            cls._commit(mains + temps + ledger, trx)
+        if tuples:
+            log.info("[VOTES] %d posts refreshed from votes, %d need full fetch",
+                     len(tuples) - len(fallback), len(fallback))
+        return fallback
+
+    @classmethod
+    def _write_batches(cls, batches, fetch, pool, timer, trx, total):
+        """Process fetched batches; prefetch the next one if `pool`."""
+        # pylint: disable=too-many-locals,too-many-arguments
+        pending = pool.submit(fetch, batches[0]) if pool else None
+        for idx, tups in enumerate(batches):
             timer.batch_start()
             buffer = []
 
-            post_args = [tup[0].split('/') for tup in tups]
-            posts = steem.get_content_batch(post_args)
+            if pool:
+                posts, fetch_secs = pending.result()
+                if idx + 1 < len(batches):
+                    pending = pool.submit(fetch, batches[idx + 1])
+            else:
+                posts, fetch_secs = fetch(tups)
             post_ids = [tup[1] for tup in tups]
             post_levels = [tup[2] for tup in tups]
 
             coremap = cls._get_core_fields(tups)
+            Votes.load([pid for pid, level in zip(post_ids, post_levels)
+                        if level != 'insert'])
             for pid, post, level in zip(post_ids, posts, post_levels):
                 if post['author']:
                     assert pid in coremap, 'pid not in coremap'
@@ -384,14 +544,24 @@ class CachedPost:
 
                 cls._bump_last_id(pid)
 
-            timer.batch_lap()
-            DB.batch_queries(buffer, trx)
+            timer.batch_lap(secs=fetch_secs)
+            cls._commit(buffer, trx)
 
             timer.batch_finish(len(posts))
             log.info("[DUAL-WRITE] batch: %d posts written to main+temp", len(posts))
-            if len(tuples) >= 1000:
+            if total >= 1000:
                 log.info(timer.batch_status())
 
+    @classmethod
+    def _commit(cls, buffer, trx):
+        """Write `buffer` and queued notifications, in one trx if `trx`."""
+        if trx:
+            DB.query("START TRANSACTION")
+        DB.batch_queries(buffer, trx=False)
+        Notify.flush()
+        if trx:
+            DB.query("COMMIT")
+
     @classmethod
     def last_id(cls):
         """Retrieve the latest post_id that was cached."""
@@ -419,12 +589,12 @@ class CachedPost:
 
         # build a map of id->fields for each of those posts
         sql = """SELECT id, category, community_id, is_muted, is_valid
-                   FROM hive_posts WHERE id IN :ids"""
+                   FROM hive_posts WHERE id = ANY(:ids)"""
         core = {r[0]: {'category': r[1],
                        'community_id': r[2],
                        'is_muted': r[3],
                        'is_valid': r[4]}
-                for r in DB.query_all(sql, ids=tuple(ids))}
+                for r in DB.query_all(sql, ids=ids)}
         return core
 
     @classmethod
@@ -478,6 +648,7 @@ class CachedPost:
 
         # start building the queries
         values = [('post_id', pid)]
+        data_sqls = []
 
         # immutable; write only once (*edge case: undeleted posts)
         if level == 'insert':
@@ -490,6 +661,7 @@ class CachedPost:
         # always write, unless simple vote update
         if level in ['insert', 'payout', 'update']:
             basic = post_basic(post)
+            cls._schedule_payout(pid, post, basic)
             values.extend([
                 ('community_id',  post['community_id']), # immutable*
                 ('created_at',    post['created']),    # immutable*
@@ -497,15 +669,13 @@ class CachedPost:
                 ('title',         post['title']),
                 ('payout_at',     basic['payout_at']), # immutable*
                 ('preview',       basic['preview']),
-                ('body',          basic['body']),
                 ('img_url',       basic['image']),
                 ('is_nsfw',       basic['is_nsfw']),
                 ('is_declined',   basic['is_payout_declined']),
                 ('is_full_power', basic['is_full_power']),
                 ('is_paidout',    basic['is_paidout']),
-                ('json',          json.dumps(basic['json_metadata'])),
-                ('raw_json',      json.dumps(post_legacy(post))),
             ])
+            data_sqls.append(cls._data_sql(pid, basic, post))
 
         # if there's a pending promoted value to write, pull it out
         if pid in cls._pending_promoted:
@@ -550,6 +720,12 @@ class CachedPost:
         if level == 'recount' and post['depth']:
             cls.recount(post['parent_author'], post['parent_permlink'])
 
+        # keep vote ledger and payout baseline in sync
+        if level == 'payout':
+            vote_sqls = Votes.forget(pid)
+        else:
+            vote_sqls = Votes.record(pid, post, payout['payout'], payout['rshares'])
+
         # trigger any notifications
         cls._notifs(post, pid, level, payout['payout'])
 
@@ -557,8 +733,8 @@ class CachedPost:
         if level == 'insert':
             queries = cls._insert(values)
         else:
-            queries = cls._update(values)
-        return list(queries) + tag_sqls
+            queries = cls._update(values, post['created'])
+        return list(queries) + data_sqls + tag_sqls + vote_sqls
 
     @classmethod
     def _notifs(cls, post, pid, level, payout):
@@ -590,7 +766,7 @@ class CachedPost:
                 penalty = min([score, 2 * (len(accounts) - 1)])
                 for mention in accounts:
                     mention_id = Accounts.get_id(mention)
-                    if (not cls._mentioned(pid, mention_id)
+                    if (not cls._mentioned(pid, author_id, mention_id)
                             and not cls._muted(mention_id, author_id)):
                         Notify('mention', src_id=author_id,
                                dst_id=mention_id, post_id=pid, when=date,
@@ -601,54 +777,43 @@ class CachedPost:
 
         # votes notif
         url = post['author'] + '/' + post['permlink']
-        if url in cls._votes:
-            voters = cls._votes[url]
-            del cls._votes[url]
-            net = float(post['net_rshares'])
-            ratio = float(payout) / net if net else 0
-            for vote in post['active_votes']:
-                rshares = int(vote['rshares'])
-                if vote['voter'] not in voters or rshares < 10e9: continue
-                contrib = int(1000 * ratio * rshares)
-                if contrib < 20: continue # < $0.020
-
-                voter_id = Accounts.get_id(vote['voter'])
-                if not cls._voted(pid, author_id, voter_id):
-                    score = min(100, (len(str(contrib)) - 1) * 25) # $1 = 75
-                    payload = "$%.3f" % (contrib / 1000)
-                    Notify('vote', src_id=voter_id, dst_id=author_id,
-                           when=vote['time'], post_id=pid, score=score,
-                           payload=payload).write()
+        cls._vote_notifs(pid, url, author_id, post['active_votes'],
+                         float(post['net_rshares']), payout)
 
+    @classmethod
+    def _vote_notifs(cls, pid, url, author_id, votes, net, payout):
+        """Notify authors of votes seen since the post was last fetched."""
+        # pylint: disable=too-many-arguments
+        if url not in cls._votes:
+            return
+        voters = cls._votes.pop(url)
+        ratio = float(payout) / net if net else 0
+        for vote in votes:
+            rshares = int(vote['rshares'])
+            if vote['voter'] not in voters or rshares < 10e9: continue
+            contrib = int(1000 * ratio * rshares)
+            if contrib < 20: continue # < $0.020
+
+            voter_id = Accounts.get_id(vote['voter'])
+            if not cls._voted(pid, author_id, voter_id):
+                score = min(100, (len(str(contrib)) - 1) * 25) # $1 = 75
+                payload = "$%.3f" % (contrib / 1000)
+                Notify('vote', src_id=voter_id, dst_id=author_id,
+                       when=vote['time'], post_id=pid, score=score,
+                       payload=payload).write()
 
     @classmethod
     def _muted(cls, account, target):
-        # TODO: optimize (mem cache?)
-        sql = """SELECT 1 FROM hive_follows
-                  WHERE follower = :account
-                    AND following = :target
-                    AND state IN (2,3)"""
-        return DB.query_col(sql, account=account, target=target)
+        return Follow.is_muted(account, target)
 
     @classmethod
     def _voted(cls, post_id, account_id, voter_id):
-        sql = """SELECT 1
-                   FROM hive_notifs
-                  WHERE dst_id = :dst_id
-                    AND src_id = :src_id
-                    AND post_id = :post_id
-                    AND type_id = 17"""
-        return bool(DB.query_one(sql, dst_id=account_id,
-                                 post_id=post_id, src_id=voter_id))
+        return Notify.exists('vote', voter_id, account_id, post_id)
 
     @classmethod
-    def _mentioned(cls, post_id, account_id):
-        sql = """SELECT 1
-                   FROM hive_notifs
-                  WHERE dst_id = :dst_id
-                    AND post_id = :post_id
-                    AND type_id = 16"""
-        return bool(DB.query_one(sql, dst_id=account_id, post_id=post_id))
+    def _mentioned(cls, post_id, author_id, account_id):
+        # mentions of a post always originate from its author
+        return Notify.exists('mention', author_id, account_id, post_id)
 
     @classmethod
     def _tag_sqls(cls, pid, tags, diff=True):
@@ -661,27 +826,47 @@ class CachedPost:
 
         to_rem = (curr_tags - next_tags)
         if to_rem:
-            sql = "DELETE FROM hive_post_tags WHERE post_id = :id AND tag IN :tags"
-            yield (sql, dict(id=pid, tags=tuple(to_rem)))
+            sql = "DELETE FROM hive_post_tags WHERE post_id = :id AND tag = ANY(:tags)"
+            yield (sql, dict(id=pid, tags=list(to_rem)))
 
         to_add = (next_tags - curr_tags)
         if to_add:
-            params = _keyify(to_add)
-            vals = ["(:id, :%s)" % key for key in params.keys()]
-            sql = "INSERT INTO hive_post_tags (post_id, tag) VALUES %s"
-            sql += " ON CONFLICT DO NOTHING" # (conflicts due to collation)
-            yield (sql % ','.join(vals), {'id': pid, **params})
+            sql = """INSERT INTO hive_post_tags (post_id, tag)
+                     SELECT :id, unnest(CAST(:tags AS varchar[]))
+                     ON CONFLICT DO NOTHING""" # (conflicts due to collation)
+            yield (sql, dict(id=pid, tags=list(to_add)))
 
     @classmethod
     def _insert(cls, values):
         """Build INSERT for both hive_posts_cache and hive_posts_cache_temp (dual-write)."""
         main = DB.build_insert('hive_posts_cache', values, pk='post_id')
-        temp = DB.build_insert('hive_posts_cache_temp', values, pk='post_id')
+        sql, params = DB.build_insert('hive_posts_cache_temp', values, pk='post_id')
+        temp = (sql + " ON CONFLICT (post_id, created_at) DO NOTHING", params)
         return [main, temp]
 
     @classmethod
-    def _update(cls, values):
-        """Build UPDATE for both hive_posts_cache and hive_posts_cache_temp (dual-write)."""
+    def _data_sql(cls, pid, basic, post):
+        """Build upsert of a post's large text columns into hive_post_data."""
+        sql = """INSERT INTO hive_post_data (post_id, body, json, raw_json)
+                      VALUES (:post_id, :body, :json, :raw_json)
+                 ON CONFLICT (post_id) DO UPDATE
+                         SET body = EXCLUDED.body, json = EXCLUDED.json,
+                             raw_json = EXCLUDED.raw_json"""
+        return (sql, {'post_id': pid,
+                      'body': basic['body'],
+                      'json': json.dumps(basic['json_metadata']),
+                      'raw_json': json.dumps(post_legacy(post))})
+
+    @classmethod
+    def _update(cls, values, created_at):
+        """Build UPDATE for both hive_posts_cache and hive_posts_cache_temp (dual-write).
+
+        The temp table is keyed by (post_id, created_at); matching on both
+        lets postgres prune the write to a single partition.
+        """
         main = DB.build_update('hive_posts_cache', values, pk='post_id')
-        temp = DB.build_update('hive_posts_cache_temp', values, pk='post_id')
+        values = collections.OrderedDict(values)
+        values['created_at'] = created_at
+        temp = DB.build_update('hive_posts_cache_temp', values,
+                               pk=['post_id', 'created_at'])
         return [main, temp]
@@ -224,39 +224,46 @@ class Community:
         return role >= Role.guest # or at least not muted
 
     @classmethod
-    def recalc_pending_payouts(cls):
-        """Update all pending payout and rank fields."""
-        sql = """SELECT id,
-                        COALESCE(posts, 0),
-                        COALESCE(payouts, 0),
-                        COALESCE(authors, 0)
-                   FROM hive_communities c
-              LEFT JOIN (
-                             SELECT community_id,
-                                    COUNT(*) posts,
-                                    ROUND(SUM(payout)) payouts,
-                                    COUNT(DISTINCT author) authors
-                               FROM hive_posts_cache
-                              WHERE community_id IS NOT NULL
-                                AND is_paidout = '0'
-                           GROUP BY community_id
-                        ) p
-                     ON community_id = id
-               ORDER BY COALESCE(payouts, 0) DESC,
-                        COALESCE(authors, 0) DESC,
-                        COALESCE(posts, 0) DESC,
-                        subscribers DESC,
-                        (CASE WHEN c.title = '' THEN 1 ELSE 0 END)
-        """
+    def recalc_pending_payouts(cls, db=None):
+        """Update all pending payout and rank fields.
 
-        for rank, row in enumerate(DB.query_all(sql)):
-            cid, posts, payouts, authors = row
-            sql = """UPDATE hive_communities
-                        SET sum_pending = :payouts, num_pending = :posts,
-                            num_authors = :authors, rank = :rank
-                      WHERE id = :id"""
-            DB.query(sql, id=cid, payouts=payouts, posts=posts,
-                     authors=authors, rank=rank+1)
+        One set-based statement which skips unchanged rows, so that row
+        locks are held only briefly when run next to block processing.
+        """
+        db = db or DB
+        sql = """UPDATE hive_communities c
+                    SET sum_pending = r.payouts, num_pending = r.posts,
+                        num_authors = r.authors, rank = r.rank
+                   FROM (
+                         SELECT id,
+                                COALESCE(posts, 0) posts,
+                                COALESCE(payouts, 0) payouts,
+                                COALESCE(authors, 0) authors,
+                                ROW_NUMBER() OVER (
+                                    ORDER BY COALESCE(payouts, 0) DESC,
+                                             COALESCE(authors, 0) DESC,
+                                             COALESCE(posts, 0) DESC,
+                                             subscribers DESC,
+                                             (CASE WHEN c.title = '' THEN 1 ELSE 0 END)
+                                ) rank
+                           FROM hive_communities c
+                      LEFT JOIN (
+                                     SELECT community_id,
+                                            COUNT(*) posts,
+                                            ROUND(SUM(payout)) payouts,
+                                            COUNT(DISTINCT author) authors
+                                       FROM hive_posts_cache
+                                      WHERE community_id IS NOT NULL
+                                        AND is_paidout = '0'
+                                   GROUP BY community_id
+                                ) p
+                             ON community_id = id
+                        ) r
+                  WHERE c.id = r.id
+                    AND (c.sum_pending, c.num_pending, c.num_authors, c.rank)
+                        IS DISTINCT FROM (r.payouts, r.posts, r.authors, r.rank)
+        """
+        db.query(sql)
 
 class CommunityOp:
     """Handles validating and processing of community custom_json ops."""
@@ -609,8 +616,10 @@ class CommunityOp:
         return bool(DB.query_one(sql, id=self.post_id))
 
     def _flagged(self):
-        """Check user's flag status."""
+        """Check user's flag status, including flags not yet flushed."""
         from hive.indexer.notify import NotifyType
+        if Notify.queued('flag_post', self.actor_id, self.post_id, self.community_id):
+            return True
         sql = """SELECT 1 FROM hive_notifs
                   WHERE community_id = :community_id
                     AND post_id = :post_id
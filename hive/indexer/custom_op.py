@@ -10,6 +10,7 @@ from hive.indexer.posts import Posts
 from hive.indexer.feed_cache import FeedCache
 from hive.indexer.follow import Follow
 from hive.indexer.notify import Notify
+from hive.indexer.bulk_writer import BulkWriter
 
 from hive.indexer.community import process_json_community_op, START_BLOCK
 from hive.utils.normalize import load_json_key
@@ -55,6 +56,9 @@ class CustomOp:
                 cls._process_legacy(account, op_json, block_date)
             elif op['id'] == 'community':
                 if block_num > START_BLOCK:
+                    # community ops read/update hive_posts directly
+                    if BulkWriter.is_active():
+                        BulkWriter.flush()
                     process_json_community_op(account, op_json, block_date)
             elif op['id'] == 'notify':
                 cls._process_notify(account, op_json, block_date)
@@ -132,15 +136,21 @@ class CustomOp:
         blogger_id = Accounts.get_id(blogger)
 
         if 'delete' in op_json and op_json['delete'] == 'delete':
+            BulkWriter.remove('hive_reblogs', (blogger, post_id))
             DB.query("DELETE FROM hive_reblogs WHERE account = :a AND "
                      "post_id = :pid", a=blogger, pid=post_id)
             if not DbState.is_initial_sync():
                 FeedCache.delete(post_id, blogger_id)
 
         else:
-            sql = ("INSERT INTO hive_reblogs (account, post_id, created_at) "
-                   "VALUES (:a, :pid, :date) ON CONFLICT (account, post_id) DO NOTHING")
-            DB.query(sql, a=blogger, pid=post_id, date=block_date)
+            if BulkWriter.is_active():
+                BulkWriter.add('hive_reblogs', {'account': blogger, 'post_id': post_id,
+                                                'created_at': block_date},
+                               key=(blogger, post_id))
+            else:
+                sql = ("INSERT INTO hive_reblogs (account, post_id, created_at) "
+                       "VALUES (:a, :pid, :date) ON CONFLICT (account, post_id) DO NOTHING")
+                DB.query(sql, a=blogger, pid=post_id, date=block_date)
             if not DbState.is_initial_sync():
                 FeedCache.insert(post_id, blogger_id, block_date)
                 Notify('reblog', src_id=blogger_id, dst_id=author_id,
@@ -8,6 +8,7 @@ from hive.db.adapter import Db
 from hive.db.db_state import DbState
 from hive.indexer.accounts import Accounts
 from hive.indexer.notify import Notify
+from hive.indexer.bulk_writer import BulkWriter
 
 log = logging.getLogger(__name__)
 
@@ -29,6 +30,42 @@ def _flip_dict(dict_to_flip):
 class Follow:
     """Handles processing of incoming follow ups and flushing to db."""
 
+    # follower id -> set of ignored (muted) account ids; None until loaded
+    _mutes = None
+
+    @classmethod
+    def load_mutes(cls):
+        """Load all mute (ignore) relations into memory."""
+        sql = "SELECT follower, following FROM hive_follows WHERE state IN (2,3)"
+        mutes = {}
+        for follower, following in DB.query_all(sql):
+            mutes.setdefault(follower, set()).add(following)
+        cls._mutes = mutes
+        log.info("[SYNC] loaded mutes of %d accounts", len(mutes))
+
+    @classmethod
+    def is_muted(cls, follower, following):
+        """Check if `follower` ignores `following` (by account id)."""
+        if cls._mutes is None:
+            sql = """SELECT 1 FROM hive_follows
+                      WHERE follower = :follower
+                        AND following = :following
+                        AND state IN (2,3)"""
+            return bool(DB.query_one(sql, follower=follower, following=following))
+        return following in cls._mutes.get(follower, ())
+
+    @classmethod
+    def _set_muted(cls, follower, following, muted):
+        """Keep the mute index in line with a follow state change."""
+        if cls._mutes is None:
+            return
+        if muted:
+            cls._mutes.setdefault(follower, set()).add(following)
+        elif follower in cls._mutes:
+            cls._mutes[follower].discard(following)
+            if not cls._mutes[follower]:
+                del cls._mutes[follower]
+
     @classmethod
     def follow_op(cls, account, op_json, date):
         """Process an incoming follow op."""
@@ -43,14 +80,26 @@ class Follow:
             return
 
         # insert or update state
-        if old_state is None:
-            sql = """INSERT INTO hive_follows (follower, following,
-                     created_at, state) VALUES (:flr, :flg, :at, :state)"""
-            old_state = 0
+        key = (op['flr'], op['flg'])
+        pending = BulkWriter.get('hive_follows', key)
+        if pending:
+            pending['state'] = new_state
+        elif old_state is None and BulkWriter.is_active():
+            BulkWriter.add('hive_follows', {'follower': op['flr'],
+                                            'following': op['flg'],
+                                            'state': new_state,
+                                            'created_at': op['at']}, key=key)
         else:
-            sql = """UPDATE hive_follows SET state = :state
-                      WHERE follower = :flr AND following = :flg"""
-        DB.query(sql, **op)
+            if old_state is None:
+                sql = """INSERT INTO hive_follows (follower, following,
+                         created_at, state) VALUES (:flr, :flg, :at, :state)"""
+            else:
+                sql = """UPDATE hive_follows SET state = :state
+                          WHERE follower = :flr AND following = :flg"""
+            DB.query(sql, **op)
+        old_state = old_state or 0
+        if (new_state ^ old_state) & 2:
+            cls._set_muted(op['flr'], op['flg'], new_state & 2)
 
         # track count deltas
         if not DbState.is_initial_sync():
@@ -100,6 +149,9 @@ class Follow:
     @classmethod
     def _get_follow_db_state(cls, follower, following):
         """Retrieve current follow state of an account pair."""
+        pending = BulkWriter.get('hive_follows', (follower, following))
+        if pending:
+            return pending['state']
         sql = """SELECT state FROM hive_follows
                   WHERE follower = :follower
                     AND following = :following"""
@@ -138,8 +190,8 @@ class Follow:
         for col, deltas in cls._delta.items():
             for delta, names in _flip_dict(deltas).items():
                 updated += len(names)
-                sql = "UPDATE hive_accounts SET %s = %s + :mag WHERE id IN :ids"
-                sqls.append((sql % (col, col), dict(mag=delta, ids=tuple(names))))
+                sql = "UPDATE hive_accounts SET %s = %s + :mag WHERE id = ANY(:ids)"
+                sqls.append((sql % (col, col), dict(mag=delta, ids=list(names))))
 
         if not updated:
             return 0
@@ -167,9 +219,9 @@ class Follow:
             UPDATE hive_accounts
                SET followers = (SELECT COUNT(*) FROM hive_follows WHERE state IN (1,3) AND following = hive_accounts.id),
                    following = (SELECT COUNT(*) FROM hive_follows WHERE state IN (1,3) AND follower = hive_accounts.id)
-             WHERE id IN :ids
+             WHERE id = ANY(:ids)
         """
-        DB.query(sql, ids=tuple(ids))
+        DB.query(sql, ids=list(ids))
 
     @classmethod
     def force_recount(cls):
@@ -1,5 +1,6 @@
 """Handle notifications"""
 
+from collections import OrderedDict
 from enum import IntEnum
 import logging
 from hive.db.adapter import Db
@@ -47,6 +48,25 @@ class Notify:
     # pylint: disable=too-many-instance-attributes,too-many-arguments
     DEFAULT_SCORE = 35
 
+    COLS = ('type_id', 'score', 'created_at', 'src_id', 'dst_id',
+            'post_id', 'community_id', 'payload')
+
+    # notifications queued by `write`, pending `flush`; keyed for dedup
+    _queue = OrderedDict()
+
+    # dedup index of mention/vote notifs: post_id -> {(type_id, src, dst)},
+    # in order of first tracked key. Complete for posts with id >= _floor,
+    # which trails the newest post seen by WINDOW ids; older posts are
+    # checked in the db. Bounded to MAX_KEYS keys: evicting a post raises
+    # _floor past it. Keys are added by `flush`, once their rows are written.
+    TRACKED = (NotifyType.mention, NotifyType.vote)
+    WINDOW = 1000000
+    MAX_KEYS = 2000000
+    _recent = OrderedDict()
+    _keys = 0
+    _floor = None
+    _top = 0
+
     def __init__(self, type_id, when=None, src_id=None, dst_id=None, community_id=None,
                  post_id=None, payload=None, score=None, **kwargs):
         """Create a notification."""
@@ -74,6 +94,88 @@ class Notify:
         """Instantiate from db row."""
         return Notify(**dict(row))
 
+    @classmethod
+    def load_recent(cls):
+        """Load mention/vote notif keys of the newest `WINDOW` posts."""
+        top = DB.query_one("SELECT MAX(id) FROM hive_posts") or 0
+        floor = max(top - cls.WINDOW, 0) + 1
+        sql = """SELECT post_id, type_id, src_id, dst_id FROM hive_notifs
+                  WHERE post_id >= :floor AND type_id IN :types
+               ORDER BY post_id DESC LIMIT :limit"""
+        rows = DB.query_all(sql, floor=floor, limit=cls.MAX_KEYS + 1,
+                            types=tuple(t.value for t in cls.TRACKED))
+        recent = OrderedDict()
+        for post_id, type_id, src_id, dst_id in reversed(rows):
+            recent.setdefault(post_id, set()).add((type_id, src_id, dst_id))
+        if len(rows) > cls.MAX_KEYS:
+            # keys of the oldest post may be cut off by the limit
+            post_id, _ = recent.popitem(last=False)
+            floor = post_id + 1
+        cls._recent, cls._floor, cls._top = recent, floor, top
+        cls._keys = sum(len(keys) for keys in recent.values())
+        log.info("[NOTIFY] loaded %d dedup keys for %d posts",
+                 cls._keys, len(recent))
+
+    @classmethod
+    def reset(cls):
+        """Drop queued notifs and the dedup index, e.g. after notif rows
+        were removed on a fork; `load_recent` rebuilds the index."""
+        cls._queue = OrderedDict()
+        cls._recent, cls._keys, cls._floor, cls._top = OrderedDict(), 0, None, 0
+
+    @classmethod
+    def exists(cls, type_id, src_id, dst_id, post_id):
+        """Check if a mention/vote notification was already issued."""
+        enum = NotifyType[type_id] if isinstance(type_id, str) else NotifyType(type_id)
+        if (enum.value, src_id, dst_id, post_id, None, None) in cls._queue:
+            return True # pending flush (see `_key`)
+        if cls._floor is None or post_id < cls._floor:
+            sql = """SELECT 1 FROM hive_notifs
+                      WHERE post_id = :post_id AND type_id = :type_id
+                        AND dst_id = :dst_id AND src_id = :src_id"""
+            return bool(DB.query_one(sql, post_id=post_id, type_id=enum.value,
+                                     dst_id=dst_id, src_id=src_id))
+        return (enum.value, src_id, dst_id) in cls._recent.get(post_id, ())
+
+    @classmethod
+    def queued(cls, type_id, src_id, post_id, community_id):
+        """Check if a matching notification awaits the next `flush`."""
+        enum = NotifyType[type_id] if isinstance(type_id, str) else NotifyType(type_id)
+        return any(notify.enum == enum and notify.src_id == src_id
+                   and notify.post_id == post_id
+                   and notify.community_id == community_id
+                   for notify in cls._queue.values())
+
+    @classmethod
+    def _track(cls, notify):
+        """Add a stored mention/vote to the dedup index."""
+        post_id = notify.post_id
+        if cls._floor is None or post_id < cls._floor:
+            return
+        keys = cls._recent.get(post_id)
+        if keys is None:
+            keys = cls._recent[post_id] = set()
+        key = (notify.enum.value, notify.src_id, notify.dst_id)
+        if key in keys:
+            return
+        keys.add(key)
+        cls._keys += 1
+
+        if post_id > cls._top:
+            cls._top = post_id
+            # slide the window; prune in steps to amortize the scan
+            if cls._top - cls.WINDOW >= cls._floor + cls.WINDOW // 10:
+                cls._floor = cls._top - cls.WINDOW + 1
+                cls._recent = OrderedDict(
+                    (pid, keys) for pid, keys in cls._recent.items()
+                    if pid >= cls._floor)
+                cls._keys = sum(len(keys) for keys in cls._recent.values())
+
+        while cls._keys > cls.MAX_KEYS:
+            pid, keys = cls._recent.popitem(last=False)
+            cls._keys -= len(keys)
+            cls._floor = max(cls._floor, pid + 1)
+
     @classmethod
     def set_lastread(cls, account, date):
         """Update `lastread` column for a named account."""
@@ -93,8 +195,18 @@ class Notify:
             payload=self.payload,
             id=self._id)
 
+    def _key(self):
+        """Identity of a notification within the queue.
+
+        Votes are keyed without payload, so that a re-vote within the
+        same batch replaces the earlier entry instead of adding one.
+        """
+        payload = None if self.enum == NotifyType.vote else self.payload
+        return (self.enum.value, self.src_id, self.dst_id, self.post_id,
+                self.community_id, payload)
+
     def write(self):
-        """Store this notification."""
+        """Queue this notification; it is stored on the next `flush`."""
         assert not self._id, 'notify has id %d' % self._id
         ignore = ('reply', 'reply_comment', 'reblog', 'follow', 'mention', 'vote')
         if self.enum.name not in ignore:
@@ -102,9 +214,25 @@ class Notify:
                         self.enum.name, self.src_id, self.dst_id, self.post_id,
                         ' (%s)' % self.payload if self.payload else '',
                         self.community_id, self.score)
-        sql = """INSERT INTO hive_notifs (type_id, score, created_at, src_id,
-                                          dst_id, post_id, community_id,
-                                          payload)
-                      VALUES (:type_id, :score, :created_at, :src_id, :dst_id,
-                              :post_id, :community_id, :payload)"""
-        DB.query(sql, **self.to_dict())
+        Notify._queue[self._key()] = self
+
+    @classmethod
+    def flush(cls):
+        """Store all queued notifications with a single COPY.
+
+        Called where block (or cache batch) writes are committed, so
+        it runs inside the same transaction when there is one.
+        """
+        if not cls._queue:
+            return 0
+        queue = cls._queue
+        rows = []
+        for notify in queue.values():
+            row = notify.to_dict()
+            rows.append(tuple(row[col] for col in cls.COLS))
+        cls._queue = OrderedDict()
+        count = DB.copy_rows('hive_notifs', cls.COLS, rows)
+        for notify in queue.values():
+            if notify.enum in cls.TRACKED and notify.post_id:
+                cls._track(notify)
+        return count
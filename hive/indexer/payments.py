@@ -9,6 +9,7 @@ from hive.utils.normalize import parse_amount
 from hive.indexer.posts import Posts
 from hive.indexer.accounts import Accounts
 from hive.indexer.cached_post import CachedPost
+from hive.indexer.bulk_writer import BulkWriter
 
 log = logging.getLogger(__name__)
 
@@ -26,17 +27,24 @@ class Payments:
             return
 
         # add payment record
-        sql = DB.build_insert('hive_payments', record, pk='id')
-        DB.query(sql)
-
-        # read current amount
-        sql = "SELECT promoted FROM hive_posts WHERE id = :id"
-        curr_amount = DB.query_one(sql, id=record['post_id'])
-        new_amount = curr_amount + record['amount']
-
-        # update post record
-        sql = "UPDATE hive_posts SET promoted = :val WHERE id = :id"
-        DB.query(sql, val=new_amount, id=record['post_id'])
+        if BulkWriter.is_active():
+            BulkWriter.add('hive_payments', record)
+        else:
+            sql = DB.build_insert('hive_payments', record, pk='id')
+            DB.query(sql)
+
+        # read current amount, update post record
+        pending = BulkWriter.get('hive_posts', record['post_id'])
+        if pending:
+            new_amount = pending['promoted'] + record['amount']
+            pending['promoted'] = new_amount
+        else:
+            sql = "SELECT promoted FROM hive_posts WHERE id = :id"
+            curr_amount = DB.query_one(sql, id=record['post_id'])
+            new_amount = curr_amount + record['amount']
+
+            sql = "UPDATE hive_posts SET promoted = :val WHERE id = :id"
+            DB.query(sql, val=new_amount, id=record['post_id'])
 
         # notify cached_post of new promoted balance, and trigger update
         if not DbState.is_initial_sync():
@@ -1,7 +1,8 @@
 """Core posts manager."""
 
 import logging
-import collections
+
+from toolz import partition_all
 
 from hive.db.adapter import Db
 from hive.db.db_state import DbState
@@ -11,7 +12,10 @@ from hive.indexer.cached_post import CachedPost
 from hive.indexer.feed_cache import FeedCache
 from hive.indexer.community import Community, START_DATE
 from hive.indexer.notify import Notify
+from hive.indexer.bulk_writer import BulkWriter
 from hive.utils.redis_cache import RedisCacheManager
+from hive.utils.idmap import CompactIdMap
+from hive.utils.stats import Stats
 
 log = logging.getLogger(__name__)
 DB = Db.instance()
@@ -19,11 +23,12 @@ DB = Db.instance()
 class Posts:
     """Handles critical/core post ops and data."""
 
-    # LRU cache for (author-permlink -> id) lookup (~400mb per 1M entries)
-    CACHE_SIZE = 2000000
-    _ids = collections.OrderedDict()
-    _hits = 0
-    _miss = 0
+    # CLOCK cache for (author-permlink -> id) lookup (~26mb per 1M entries)
+    CACHE_SIZE = 8000000
+    _ids = CompactIdMap(CACHE_SIZE)
+
+    # urls known not to exist, as of the last `warm_ids` (see there)
+    _missing = set()
 
     @classmethod
     def last_id(cls):
@@ -35,33 +40,59 @@ class Posts:
     def get_id(cls, author, permlink):
         """Look up id by author/permlink, making use of LRU cache."""
         url = author+'/'+permlink
-        if url in cls._ids:
-            cls._hits += 1
-            _id = cls._ids.pop(url)
-            cls._ids[url] = _id
-        else:
-            cls._miss += 1
+        _id = cls._ids.get(url)
+        if not _id and url not in cls._missing:
             sql = """SELECT id FROM hive_posts WHERE
                      author = :a AND permlink = :p"""
             _id = DB.query_one(sql, a=author, p=permlink)
             if _id:
                 cls._set_id(url, _id)
-
-        # cache stats (under 10M every 10K else every 100K)
-        total = cls._hits + cls._miss
-        if total % 100000 == 0:
-            log.info("pid lookups: %d, hits: %d (%.1f%%), entries: %d",
-                     total, cls._hits, 100.0*cls._hits/total, len(cls._ids))
-
         return _id
 
     @classmethod
     def _set_id(cls, url, pid):
-        """Add an entry to the LRU, maintaining max size."""
+        """Add an entry to the id cache (evicts when full)."""
         assert pid, "no pid provided for %s" % url
-        if len(cls._ids) > cls.CACHE_SIZE:
-            cls._ids.popitem(last=False)
-        cls._ids[url] = pid
+        cls._ids.put(url, pid)
+        cls._missing.discard(url)
+
+    @classmethod
+    def warm_ids(cls, refs):
+        """Resolve ids for many `(author, permlink)` pairs up front.
+
+        Looks up every uncached ref in a few set-based queries, so that
+        the per-op `get_id` calls which follow are served from memory.
+        Refs not found are remembered as missing (posts are only created
+        through `insert`, which clears the flag) until `forget_missing`.
+        """
+        cls._missing.clear()
+        todo = {}
+        for author, permlink in refs:
+            url = author+'/'+permlink
+            if url not in cls._ids:
+                todo[url] = (author, permlink)
+        if not todo:
+            return 0
+
+        sql = """SELECT hp.id, hp.author, hp.permlink
+                   FROM unnest(:authors, :permlinks) AS ref(author, permlink)
+                   JOIN hive_posts hp ON hp.author = ref.author
+                                     AND hp.permlink = ref.permlink"""
+        found = 0
+        for part in partition_all(1000, todo.values()):
+            rows = DB.query_all(sql, authors=[ref[0] for ref in part],
+                                permlinks=[ref[1] for ref in part])
+            for pid, author, permlink in rows:
+                cls._set_id(author+'/'+permlink, pid)
+                todo.pop(author+'/'+permlink, None)
+                found += 1
+        cls._missing.update(todo.keys())
+        return found
+
+    @classmethod
+    def forget_missing(cls):
+        """Drop the not-found set built by `warm_ids`."""
+        cls._missing.clear()
 
     @classmethod
     def save_ids_from_tuples(cls, tuples):
@@ -79,12 +110,18 @@ class Posts:
         _id = cls.get_id(author, permlink)
         if not _id:
             return (None, -1)
+        pending = BulkWriter.get('hive_posts', _id)
+        if pending:
+            return (_id, pending['depth'])
         depth = DB.query_one("SELECT depth FROM hive_posts WHERE id = :id", id=_id)
         return (_id, depth)
 
     @classmethod
     def is_pid_deleted(cls, pid):
         """Check if the state of post is deleted."""
+        pending = BulkWriter.get('hive_posts', pid)
+        if pending:
+            return pending['is_deleted']
         sql = "SELECT is_deleted FROM hive_posts WHERE id = :id"
         return DB.query_one(sql, id=pid)
 
@@ -113,14 +150,18 @@ class Posts:
     @classmethod
     def insert(cls, op, date):
         """Inserts new post records."""
-        sql = """INSERT INTO hive_posts (is_valid, is_muted, parent_id, author,
-                             permlink, category, community_id, depth, created_at)
-                      VALUES (:is_valid, :is_muted, :parent_id, :author,
-                             :permlink, :category, :community_id, :depth, :date)"""
-        sql += ";SELECT currval(pg_get_serial_sequence('hive_posts','id'))"
         post = cls._build_post(op, date)
-        result = DB.query(sql, **post)
-        post['id'] = int(list(result)[0][0])
+        if BulkWriter.is_active():
+            post['id'] = BulkWriter.next_id('hive_posts')
+            BulkWriter.add('hive_posts', cls._pending_row(post), key=post['id'])
+        else:
+            sql = """INSERT INTO hive_posts (is_valid, is_muted, parent_id, author,
+                                 permlink, category, community_id, depth, created_at)
+                          VALUES (:is_valid, :is_muted, :parent_id, :author,
+                                 :permlink, :category, :community_id, :depth, :date)"""
+            sql += ";SELECT currval(pg_get_serial_sequence('hive_posts','id'))"
+            result = DB.query(sql, **post)
+            post['id'] = int(list(result)[0][0])
         cls._set_id(op['author']+'/'+op['permlink'], post['id'])
 
         # Invalidate Redis cache for this post (in case of stale "not found" cache)
@@ -146,7 +187,14 @@ class Posts:
                    community_id = :community_id, depth = :depth
                  WHERE id = :id"""
         post = cls._build_post(op, date, pid)
-        DB.query(sql, **post)
+        pending = BulkWriter.get('hive_posts', pid)
+        if pending:
+            pending.update(is_valid=post['is_valid'], is_muted=post['is_muted'],
+                           is_deleted=False, is_pinned=False,
+                           parent_id=post['parent_id'], category=post['category'],
+                           community_id=post['community_id'], depth=post['depth'])
+        else:
+            DB.query(sql, **post)
 
         # Invalidate Redis cache for this post
         RedisCacheManager.sync_delete_all_post_caches(op['author'], op['permlink'])
@@ -158,14 +206,18 @@ class Posts:
                        post_id=post['id'], payload=post['error']).write()
 
             CachedPost.undelete(pid, post['author'], post['permlink'],
-                                post['category'])
+                                post['category'], date)
             cls._insert_feed_cache(post)
 
     @classmethod
     def delete(cls, op):
         """Marks a post record as being deleted."""
         pid, depth = cls.get_id_and_depth(op['author'], op['permlink'])
-        DB.query("UPDATE hive_posts SET is_deleted = '1' WHERE id = :id", id=pid)
+        pending = BulkWriter.get('hive_posts', pid)
+        if pending:
+            pending['is_deleted'] = True
+        else:
+            DB.query("UPDATE hive_posts SET is_deleted = '1' WHERE id = :id", id=pid)
 
         # Invalidate Redis cache for this post
         RedisCacheManager.sync_delete_all_post_caches(op['author'], op['permlink'])
@@ -209,6 +261,17 @@ class Posts:
             account_id = Accounts.get_id(post['author'])
             FeedCache.insert(post['id'], account_id, post['date'])
 
+    @classmethod
+    def _pending_row(cls, post):
+        """Map a built post to a buffered `hive_posts` row."""
+        return dict(id=post['id'], is_valid=post['is_valid'],
+                    is_muted=post['is_muted'], is_deleted=False,
+                    is_pinned=False, parent_id=post['parent_id'],
+                    author=post['author'], permlink=post['permlink'],
+                    category=post['category'],
+                    community_id=post['community_id'], depth=post['depth'],
+                    promoted=0, created_at=post['date'])
+
     @classmethod
     def _build_post(cls, op, date, pid=None):
         """Validate and normalize a post operation.
@@ -237,10 +300,17 @@ class Posts:
         # this is a comment; inherit parent props.
         else:
             parent_id = cls.get_id(op['parent_author'], op['parent_permlink'])
-            sql = """SELECT depth, category, community_id, is_valid, is_muted
-                       FROM hive_posts WHERE id = :id"""
-            (parent_depth, category, community_id, is_valid,
-             is_muted) = DB.query_row(sql, id=parent_id)
+            parent = BulkWriter.get('hive_posts', parent_id)
+            if parent:
+                (parent_depth, category, community_id, is_valid,
+                 is_muted) = (parent['depth'], parent['category'],
+                              parent['community_id'], parent['is_valid'],
+                              parent['is_muted'])
+            else:
+                sql = """SELECT depth, category, community_id, is_valid, is_muted
+                           FROM hive_posts WHERE id = :id"""
+                (parent_depth, category, community_id, is_valid,
+                 is_muted) = DB.query_row(sql, id=parent_id)
             depth = parent_depth + 1
             if not is_valid: error = 'replying to invalid post'
             elif is_muted: error = 'replying to muted post'
@@ -256,3 +326,5 @@ class Posts:
                     is_valid=is_valid, is_muted=is_muted, parent_id=parent_id,
                     depth=depth, category=category, community_id=community_id,
                     date=date, error=error)
+
+Stats.register_cache('post ids', Posts._ids) # pylint: disable=protected-access
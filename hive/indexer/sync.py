@@ -12,15 +12,22 @@ from toolz import partition_all
 from hive.db.db_state import DbState
 
 from hive.utils.timer import Timer
+from hive.utils.checkpoint import CheckpointReader
+from hive.utils.scheduler import JobScheduler
 from hive.steem.block.stream import MicroForkException
+from hive.steem.block.prefetch import BlockPrefetcher
+from hive.steem.block.archive import BlockArchive
 
 from hive.indexer.blocks import Blocks
+from hive.indexer.block_decoder import BlockDecoder
 from hive.indexer.accounts import Accounts
 from hive.indexer.cached_post import CachedPost
 from hive.indexer.feed_cache import FeedCache
 from hive.indexer.follow import Follow
 from hive.indexer.cache_sync import CacheSync
 from hive.indexer.community import Community
+from hive.indexer.notify import Notify
+from hive.indexer.undo import UndoLog
 from hive.server.common.mutes import Mutes
 from hive.utils.redis_cache import RedisCacheManager
 
@@ -40,6 +47,10 @@ class Sync:
         self._steem = conf.steem()
         Blocks._conf = conf
 
+        # optional local copy of irreversible blocks, for later replay
+        archive_path = conf.get('block_archive')
+        self._archive = BlockArchive(self._steem, archive_path) if archive_path else None
+
         # Initialize Redis cache for invalidation hooks
         redis_url = conf.get('redis_url')
         RedisCacheManager.init(redis_url)
@@ -50,10 +61,19 @@ class Sync:
         # ensure db schema up to date, check app status
         DbState.initialize()
 
+        if not DbState.is_initial_sync():
+            # recover from fork before any state is loaded into memory
+            Blocks.verify_head(self._steem)
+        UndoLog.freeze()
+
         # prefetch id->name and id->rank memory maps
-        Accounts.load_ids()
+        Accounts.load_ids(self._conf.get('accounts_snapshot'))
         Accounts.fetch_ranks()
 
+        # mute relations and recent notif keys, for notification checks
+        Follow.load_mutes()
+        Notify.load_recent()
+
         # load irredeemables
         mutes = Mutes(self._conf.get('muted_accounts_url'))
         Mutes.set_shared_instance(mutes)
@@ -67,9 +87,6 @@ class Sync:
             DbState.finish_initial_sync()
 
         else:
-            # recover from fork
-            Blocks.verify_head(self._steem)
-
             # perform cleanup if process did not exit cleanly
             CachedPost.recover_missing_posts(self._steem)
 
@@ -81,7 +98,7 @@ class Sync:
         #audit_cache_missing(self._db, self._steem)
         #audit_cache_deleted(self._db)
 
-        self._update_chain_state()
+        self._confirm_irreversible(self._update_chain_state())
 
         if self._conf.get('test_max_block'):
             # debug mode: partial sync
@@ -122,31 +139,68 @@ class Sync:
         """Initial sync strategy: read from blocks on disk.
 
         This methods scans for files matching ./checkpoints/*.json.lst
-        and uses them for hive's initial sync. Each line must contain
-        exactly one block in JSON format.
+        (v1, plain) or ./checkpoints/*.json.gz (v2, indexed; preferred
+        when both exist) and uses them for hive's initial sync. Each
+        line must contain exactly one block in JSON format. If
+        `--block-archive` is set, its segment files are used as well.
         """
-        # pylint: disable=no-self-use
         last_block = Blocks.head_num()
 
         tuplize = lambda path: [int(path.split('/')[-1].split('.')[0]), path]
         basedir = os.path.dirname(os.path.realpath(__file__ + "/../.."))
-        files = glob.glob(basedir + "/checkpoints/*.json.lst")
-        tuples = sorted(map(tuplize, files), key=lambda f: f[0])
+        dirs = [basedir + "/checkpoints"]
+        if self._conf.get('block_archive'):
+            dirs.append(self._conf.get('block_archive'))
+        files = {}
+        for path in dirs:
+            files.update(map(tuplize, glob.glob(path + "/*.json.lst")))
+        for path in dirs:
+            files.update(map(tuplize, glob.glob(path + "/*.json.gz")))
+        tuples = sorted(files.items(), key=lambda f: f[0])
 
         last_read = 0
         for (num, path) in tuples:
             if last_block < num:
                 log.info("[SYNC] Load %s. Last block: %d", path, last_block)
-                with open(path) as f:
-                    # each line in file represents one block
-                    # we can skip the blocks we already have
-                    skip_lines = last_block - last_read
-                    remaining = drop(skip_lines, f)
-                    for lines in partition_all(chunk_size, remaining):
-                        Blocks.process_multi(map(json.loads, lines), True)
+                if path.endswith('.json.gz'):
+                    # v2: seek straight to the frame holding the next block
+                    reader = CheckpointReader(path)
+                    if not reader.last_num() or reader.first_num() > last_block + 1:
+                        log.info("[SYNC] %s does not continue from block %d",
+                                 path, last_block)
+                        break
+                    remaining = reader.lines(last_block + 1)
+                    self._process_lines(remaining, chunk_size)
+                    # archive segments may be partially filled
+                    num = max(reader.last_num(), last_block)
+                else:
+                    with open(path) as f:
+                        # each line in file represents one block
+                        # we can skip the blocks we already have
+                        skip_lines = last_block - last_read
+                        remaining = drop(skip_lines, f)
+                        self._process_lines(remaining, chunk_size)
                 last_block = num
             last_read = num
 
+    def _process_lines(self, lines, chunk_size):
+        """Process raw block JSON lines in chunks.
+
+        With `--checkpoint-decode-workers`, lines are parsed and
+        prefiltered in a process pool; blocks are still applied here,
+        sequentially and in order.
+        """
+        chunks = partition_all(chunk_size, lines)
+        workers = self._conf.get('checkpoint_decode_workers')
+        if not workers:
+            for chunk in chunks:
+                Blocks.process_multi(map(json.loads, chunk), True)
+            return
+
+        with BlockDecoder(workers) as decoder:
+            for blocks in decoder.decode(chunks):
+                Blocks.process_multi(blocks, True)
+
     def from_steemd(self, is_initial_sync=False, chunk_size=1000):
         """Fast sync strategy: read/process blocks in batches."""
         steemd = self._steem
@@ -159,22 +213,49 @@ class Sync:
 
         log.info("[SYNC] start block %d, +%d to sync", lbound, count)
         timer = Timer(count, entity='block', laps=['rps', 'wps'])
-        while lbound < ubound:
-            timer.batch_start()
-
-            # fetch blocks
-            to = min(lbound + chunk_size, ubound)
-            blocks = steemd.get_blocks_range(lbound, to)
-            lbound = to
-            timer.batch_lap()
 
-            # process blocks
-            Blocks.process_multi(blocks, is_initial_sync)
-            timer.batch_finish(len(blocks))
-
-            _prefix = ("[SYNC] Got block %d @ %s" % (
-                to - 1, blocks[-1]['timestamp']))
-            log.info(timer.batch_status(_prefix))
+        depth = self._conf.get('sync_prefetch_depth')
+        prefetcher = None
+        if depth:
+            # fetch upcoming chunks in background while processing current
+            prefetcher = BlockPrefetcher(steemd, lbound, ubound, chunk_size,
+                                         depth=depth,
+                                         max_mb=self._conf.get('sync_prefetch_mb'))
+            chunks = prefetcher.start().chunks()
+        else:
+            chunks = (steemd.get_blocks_range(lb, min(lb + chunk_size, ubound))
+                      for lb in range(lbound, ubound, chunk_size))
+
+        try:
+            while lbound < ubound:
+                timer.batch_start()
+
+                # fetch blocks (or wait for prefetched chunk)
+                blocks = next(chunks)
+                lbound += len(blocks)
+                timer.batch_lap()
+
+                # process blocks
+                Blocks.process_multi(blocks, is_initial_sync)
+                timer.batch_finish(len(blocks))
+
+                if self._archive:
+                    # everything below `ubound` is irreversible
+                    for block in blocks:
+                        self._archive.add(block)
+                    self._archive.confirm(lbound - 1)
+
+                _prefix = ("[SYNC] Got block %d @ %s" % (
+                    lbound - 1, blocks[-1]['timestamp']))
+                status = timer.batch_status(_prefix)
+                if prefetcher:
+                    status += " -- " + prefetcher.status()
+                log.info(status)
+        finally:
+            if prefetcher:
+                prefetcher.stop()
+            if self._archive:
+                self._archive.flush()
 
         if not is_initial_sync:
             # This flush is low importance; accounts are swept regularly.
@@ -198,49 +279,99 @@ class Sync:
         steemd = self._steem
         hive_head = Blocks.head_num()
 
-        for block in steemd.stream_blocks(hive_head + 1, trail_blocks, max_gap):
+        CachedPost.set_coalesce(blocks=self._conf.get('post_coalesce_blocks'),
+                                secs=self._conf.get('post_coalesce_secs'))
+
+        # when behind head, commit several blocks (and flushes) at once
+        group_gap = self._conf.get('listen_group_gap')
+        group_size = self._conf.get('listen_group_size')
+
+        jobs = self._jobs()
+        jobs.start()
+        try:
+            self._listen(steemd, hive_head, trail_blocks, max_gap,
+                         group_gap, group_size, jobs)
+        finally:
+            jobs.stop()
+            if self._archive:
+                self._archive.flush()
+
+    def _listen(self, steemd, hive_head, trail_blocks, max_gap,
+                group_gap, group_size, jobs):
+        """Process blocks as they arrive; see `listen`."""
+        # pylint: disable=too-many-arguments,too-many-locals
+        for blocks in steemd.stream_block_groups(hive_head + 1, trail_blocks, max_gap,
+                                                 group_gap, group_size):
             start_time = perf()
+            block = blocks[-1]
 
             self._db.query("START TRANSACTION")
-            num = Blocks.process(block)
+            num = Blocks.process_group(blocks)
             follows = Follow.flush(trx=False)
             accts = Accounts.flush(steemd, trx=False, spread=8)
             CachedPost.dirty_paidouts(block['timestamp'])
             cnt = CachedPost.flush(steemd, trx=False)
+            Notify.flush()
             self._db.query("COMMIT")
 
+            # results of finished background jobs
+            jobs.collect()
+
+            if self._archive:
+                # written once irreversible (see `_confirm_irreversible`)
+                for archived in blocks:
+                    self._archive.add(archived)
+
+            first = num - len(blocks) + 1
             ms = (perf() - start_time) * 1000
-            log.info("[LIVE] Got block %d at %s --% 4d txs,% 3d posts,% 3d edits,"
+            log.info("[LIVE] Got block %s at %s --% 4d txs,% 3d posts,% 3d edits,"
                      "% 3d payouts,% 3d votes,% 3d counts,% 3d accts,% 3d follows"
-                     " --% 5dms%s", num, block['timestamp'], len(block['transactions']),
+                     " --% 5dms%s", num if first == num else '%d-%d' % (first, num),
+                     block['timestamp'], sum(len(b['transactions']) for b in blocks),
                      cnt['insert'], cnt['update'], cnt['payout'], cnt['upvote'],
                      cnt['recount'], accts, follows, ms, ' SLOW' if ms > 1000 else '')
 
-            if num % 1200 == 0: #1hr
+            # periodic tasks: run if any block of the group hits the interval
+            def _every(blocks, first=first, num=num):
+                return num // blocks > (first - 1) // blocks
+
+            if _every(1200): #1hr
                 log.warning("head block %d @ %s", num, block['timestamp'])
                 log.info("[LIVE] hourly stats")
-                #Community.recalc_pending_payouts()
-            if num % 7200 == 0: #6hr
-                # Rank is an approximate score used for notification buckets; a 6h
-                # stale window is acceptable. Run less often than the previous 1h
-                # cadence to avoid the full-table ORDER BY vote_weight DESC (~12s,
-                # million-scale) competing for RDS IOPS with API queries.
-                Accounts.fetch_ranks()
-            if num % 200 == 0: #10min
-                Community.recalc_pending_payouts()
-            if num % 100 == 0: #5min
+                if self._archive:
+                    self._archive.flush()
+                log.info("[LIVE] jobs: %s", jobs.report())
+            if _every(100): #5min
                 log.info("[LIVE] 5-min stats")
-                Accounts.dirty_oldest(500)
-            if num % 20 == 0: #1min
-                self._update_chain_state()
-            if num % 20 == 0: #60s - sync hive_posts_cache_temp (non-blocking)
-                CacheSync.sync()
+                log.info("[LIVE] post queue: %s", ', '.join(
+                    "%s %d (%ds)" % (level, depth, age)
+                    for level, (depth, age) in CachedPost.queue_stats().items()))
+
+    def _jobs(self):
+        """Housekeeping run in the background while following head.
+
+        Each job gets a time budget (in secs) which bounds its queries.
+        """
+        jobs = JobScheduler(self._db)
+        jobs.add('chain_state', self._update_chain_state, 60, budget=10,
+                 apply=self._confirm_irreversible)
+        # sync hive_posts_cache_temp
+        jobs.add('cache_sync', CacheSync.run, 60, budget=30)
+        jobs.add('oldest_accounts', lambda db: Accounts.oldest(500, db), 300,
+                 budget=10, apply=Accounts.dirty_set)
+        jobs.add('community_payouts', Community.recalc_pending_payouts, 600,
+                 budget=60)
+        return jobs
 
     # refetch dynamic_global_properties, feed price, etc
-    def _update_chain_state(self):
-        """Update basic state props (head block, feed price) in db."""
+    def _update_chain_state(self, db=None):
+        """Update basic state props (head block, feed price) in db.
+
+        Returns the dgpo, for `_confirm_irreversible`.
+        """
+        db = db or self._db
         state = self._steem.gdgp_extended()
-        self._db.query("""UPDATE hive_state SET block_num = :block_num,
+        db.query("""UPDATE hive_state SET block_num = :block_num,
                        steem_per_mvest = :spm, usd_per_steem = :ups,
                        sbd_per_steem = :sps, dgpo = :dgpo""",
                        block_num=state['dgpo']['head_block_number'],
@@ -248,4 +379,10 @@ class Sync:
                        ups=state['usd_per_steem'],
                        sps=state['sbd_per_steem'],
                        dgpo=json.dumps(state['dgpo']))
-        return state['dgpo']['head_block_number']
+        UndoLog.prune(state['dgpo']['last_irreversible_block_num'], db)
+        return state['dgpo']
+
+    def _confirm_irreversible(self, dgpo):
+        """Archive blocks which became irreversible."""
+        if self._archive:
+            self._archive.confirm(dgpo['last_irreversible_block_num'])
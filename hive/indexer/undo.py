@@ -0,0 +1,164 @@
+"""Per-block undo journal for fork recovery."""
+
+import logging
+from collections import OrderedDict
+import ujson as json
+
+from hive.db.adapter import Db
+from hive.db.schema import UNDO_TABLES, UNDO_APPENDED
+
+log = logging.getLogger(__name__)
+
+DB = Db.instance()
+
+class UndoLog:
+    """Journals and reverts the writes of reversible blocks.
+
+    While a block is processed in live mode, row triggers (see
+    `hive.db.schema.UNDO_FUNCTION`) record the inverse of each write to
+    `hive_undo`: the key of inserted rows, the old values of changed
+    columns, and full deleted rows. Popping a block collapses its entries
+    to each row's state before the block and restores them set-based,
+    which recovers counters and state that a date-based cleanup cannot.
+    Append-only tables are not journaled; their rows are deleted by
+    block (see `hive.db.schema.UNDO_APPENDED`). Entries are pruned once
+    their block is irreversible.
+
+    Vote-derived cache columns are not journaled (see
+    `hive.db.schema.UNDO_DERIVED`); posts touched by a reverted block
+    are refetched instead (see `touched_posts`).
+
+    Only the db is reverted. In-memory indexes (`Follow._mutes`, the
+    account `RankIndex`, `Votes._posts`, `Notify._recent` and the
+    `PayoutSchedule`) are not, so blocks may only be reverted before
+    these are loaded, i.e. on startup (see `freeze`).
+    """
+
+    # set once in-memory indexes are loaded; no reverts past this point
+    _frozen = False
+
+    @classmethod
+    def freeze(cls):
+        """Disallow reverts, as in-memory state is about to be loaded."""
+        cls._frozen = True
+
+    @classmethod
+    def begin(cls, num):
+        """Attribute writes of the open transaction to block `num`."""
+        DB.query_one("SELECT set_config('hive.undo_block', :num, true)", num=str(num))
+
+    @classmethod
+    def has(cls, num):
+        """Check if block `num` was journaled (i.e. can be reverted).
+
+        Blocks committed together are journaled under the last one, so
+        the entry may be found under a later block number.
+        """
+        sql = """SELECT 1 FROM hive_undo WHERE block_num >= :num
+                    AND table_name = 'hive_blocks' AND op = 'I'
+                    AND pk = jsonb_build_object('num', CAST(:num AS integer))
+                  LIMIT 1"""
+        return bool(DB.query_one(sql, num=num))
+
+    @classmethod
+    def touched_posts(cls, num):
+        """Get ids of posts whose rows were written by block `num`."""
+        sql = """SELECT DISTINCT CAST(pk ->> 'post_id' AS integer)
+                   FROM hive_undo WHERE block_num = :num AND pk ? 'post_id'"""
+        return DB.query_col(sql, num=num)
+
+    @classmethod
+    def revert(cls, num):
+        """Undo all writes of block `num`. Assumes a trx is open."""
+        assert not cls._frozen, "cannot revert once in-memory state is loaded"
+        sql = """SELECT table_name, op, pk, data FROM hive_undo
+                  WHERE block_num = :num ORDER BY id"""
+        rows = DB.query_all(sql, num=num)
+        # blocks committed together are journaled under the last one
+        first = min([pk['num'] for table, op, pk, _ in rows
+                     if table == 'hive_blocks' and op == 'I'] or [num])
+        cls._delete_appended(first)
+        for query in cls._revert_sqls(rows):
+            DB.query(query)
+        DB.query("DELETE FROM hive_undo WHERE block_num = :num", num=num)
+        return len(rows)
+
+    @classmethod
+    def _delete_appended(cls, num):
+        """Delete rows of append-only tables written from block `num` on."""
+        date = DB.query_one("SELECT created_at FROM hive_blocks WHERE num = :num",
+                            num=num)
+        for table, col in UNDO_APPENDED.items():
+            bound = num if col == 'block_num' else date
+            DB.query("DELETE FROM %s WHERE %s >= :bound" % (table, col),
+                     bound=bound)
+
+    @classmethod
+    def prune(cls, irreversible_num, db=None):
+        """Drop entries of blocks which can no longer be forked out."""
+        (db or DB).query("DELETE FROM hive_undo WHERE block_num <= :num",
+                         num=irreversible_num)
+
+    @staticmethod
+    def _revert_sqls(rows):
+        """Build statements restoring the rows written by journal `rows`.
+
+        `rows` are `(table, op, pk, data)`, oldest first. Each row's
+        entries collapse to whether it existed before and exists now,
+        and its oldest value of each changed column. Restores are then
+        grouped into one statement per table and action: deletes run
+        children first, inserts parents first.
+        """
+        state = OrderedDict()
+        for table, op, pk, data in rows:
+            key = (table, json.dumps(pk, sort_keys=True))
+            if key not in state:
+                state[key] = {'pk': pk, 'existed': op != 'I', 'data': {}}
+            row = state[key]
+            row['exists'] = op != 'D'
+            for col, value in (data or {}).items():
+                row['data'].setdefault(col, value)
+
+        deletes, updates, inserts = OrderedDict(), OrderedDict(), OrderedDict()
+        for (table, _), row in state.items():
+            pk, data = row['pk'], row['data']
+            if not row['existed']:
+                if row['exists']:
+                    deletes.setdefault(table, []).append(pk)
+            elif not row['exists']:
+                inserts.setdefault(table, []).append(data)
+            else:
+                cols = tuple(sorted(col for col in data if col not in pk))
+                if cols:
+                    key = (table, tuple(pk), cols)
+                    updates.setdefault(key, []).append(dict(data, **pk))
+
+        def _recs(table):
+            return "jsonb_populate_recordset(NULL::%s, CAST(:rows AS jsonb))" % table
+
+        def _match(pk, alias):
+            return ' AND '.join("t.%s = %s.%s" % (col, alias, col) for col in pk)
+
+        sqls = []
+        for table in sorted(deletes, key=_table_rank, reverse=True):
+            pks = deletes[table]
+            sql = "DELETE FROM %s t USING %s k WHERE %s" % (
+                table, _recs(table), _match(pks[0], 'k'))
+            sqls.append((sql, {'rows': json.dumps(pks)}))
+        for (table, pk, cols), recs in updates.items():
+            sets = ', '.join("%s = r.%s" % (col, col) for col in cols)
+            sql = "UPDATE %s t SET %s FROM %s r WHERE %s" % (
+                table, sets, _recs(table), _match(pk, 'r'))
+            sqls.append((sql, {'rows': json.dumps(recs)}))
+        for table in sorted(inserts, key=_table_rank):
+            sql = "INSERT INTO %s SELECT * FROM %s" % (table, _recs(table))
+            sqls.append((sql, {'rows': json.dumps(inserts[table])}))
+        return sqls
+
+def _table_rank(table):
+    """Position of `table` (or of the table it partitions) in `UNDO_TABLES`."""
+    names = [name for name in UNDO_TABLES
+             if table == name or table.startswith(name + '_')]
+    if not names:
+        return len(UNDO_TABLES)
+    return list(UNDO_TABLES).index(max(names, key=len))
@@ -0,0 +1,181 @@
+"""Vote ledger of posts pending payout."""
+
+import logging
+from collections import OrderedDict
+from time import time
+
+from hive.db.adapter import Db
+from hive.indexer.accounts import Accounts
+from hive.utils.normalize import parse_time, utc_timestamp, rep_log10
+from hive.utils.post import vote_csv, vote_scores, vote_stats
+
+log = logging.getLogger(__name__)
+
+DB = Db.instance()
+
+class Votes:
+    """Tracks active votes of unpaid posts in `hive_votes` and in memory.
+
+    Each full post fetch (insert, update, recount) records the post's
+    votes plus a payout baseline (payout and net rshares). A vote-only
+    refresh then needs just `get_active_votes`: rshares, the vote CSV,
+    trend/hot scores and vote counts are derived locally, and payout is
+    scaled from the baseline by the change in net rshares. The final
+    payout is always read in full by the payout-level refresh, which
+    also drops the post's ledger rows.
+
+    The scaled payout ignores the reward curve and the changing reward
+    pool and price, so it is only trusted for `BASELINE_SECS` after the
+    last full fetch; later refreshes fall back to a full fetch, which
+    takes a new baseline. Posts whose `is_hidden` depends on their
+    payout (negative author rep) always get a full fetch.
+    """
+
+    CACHE_SIZE = 20000
+    BASELINE_SECS = 3600
+
+    # post_id -> {'created', 'payout', 'rshares', 'paidout', 'votes',
+    # 'fetched', 'hideable'}; `votes` maps voter_id -> (rshares, percent).
+    # LRU-bounded.
+    _posts = OrderedDict()
+
+    @classmethod
+    def load(cls, pids):
+        """Fill in state of uncached posts from the db, in two queries."""
+        pids = [pid for pid in pids if pid not in cls._posts]
+        if not pids:
+            return
+
+        sql = """SELECT post_id, created_at, payout, rshares, is_paidout
+                   FROM hive_posts_cache WHERE post_id = ANY(:ids)"""
+        states = {}
+        for pid, created, payout, rshares, paidout in DB.query_all(sql, ids=pids):
+            states[pid] = {'created': utc_timestamp(created),
+                           'created_at': created,
+                           'payout': float(payout),
+                           'rshares': rshares,
+                           'paidout': paidout,
+                           'votes': {},
+                           'fetched': 0, # unknown; next refresh fetches
+                           'hideable': False}
+
+        sql = """SELECT post_id, voter_id, rshares, percent
+                   FROM hive_votes WHERE post_id = ANY(:ids)"""
+        for pid, voter_id, rshares, percent in DB.query_all(sql, ids=pids):
+            if pid in states:
+                states[pid]['votes'][voter_id] = (rshares, percent)
+
+        for pid, state in states.items():
+            cls._set(pid, state)
+
+    @classmethod
+    def record(cls, pid, post, payout, rshares):
+        """Take a new baseline from a fully fetched post. Returns SQL."""
+        paidout = post['cashout_time'][0:4] == '1969'
+        if paidout:
+            return cls.forget(pid)
+
+        known = cls._posts[pid]['votes'] if pid in cls._posts else {}
+        votes, sqls = cls._vote_sqls(pid, post['active_votes'], known)
+        created = parse_time(post['created'])
+        cls._set(pid, {'created': utc_timestamp(created),
+                       'created_at': created,
+                       'payout': float(payout),
+                       'rshares': rshares,
+                       'paidout': False,
+                       'votes': votes,
+                       'fetched': time(),
+                       'hideable': rep_log10(post['author_reputation']) < 0})
+        return sqls
+
+    @classmethod
+    def forget(cls, pid):
+        """Drop a paid out post from the ledger. Returns SQL."""
+        cls._posts.pop(pid, None)
+        return [("DELETE FROM hive_votes WHERE post_id = :id", {'id': pid})]
+
+    @classmethod
+    def evict(cls, pids):
+        """Drop in-memory state of `pids` (e.g. rows removed on a fork)."""
+        for pid in pids:
+            cls._posts.pop(pid, None)
+
+    @classmethod
+    def refresh(cls, pid, active_votes):
+        """Derive vote columns of a post from its current active votes.
+
+        Returns `(values, sqls, payout, created_at)` for the post cache
+        update, or None if there is no usable baseline and a full fetch
+        is needed.
+        """
+        state = cls._posts.get(pid)
+        if not state or state['paidout'] or state['hideable']:
+            return None
+        if time() - state['fetched'] > cls.BASELINE_SECS:
+            return None # payout estimate too stale; take a new baseline
+
+        rshares = sum(int(vote['rshares']) for vote in active_votes)
+        if rshares > 0 and state['rshares'] <= 0:
+            return None # cannot scale from a zero baseline
+        payout = state['payout'] * rshares / state['rshares'] if rshares > 0 else 0.0
+
+        sc_trend, sc_hot = vote_scores(rshares, state['created'])
+        stats = vote_stats(active_votes)
+        values = [('post_id', pid),
+                  ('payout', round(payout, 3)),
+                  ('rshares', rshares),
+                  ('votes', vote_csv(active_votes)),
+                  ('sc_trend', sc_trend),
+                  ('sc_hot', sc_hot),
+                  ('flag_weight', stats['flag_weight']),
+                  ('total_votes', stats['total_votes']),
+                  ('up_votes', stats['up_votes'])]
+
+        votes, sqls = cls._vote_sqls(pid, active_votes, state['votes'])
+        state['votes'] = votes
+        cls._posts.move_to_end(pid)
+        return values, sqls, payout, state['created_at']
+
+    @classmethod
+    def _set(cls, pid, state):
+        if pid in cls._posts:
+            del cls._posts[pid]
+        elif len(cls._posts) >= cls.CACHE_SIZE:
+            cls._posts.popitem(last=False)
+        cls._posts[pid] = state
+
+    @classmethod
+    def _vote_sqls(cls, pid, active_votes, known):
+        """Build an upsert of votes which differ from `known`.
+
+        Rows are bound as arrays, so the statement text is the same for
+        every post and set of changed votes.
+        """
+        votes = {}
+        cols = ([], [], [], [], [])
+        for vote in active_votes:
+            voter_id = Accounts.get_id(vote['voter'])
+            row = (int(vote['rshares']), int(vote['percent']))
+            votes[voter_id] = row
+            if known.get(voter_id) == row:
+                continue
+            for col, value in zip(cols, (voter_id, row[0], row[1],
+                                         int(vote['reputation']), vote['time'])):
+                col.append(value)
+
+        if not cols[0]:
+            return votes, []
+        sql = """INSERT INTO hive_votes (post_id, voter_id, rshares, percent,
+                                         reputation, created_at)
+                      SELECT :post_id, * FROM unnest(
+                             CAST(:voters AS integer[]), CAST(:rshares AS bigint[]),
+                             CAST(:percents AS smallint[]), CAST(:reps AS bigint[]),
+                             CAST(:times AS timestamp[]))
+                 ON CONFLICT (post_id, voter_id) DO UPDATE
+                         SET rshares = EXCLUDED.rshares,
+                             percent = EXCLUDED.percent,
+                             reputation = EXCLUDED.reputation,
+                             created_at = EXCLUDED.created_at"""
+        params = dict(zip(('voters', 'rshares', 'percents', 'reps', 'times'), cols))
+        params['post_id'] = pid
+        return votes, [(sql, params)]
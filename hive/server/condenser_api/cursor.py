@@ -540,17 +540,14 @@ async def pids_by_replies_to_account(db, start_author: str, start_permlink: str
     id_res = await db.query_all(sql, parent=parent_account, cache_key=cache_key)
     if id_res == None or len(id_res) == 0:
         return None
-    tmp_ids = []
-    for el in id_res:
-        tmp_ids.append(str(el[0]))
-    ids = ",".join(tmp_ids)
+    ids = [el[0] for el in id_res]
 
     sql = """
     SELECT id FROM hive_posts
-    WHERE parent_id IN (%s) %s
+    WHERE parent_id = ANY(:ids) %s
     AND is_deleted = '0'
     ORDER BY id DESC
     LIMIT :limit
-    """ % (ids, seek)
+    """ % seek
 
-    return await db.query_col(sql, limit=limit)
+    return await db.query_col(sql, ids=ids, start_id=start_id, limit=limit)
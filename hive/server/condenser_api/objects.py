@@ -99,12 +99,13 @@ async def load_posts(db, ids, truncate_body=0):
     return [posts_by_id[_id] for _id in ids]
 
 async def _fetch_posts_batch(db, ids):
-    """Fetch posts from hive_posts_cache for a batch of ids."""
+    """Fetch posts from hive_posts_cache (+ hive_post_data) for a batch of ids."""
     sql = """SELECT post_id, author, permlink, title, body, category, depth,
                     promoted, payout, payout_at, is_paidout, children, votes,
                     created_at, updated_at, rshares, raw_json, json
-               FROM hive_posts_cache WHERE post_id IN :ids"""
-    return await db.query_all(sql, ids=tuple(ids))
+               FROM hive_posts_cache JOIN hive_post_data USING (post_id)
+              WHERE post_id = ANY(:ids)"""
+    return await db.query_all(sql, ids=list(ids))
 
 async def _query_author_rep_map(db, posts):
     """Given a list of posts, returns an author->reputation map."""
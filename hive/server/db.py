@@ -8,6 +8,7 @@ from sqlalchemy.engine.url import make_url
 from aiopg.sa import create_engine
 from aiocache import Cache
 from hive.utils.safe_serializer import SafeUniversalSerializer
+from hive.utils.lru import LruCache
 
 from hive.utils.stats import Stats
 
@@ -78,6 +79,9 @@ def cacher(func):
 class Db:
     """Wrapper for aiopg.sa db driver."""
 
+    # max compiled statements kept
+    PREP_SQL_SIZE = 1000
+
     @classmethod
     async def create(cls, url, redis_url=None, pool_size=20):
         """Factory method."""
@@ -92,7 +96,8 @@ class Db:
         # /head_age (which would cause the ELB to mark the instance unhealthy).
         self.health_db = None
         self.redis_cache = None
-        self._prep_sql = {}
+        self._prep_sql = LruCache(self.PREP_SQL_SIZE)
+        Stats.register_cache('sql text', self._prep_sql)
 
     async def init(self, url, redis_url, pool_size=20):
         """Initialize the aiopg.sa engine."""
@@ -197,9 +202,8 @@ class Db:
             raise e
 
     def _sql_text(self, sql):
-        if sql in self._prep_sql:
-            query = self._prep_sql[sql]
-        else:
+        query = self._prep_sql.get(sql)
+        if query is None:
             query = sqlalchemy.text(sql).execution_options(autocommit=False)
-            self._prep_sql[sql] = query
+            self._prep_sql.put(sql, query)
         return query
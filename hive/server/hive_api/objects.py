@@ -74,7 +74,8 @@ async def comments_by_id(db, ids, observer=None):
     sql_tpl = """SELECT post_id, author, permlink, body, depth,
                     payout, payout_at, is_paidout, created_at, updated_at,
                     rshares, is_hidden, is_grayed, votes
-               FROM %s WHERE post_id IN :ids"""
+               FROM %s JOIN hive_post_data USING (post_id)
+              WHERE post_id IN :ids"""
     sql = sql_tpl % CacheRouter.TEMP_TABLE
     result = list(await db.query_all(sql, ids=tuple(ids)))
     found_ids = {row['post_id'] for row in result}
@@ -120,9 +121,10 @@ async def posts_by_id(db, ids, observer=None, lite=True):
     sql = """SELECT post_id, author, permlink, title, img_url, payout, promoted,
                     created_at, payout_at, is_nsfw, rshares, votes,
                     is_muted, is_invalid, %s
-               FROM hive_posts_cache WHERE post_id IN :ids"""
+               FROM hive_posts_cache %s WHERE post_id IN :ids"""
     fields = ['preview'] if lite else ['body', 'updated_at', 'json']
-    sql = sql % (', '.join(fields))
+    join = '' if lite else 'JOIN hive_post_data USING (post_id)'
+    sql = sql % (', '.join(fields), join)
 
     reblogged_ids = await _reblogged_ids(db, observer, ids) if observer else []
 
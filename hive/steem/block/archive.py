@@ -0,0 +1,87 @@
+"""Local on-disk archive of irreversible blocks, in checkpoint v2 format."""
+
+import logging
+import os
+from collections import OrderedDict
+import ujson as json
+
+from hive.utils.checkpoint import CheckpointWriter
+
+log = logging.getLogger(__name__)
+
+SEGMENT_SIZE = 1000000
+
+class BlockArchive:
+    """Appends synced blocks to `(block_num).json.gz` checkpoint files.
+
+    The archive directory is laid out like `./checkpoints`: each file
+    covers a fixed segment of `SEGMENT_SIZE` blocks and is named after
+    the last block of its segment, so `Sync.from_checkpoints` can replay
+    it directly. Only irreversible blocks are written; blocks received
+    ahead of the irreversible head are held in memory until `confirm`
+    (and dropped if a fork replaces them). If the archive falls behind
+    the blocks being synced (e.g. unflushed blocks lost on a crash), the
+    gap is backfilled from steemd.
+    """
+
+    def __init__(self, client, path, segment_size=SEGMENT_SIZE):
+        self._client = client
+        self._path = path
+        self._segment_size = segment_size
+        self._writer = None
+        self._segment = None
+        self._pending = OrderedDict()
+        os.makedirs(path, exist_ok=True)
+
+    def segment_path(self, num):
+        """Get the path of the segment file containing block `num`."""
+        end = ((num - 1) // self._segment_size + 1) * self._segment_size
+        return os.path.join(self._path, '%d.json.gz' % end)
+
+    def add(self, block):
+        """Queue a block; it is written once confirmed irreversible."""
+        num = int(block['block_id'][:8], base=16)
+        if self._pending and num <= next(reversed(self._pending)):
+            # fork: discard the replaced blocks
+            for stale in [n for n in self._pending if n >= num]:
+                del self._pending[stale]
+        self._pending[num] = block
+
+    def confirm(self, irreversible_num):
+        """Write all queued blocks up to `irreversible_num`."""
+        while self._pending:
+            num = next(iter(self._pending))
+            if num > irreversible_num:
+                break
+            self._write(num, self._pending.pop(num))
+
+    def flush(self):
+        """Write confirmed blocks of a partial frame to disk."""
+        if self._writer:
+            self._writer.flush()
+
+    def close(self):
+        """Flush the current segment to disk. Unconfirmed blocks are lost."""
+        if self._writer:
+            self._writer.close()
+            self._writer = None
+            self._segment = None
+
+    def _write(self, num, block):
+        path = self.segment_path(num)
+        if path != self._segment:
+            self.close()
+            self._writer = CheckpointWriter(path)
+            self._segment = path
+
+        last = self._writer.last_num()
+        if last is not None and num <= last:
+            return # already archived (e.g. resync after restart)
+        if last is not None and num > last + 1:
+            log.warning("[ARCHIVE] backfill %s: blocks %d-%d", path, last + 1, num - 1)
+            for lbound in range(last + 1, num, 1000):
+                ubound = min(lbound + 1000, num)
+                gap = self._client.get_blocks_range(lbound, ubound)
+                for gap_num, gap_block in zip(range(lbound, ubound), gap):
+                    self._writer.append(gap_num, json.dumps(gap_block))
+        self._writer.append(num, json.dumps(block))
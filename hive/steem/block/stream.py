@@ -52,7 +52,16 @@ class BlockQueue:
         return len(self._queue)
 
 class BlockStream:
-    """ETA-based block streamer."""
+    """ETA-based block streamer.
+
+    When at least `CATCHUP_GAP` blocks behind, the missing range is
+    fetched with batched calls of up to `CATCHUP_BATCH` blocks instead of
+    one `get_block` round trip per block. Each block still goes through
+    `BlockQueue` (fork linkage) and `BlockSchedule` checks in order.
+    """
+
+    CATCHUP_GAP = 3
+    CATCHUP_BATCH = 50
 
     @classmethod
     def stream(cls, client, start_block, min_gap=0, max_gap=100):
@@ -60,6 +69,14 @@ class BlockStream:
         streamer = BlockStream(client, min_gap, max_gap)
         return streamer.start(start_block)
 
+    @classmethod
+    def stream_groups(cls, client, start_block, min_gap=0, max_gap=100,
+                      group_gap=0, group_size=1):
+        """Instantiates a BlockStream and returns a generator of lists."""
+        # pylint: disable=too-many-arguments
+        streamer = BlockStream(client, min_gap, max_gap)
+        return streamer.start_groups(start_block, group_gap, group_size)
+
     def __init__(self, client, min_gap=0, max_gap=100):
         assert not (min_gap < 0 or min_gap > 100)
         self._client = client
@@ -75,6 +92,28 @@ class BlockStream:
 
         Will run forever unless `max_gap` is specified and exceeded.
         """
+        for block, _ in self._stream(start_block):
+            yield block
+
+    def start_groups(self, start_block, group_gap, group_size):
+        """Stream lists of consecutive blocks starting from `start_block`.
+
+        While more than `group_gap` blocks behind (expected) head, up to
+        `group_size` blocks are grouped together; near head, each group
+        holds a single block.
+        """
+        group = []
+        for block, gap in self._stream(start_block):
+            group.append(block)
+            if gap <= group_gap or len(group) >= group_size:
+                yield group
+                group = []
+        if group:
+            yield group
+
+    def _stream(self, start_block):
+        """Yield `(block, gap)`, with gap the no. of blocks head is ahead
+        of the last one fetched, as estimated by `BlockSchedule`."""
         curr = start_block
         head = self._client.head_block()
         prev = self._client.get_block(curr - 1)['block_id']
@@ -84,17 +123,47 @@ class BlockStream:
 
         while self._gap_ok(curr, head):
             head = schedule.wait_for_block(curr)
-            block = self._client.get_block(curr, strict=False)
-            schedule.check_block(curr, block)
-
-            if not block:
-                sleep(0.5)
-                continue
+            blocks = []
+            if head - curr >= self.CATCHUP_GAP:
+                blocks = self._catchup(curr, head)
+            if not blocks:
+                block = self._client.get_block(curr, strict=False)
+                if not block:
+                    schedule.check_block(curr, block)
+                    sleep(0.5)
+                    continue
+                blocks = [block]
+
+            for block in blocks:
+                schedule.check_block(curr, block)
+                popped = queue.push(block)
+                if popped:
+                    yield popped, head - curr
+                curr += 1
 
-            popped = queue.push(block)
-            if popped:
-                yield popped
+        log.warning("gap exceeds %d", self._max_gap)
 
-            curr += 1
+    def _catchup(self, curr, head):
+        """Batch-fetch blocks from `curr` towards (expected) `head`.
 
-        log.warning("gap exceeds %d", self._max_gap)
+        The range is capped at the node's actual head block, since the
+        schedule may run ahead of it (e.g. after missed slots). The node
+        serving blocks may still lag the one reporting head (e.g. behind
+        a load balancer): the range is then cut at the first missing
+        block, or dropped if it cannot be fetched at all, leaving the
+        rest to single-block polling.
+        """
+        ubound = min(head, self._client.head_block()) + 1
+        ubound = min(ubound, curr + self.CATCHUP_BATCH)
+        if ubound - curr < 2:
+            return []
+        try:
+            blocks = self._client.get_blocks_range(curr, ubound)
+        except Exception as e: # pylint: disable=broad-except
+            log.warning("blocks %d-%d not available (%s); polling",
+                        curr, ubound - 1, repr(e))
+            return []
+        for idx, block in enumerate(blocks):
+            if not block:
+                return blocks[:idx]
+        return blocks
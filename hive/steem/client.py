@@ -46,6 +46,10 @@ class SteemClient:
             assert 'author' in post, "invalid post: %s" % post
         return posts
 
+    def get_active_votes_batch(self, tuples):
+        """Fetch active votes of multiple posts by (author, permlink)."""
+        return self.__exec_batch('get_active_votes', tuples)
+
     def get_block(self, num, strict=True):
         """Fetches a single block.
 
@@ -64,6 +68,13 @@ class SteemClient:
         """Stream blocks. Returns a generator."""
         return BlockStream.stream(self, start_from, trail_blocks, max_gap)
 
+    def stream_block_groups(self, start_from, trail_blocks=0, max_gap=100,
+                            group_gap=0, group_size=1):
+        """Stream lists of blocks, grouped while far behind head."""
+        # pylint: disable=too-many-arguments
+        return BlockStream.stream_groups(self, start_from, trail_blocks, max_gap,
+                                         group_gap, group_size)
+
     def _gdgp(self):
         ret = self.__exec('get_dynamic_global_properties')
         assert 'time' in ret, "gdgp invalid resp: %s" % ret
@@ -85,6 +85,7 @@ class HttpClient(object):
         lookup_accounts='condenser_api',
         get_block='block_api',
         get_content='condenser_api',
+        get_active_votes='condenser_api',
         get_accounts='condenser_api',
         get_order_book='condenser_api',
         get_feed_history='condenser_api',
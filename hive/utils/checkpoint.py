@@ -0,0 +1,233 @@
+"""Checkpoint v2: gzip-framed block files with a block->offset index.
+
+A v2 checkpoint `(block_num).json.gz` holds the same newline-delimited
+block JSON as a v1 `(block_num).json.lst`, split into frames of
+`frame_size` blocks. Each frame is an independent gzip member, so the
+file is still readable with `zcat`. The sidecar `(block_num).json.gz.idx`
+has one line per frame: `first_block_num byte_offset`. Resuming at any
+block only needs to decompress the frame containing it.
+"""
+
+import bisect
+import gzip
+import logging
+import os
+import re
+import zlib
+
+log = logging.getLogger(__name__)
+
+FRAME_SIZE = 1000
+
+_BLOCK_ID = re.compile(r'"block_id"\s*:\s*"([0-9a-f]{8})')
+
+def block_num_from_line(line):
+    """Extract the block number from a raw block JSON line."""
+    match = _BLOCK_ID.search(line)
+    assert match, "block_id not found in line: %s" % line[0:128]
+    return int(match.group(1), base=16)
+
+def index_path(path):
+    """Get the sidecar index path for a v2 checkpoint file."""
+    return path + '.idx'
+
+def _read_frame(f, offset):
+    """Decompress the single gzip member at `offset`.
+
+    Returns the frame's lines and the offset at which the frame ends.
+    """
+    f.seek(offset)
+    inflater = zlib.decompressobj(wbits=31)
+    chunks = []
+    consumed = 0
+    while not inflater.eof:
+        raw = f.read(1 << 20)
+        assert raw, "truncated checkpoint frame at offset %d" % offset
+        chunks.append(inflater.decompress(raw))
+        consumed += len(raw)
+    end = offset + consumed - len(inflater.unused_data)
+    lines = b''.join(chunks).decode('utf-8').splitlines()
+    return lines, end
+
+class CheckpointWriter:
+    """Appends raw block lines to a v2 checkpoint file.
+
+    Blocks must be appended sequentially. Only complete frames are ever
+    written to disk; a partial frame is held in memory until `close()`
+    (or until it fills). Reopening an existing file continues after
+    its last block.
+    """
+
+    def __init__(self, path, frame_size=FRAME_SIZE, level=6):
+        self._path = path
+        self._frame_size = frame_size
+        self._level = level
+        self._frame = []
+        self._frame_first = None
+        self._last_num = None
+
+        exists = os.path.exists(path)
+        index = CheckpointIndex.load(path) if exists else CheckpointIndex.empty()
+        assert index.firsts or not exists or not os.path.getsize(path), (
+            "checkpoint %s has no index" % path)
+        self._last_num = index.last_num
+
+        # drop a torn index line and any frame data written after the
+        # last indexed frame (e.g. the process died between the two)
+        self._idx = self._reset_index(index)
+        self._file = open(path, 'r+b' if exists else 'wb')
+        self._file.truncate(index.end)
+        self._file.seek(index.end)
+
+    def _reset_index(self, index):
+        """Replace the index with its valid entries; open it for appending.
+
+        The entries go to a temp file which is synced and renamed over
+        the index, so a crash at any point leaves a complete index.
+        """
+        path = index_path(self._path)
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.writelines("%d %d\n" % tup for tup in zip(index.firsts, index.offsets))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        return open(path, 'a')
+
+    def last_num(self):
+        """Last block number appended (written or pending)."""
+        return self._last_num
+
+    def append(self, num, line):
+        """Append one raw block JSON line (without trailing newline)."""
+        if self._last_num is not None:
+            assert num == self._last_num + 1, ("checkpoint expects block %d, got %d"
+                                               % (self._last_num + 1, num))
+        if not self._frame:
+            self._frame_first = num
+        self._frame.append(line)
+        self._last_num = num
+        if len(self._frame) >= self._frame_size:
+            self._write_frame()
+
+    def flush(self):
+        """Write any partial frame to disk."""
+        if self._frame:
+            self._write_frame()
+        self._file.flush()
+        self._idx.flush()
+
+    def close(self):
+        """Flush and close the checkpoint and its index."""
+        self.flush()
+        self._file.close()
+        self._idx.close()
+
+    def _write_frame(self):
+        data = ('\n'.join(self._frame) + '\n').encode('utf-8')
+        offset = self._file.tell()
+        self._file.write(gzip.compress(data, compresslevel=self._level))
+        self._file.flush()
+        self._idx.write("%d %d\n" % (self._frame_first, offset))
+        self._frame = []
+        self._frame_first = None
+
+class CheckpointIndex:
+    """In-memory copy of a v2 checkpoint's frame index."""
+
+    def __init__(self, firsts, offsets, last_num, end):
+        self.firsts = firsts
+        self.offsets = offsets
+        self.last_num = last_num
+        self.end = end
+
+    @classmethod
+    def empty(cls):
+        """Index of a checkpoint with no frames."""
+        return cls([], [], None, 0)
+
+    @classmethod
+    def load(cls, path):
+        """Read the sidecar index for checkpoint `path`."""
+        firsts = []
+        offsets = []
+        if os.path.exists(index_path(path)):
+            with open(index_path(path)) as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) != 2 or not line.endswith('\n'):
+                        break # torn write; ignore remainder
+                    firsts.append(int(parts[0]))
+                    offsets.append(int(parts[1]))
+
+        # the index does not record frame lengths; read the last frame
+        # to learn where the file ends and its last block number.
+        last_num = None
+        end = 0
+        if firsts:
+            with open(path, 'rb') as f:
+                lines, end = _read_frame(f, offsets[-1])
+            last_num = block_num_from_line(lines[-1])
+        return cls(firsts, offsets, last_num, end)
+
+    def frame_for(self, num):
+        """Get the index of the frame which contains block `num`."""
+        idx = bisect.bisect_right(self.firsts, num) - 1
+        return max(idx, 0)
+
+class CheckpointReader:
+    """Reads raw block lines from a v2 checkpoint, seeking by block num."""
+
+    def __init__(self, path):
+        self._path = path
+        self._index = CheckpointIndex.load(path)
+
+    def first_num(self):
+        """First block number in this file."""
+        return self._index.firsts[0] if self._index.firsts else None
+
+    def last_num(self):
+        """Last block number in this file."""
+        return self._index.last_num
+
+    def lines(self, start_num=None):
+        """Yield raw block lines, beginning at block `start_num`."""
+        index = self._index
+        if not index.firsts:
+            return
+        if start_num is None:
+            start_num = index.firsts[0]
+
+        frame = index.frame_for(start_num)
+        with open(self._path, 'rb') as f:
+            for i in range(frame, len(index.offsets)):
+                lines, _ = _read_frame(f, index.offsets[i])
+                skip = max(start_num - index.firsts[i], 0)
+                yield from lines[skip:]
+
+def convert(src, dst=None, frame_size=FRAME_SIZE):
+    """Convert a v1 `.json.lst` checkpoint into a v2 `.json.gz` file."""
+    assert src.endswith('.json.lst'), "expected a .json.lst file: %s" % src
+    dst = dst or src[:-len('.json.lst')] + '.json.gz'
+    assert not os.path.exists(dst), "file already exists: %s" % dst
+
+    count = 0
+    writer = CheckpointWriter(dst, frame_size=frame_size)
+    with open(src) as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if not line:
+                continue
+            writer.append(block_num_from_line(line), line)
+            count += 1
+            if count % 100000 == 0:
+                log.info("[CHECKPOINT] %s: %d blocks", dst, count)
+    writer.close()
+    log.info("[CHECKPOINT] wrote %s (%d blocks)", dst, count)
+    return dst
+
+if __name__ == '__main__':
+    import sys
+    logging.basicConfig(level=logging.INFO)
+    for arg in sys.argv[1:]:
+        convert(arg)
@@ -0,0 +1,170 @@
+"""Compact string -> int id map with CLOCK eviction."""
+
+from array import array
+from zlib import crc32
+
+_MASK64 = (1 << 64) - 1
+
+class CompactIdMap:
+    """Bounded map of string keys to positive 32-bit ids.
+
+    Keys are not stored; each is reduced to a 64-bit hash plus an
+    independent 32-bit check (crc32) and kept in an open-addressing
+    (linear probing) table made of flat arrays, for about 17 bytes per
+    slot instead of a few hundred per `OrderedDict` entry. The table
+    grows by doubling until it can hold `capacity` entries, after which
+    the CLOCK policy evicts entries which have not been read since the
+    hand last passed them.
+
+    `get` verifies the check of the slot its hash leads to, so a key
+    colliding on the hash alone reports a miss. If `put` sees a hash
+    held by a key with a different check, the hash is flagged ambiguous
+    and `get` reports a miss for both keys until the entry is evicted,
+    deferring to the caller's authoritative lookup (the database).
+    """
+    #pylint: disable=too-many-instance-attributes
+
+    LOAD = 0.7
+    MIN_SLOTS = 1024
+
+    def __init__(self, capacity):
+        assert capacity > 0, "capacity must be positive"
+        self._capacity = capacity
+        self._hand = 0
+        self._count = 0
+        self._ambiguous = set()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._alloc(self.MIN_SLOTS)
+
+    def _alloc(self, slots):
+        self._mask = slots - 1
+        self._keys = array('Q', [0]) * slots
+        self._vals = array('I', [0]) * slots
+        self._checks = array('I', [0]) * slots
+        self._refs = bytearray(slots)
+
+    @staticmethod
+    def _hash(key):
+        return (hash(key) & _MASK64) or 1 # 0 marks an empty slot
+
+    @staticmethod
+    def _check(key):
+        return crc32(key.encode())
+
+    def _find(self, hsh):
+        """Get the slot holding `hsh`, or the empty slot ending its probe."""
+        keys, mask = self._keys, self._mask
+        i = hsh & mask
+        while keys[i] and keys[i] != hsh:
+            i = (i + 1) & mask
+        return i
+
+    def __len__(self):
+        return self._count
+
+    def _slot(self, key):
+        """Get the slot of `key`, or None if absent or ambiguous."""
+        hsh = self._hash(key)
+        i = self._find(hsh)
+        if (not self._keys[i] or hsh in self._ambiguous
+                or self._checks[i] != self._check(key)):
+            return None
+        return i
+
+    def __contains__(self, key):
+        return self._slot(key) is not None
+
+    def get(self, key):
+        """Get the id for `key`, or None. Counts towards hit/miss stats."""
+        i = self._slot(key)
+        if i is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._refs[i] = 1
+        return self._vals[i]
+
+    def put(self, key, value):
+        """Map `key` to `value`, evicting an entry if full."""
+        assert 0 < value < (1 << 32), "id out of range: %r" % value
+        hsh, check = self._hash(key), self._check(key)
+        i = self._find(hsh)
+        if self._keys[i]:
+            if self._checks[i] != check:
+                self._ambiguous.add(hsh) # another key holds this hash
+            else:
+                self._vals[i] = value
+            self._refs[i] = 1
+            return
+
+        if self._count >= self._capacity:
+            self._evict()
+            i = self._find(hsh)
+        elif self._count + 1 > self.LOAD * (self._mask + 1):
+            self._grow()
+            i = self._find(hsh)
+        self._keys[i] = hsh
+        self._vals[i] = value
+        self._checks[i] = check
+        self._refs[i] = 1
+        self._count += 1
+
+    def stats(self):
+        """Get (hits, misses, entries, evictions)."""
+        return (self.hits, self.misses, self._count, self.evictions)
+
+    def _grow(self):
+        """Double the table, up to the size needed for `capacity`."""
+        slots = self._mask + 1
+        if slots * self.LOAD >= self._capacity:
+            return
+        keys, vals, checks, refs = self._keys, self._vals, self._checks, self._refs
+        self._alloc(slots * 2)
+        for j, hsh in enumerate(keys):
+            if hsh:
+                i = self._find(hsh)
+                self._keys[i] = hsh
+                self._vals[i] = vals[j]
+                self._checks[i] = checks[j]
+                self._refs[i] = refs[j]
+        self._hand = 0
+
+    def _evict(self):
+        """Advance the CLOCK hand to an unreferenced entry and remove it."""
+        keys, refs, mask = self._keys, self._refs, self._mask
+        while True:
+            i = self._hand
+            self._hand = (i + 1) & mask
+            if not keys[i]:
+                continue
+            if refs[i]:
+                refs[i] = 0
+                continue
+            self._remove(i)
+            self.evictions += 1
+            return
+
+    def _remove(self, i):
+        """Empty slot `i`, shifting back later entries of its probe run."""
+        keys, vals, checks, refs = self._keys, self._vals, self._checks, self._refs
+        mask = self._mask
+        self._ambiguous.discard(keys[i])
+        j = i
+        while True:
+            j = (j + 1) & mask
+            hsh = keys[j]
+            if not hsh:
+                break
+            home = hsh & mask
+            # entry at j may fill the hole unless its home lies in (i, j]
+            if (i < home <= j) if i <= j else (home > i or home <= j):
+                continue
+            keys[i], vals[i], checks[i], refs[i] = hsh, vals[j], checks[j], refs[j]
+            i = j
+        keys[i] = 0
+        vals[i] = 0
+        checks[i] = 0
+        refs[i] = 0
+        self._count -= 1
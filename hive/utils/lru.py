@@ -0,0 +1,43 @@
+"""Small size-bounded LRU cache."""
+
+from collections import OrderedDict
+
+class LruCache:
+    """Bounded map which evicts its least recently used entry when full."""
+
+    def __init__(self, capacity):
+        assert capacity > 0, "capacity must be positive"
+        self._capacity = capacity
+        self._items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key):
+        """Get the value for `key`, or None. Counts towards hit/miss stats."""
+        try:
+            value = self._items[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self._items.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """Store `value` under `key`, evicting the oldest entry if full."""
+        self._items[key] = value
+        self._items.move_to_end(key)
+        if len(self._items) > self._capacity:
+            self._items.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        """Get (hits, misses, entries, evictions)."""
+        return (self.hits, self.misses, len(self._items), self.evictions)
@@ -0,0 +1,154 @@
+"""Compact name -> id map, persistable to an mmap-able snapshot file."""
+
+import bisect
+import logging
+import mmap
+import os
+import struct
+from array import array
+
+log = logging.getLogger(__name__)
+
+# magic, count, max_id, index of max_id, blob length; padded to 32 bytes
+_HEADER = struct.Struct('<8sIIII12x')
+_MAGIC = b'HIVEAM01'
+
+class _SortedNames:
+    """Sequence view of the i-th name (as bytes) in the blob, for bisect."""
+    #pylint: disable=too-few-public-methods
+
+    def __init__(self, blob, offsets):
+        self._blob = blob
+        self._offsets = offsets
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        return bytes(self._blob[self._offsets[i]:self._offsets[i + 1]])
+
+class NameIdMap:
+    """Read-mostly map of account names to ids.
+
+    The bulk of the entries live in one sorted, concatenated name blob
+    plus `offsets` and `ids` arrays (~4+8 bytes of overhead per name),
+    searched by bisection. Names added later go to a small overlay dict.
+    A hot-entry dict in front of the bisection keeps repeated lookups
+    at dict speed. The sorted part can be written to a snapshot file
+    and mapped back with mmap, so loading it costs next to nothing.
+    """
+
+    HOT_SIZE = 100000
+
+    def __init__(self, blob=b'', offsets=None, ids=None, mapped=None):
+        self._blob = blob
+        self._offsets = offsets if offsets is not None else array('I', [0])
+        self._ids = ids if ids is not None else array('I')
+        self._names = _SortedNames(self._blob, self._offsets)
+        self._mapped = mapped
+        self._extra = {}
+        self._hot = {}
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build from (name, id) tuples."""
+        rows = sorted(rows)
+        offsets = array('I', [0])
+        ids = array('I')
+        parts = []
+        pos = 0
+        for name, _id in rows:
+            raw = name.encode('utf-8')
+            parts.append(raw)
+            pos += len(raw)
+            offsets.append(pos)
+            ids.append(_id)
+        return cls(b''.join(parts), offsets, ids)
+
+    @classmethod
+    def load(cls, path):
+        """Map a snapshot file. Returns (map, max_id) or None if unusable."""
+        with open(path, 'rb') as f:
+            try:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                return None # empty file
+        if len(mapped) < _HEADER.size:
+            mapped.close()
+            return None
+        magic, count, max_id, _, blob_len = _HEADER.unpack_from(mapped)
+        expect = _HEADER.size + 4 * (count + 1) + 4 * count + blob_len
+        if magic != _MAGIC or len(mapped) != expect:
+            log.warning("ignoring invalid account snapshot %s", path)
+            mapped.close()
+            return None
+
+        view = memoryview(mapped)
+        pos = _HEADER.size
+        offsets = view[pos:pos + 4 * (count + 1)].cast('I')
+        pos += 4 * (count + 1)
+        ids = view[pos:pos + 4 * count].cast('I')
+        pos += 4 * count
+        blob = view[pos:pos + blob_len]
+        return cls(blob, offsets, ids, mapped=mapped), max_id
+
+    def save(self, path):
+        """Write all entries (including overlay) to a snapshot file."""
+        full = self if not self._extra else NameIdMap.from_rows(self.items())
+        count = len(full._ids)
+        max_idx = max(range(count), key=full._ids.__getitem__) if count else 0
+        max_id = full._ids[max_idx] if count else 0
+        header = _HEADER.pack(_MAGIC, count, max_id, max_idx, len(full._blob))
+
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(header)
+            f.write(bytes(full._offsets))
+            f.write(bytes(full._ids))
+            f.write(bytes(full._blob))
+        os.replace(tmp, path)
+        return max_id
+
+    def max_name(self):
+        """Get (name, id) of the highest id in the sorted part, via header."""
+        if self._mapped is None or not len(self._ids):
+            return None
+        max_idx = _HEADER.unpack_from(self._mapped)[3]
+        return self._names[max_idx].decode('utf-8'), self._ids[max_idx]
+
+    def items(self):
+        """Yield all (name, id) pairs."""
+        for i in range(len(self._ids)):
+            yield self._names[i].decode('utf-8'), self._ids[i]
+        yield from self._extra.items()
+
+    def get(self, name):
+        """Get id for `name`, or None."""
+        _id = self._hot.get(name)
+        if _id:
+            return _id
+        _id = self._extra.get(name)
+        if not _id:
+            raw = name.encode('utf-8')
+            i = bisect.bisect_left(self._names, raw)
+            if i == len(self._ids) or self._names[i] != raw:
+                return None
+            _id = self._ids[i]
+        if len(self._hot) >= self.HOT_SIZE:
+            self._hot.clear()
+        self._hot[name] = _id
+        return _id
+
+    def add(self, name, _id):
+        """Add a new entry (to the overlay)."""
+        self._extra[name] = _id
+
+    def overlay_size(self):
+        """Number of entries added since the map was built or loaded."""
+        return len(self._extra)
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def __len__(self):
+        return len(self._ids) + len(self._extra)
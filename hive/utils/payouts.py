@@ -0,0 +1,68 @@
+"""In-memory schedule of pending post payouts."""
+
+import heapq
+from datetime import datetime
+
+from hive.utils.normalize import parse_time, utc_timestamp
+
+def _timestamp(date):
+    """Accept a datetime or chain/db date string; get unix timestamp."""
+    if isinstance(date, datetime):
+        return utc_timestamp(date)
+    if not date:
+        return 0
+    return utc_timestamp(parse_time(date.replace(' ', 'T')))
+
+class PayoutSchedule:
+    """Min-heap of unpaid posts keyed by `payout_at`.
+
+    Each post has at most one live schedule entry (`_due`); rescheduling
+    or removing a post leaves its old heap entry behind, which is skipped
+    when popped and purged whenever stale entries outnumber live ones.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._due = {} # post_id -> (timestamp, url)
+
+    def load(self, rows):
+        """Replace contents with (post_id, payout_at, url) rows."""
+        self._due = {pid: (_timestamp(date), url) for pid, date, url in rows}
+        self._rebuild()
+
+    def add(self, pid, payout_at, url):
+        """Schedule (or reschedule) a post's payout."""
+        entry = (_timestamp(payout_at), url)
+        if self._due.get(pid) == entry:
+            return
+        self._due[pid] = entry
+        heapq.heappush(self._heap, (entry[0], pid))
+        if len(self._heap) > 2 * len(self._due) + 1000:
+            self._rebuild()
+
+    def remove(self, pid):
+        """Unschedule a post (paid out or deleted)."""
+        self._due.pop(pid, None)
+
+    def pop_due(self, date):
+        """Remove and return `[(post_id, url)]` of posts due by `date`."""
+        now = _timestamp(date)
+        heap, due = self._heap, self._due
+        out = []
+        while heap and heap[0][0] <= now:
+            ts, pid = heapq.heappop(heap)
+            entry = due.get(pid)
+            if entry and entry[0] == ts:
+                del due[pid]
+                out.append((pid, entry[1]))
+        return out
+
+    def _rebuild(self):
+        self._heap = [(ts, pid) for pid, (ts, _) in self._due.items()]
+        heapq.heapify(self._heap)
+
+    def __contains__(self, pid):
+        return pid in self._due
+
+    def __len__(self):
+        return len(self._due)
@@ -191,12 +191,11 @@ def post_payout(post):
 
     # get total rshares, and create comma-separated vote data blob
     rshares = sum(int(v['rshares']) for v in post['active_votes'])
-    csvotes = "\n".join(map(_vote_csv_row, post['active_votes']))
+    csvotes = vote_csv(post['active_votes'])
 
     # trending scores
     _timestamp = utc_timestamp(parse_time(post['created']))
-    sc_trend = _score(rshares, _timestamp, 240000)
-    sc_hot = _score(rshares, _timestamp, 10000)
+    sc_trend, sc_hot = vote_scores(rshares, _timestamp)
 
     return {
         'payout': payout,
@@ -206,6 +205,15 @@ def post_payout(post):
         'sc_hot': sc_hot
     }
 
+def vote_csv(votes):
+    """Create the newline-separated vote data blob."""
+    return "\n".join(map(_vote_csv_row, votes))
+
+def vote_scores(rshares, created_timestamp):
+    """Get (trending, hot) scores of a post."""
+    return (_score(rshares, created_timestamp, 240000),
+            _score(rshares, created_timestamp, 10000))
+
 def _vote_csv_row(vote):
     """Convert a vote object into minimal CSV line."""
     rep = rep_log10(vote['reputation'])
@@ -226,10 +234,22 @@ def post_stats(post):
 
     Source: contentStats - https://github.com/steemit/condenser/blob/master/src/app/utils/StateFunctions.js#L109
     """
+    author_rep = rep_log10(post['author_reputation'])
+    has_pending_payout = sbd_amount(post['pending_payout_value']) >= 0.02
+
+    stats = vote_stats(post['active_votes'])
+    stats.update({
+        'hide': author_rep < 0 and not has_pending_payout,
+        'gray': author_rep < 1,
+        'author_rep': author_rep})
+    return stats
+
+def vote_stats(votes):
+    """Count non-zero votes and derive flag weight from downvotes."""
     neg_rshares = 0
     total_votes = 0
     up_votes = 0
-    for vote in post['active_votes']:
+    for vote in votes:
         rshares = int(vote['rshares'])
 
         if rshares == 0:
@@ -244,13 +264,7 @@ def post_stats(post):
     #   result: 1 = approx $400 of downvoting stake; 2 = $4,000; etc
     flag_weight = max((len(str(int(neg_rshares / 2))) - 11, 0))
 
-    author_rep = rep_log10(post['author_reputation'])
-    has_pending_payout = sbd_amount(post['pending_payout_value']) >= 0.02
-
     return {
-        'hide': author_rep < 0 and not has_pending_payout,
-        'gray': author_rep < 1,
-        'author_rep': author_rep,
         'flag_weight': flag_weight,
         'total_votes': total_votes,
         'up_votes': up_votes
@@ -0,0 +1,125 @@
+"""Incrementally maintained rank-by-weight index."""
+
+import bisect
+import math
+from array import array
+
+class RankIndex:
+    """Ranks ids by descending weight without re-sorting on each change.
+
+    Weights are grouped into logarithmic buckets (`STEPS` per doubling).
+    A Fenwick tree over bucket sizes counts the ids in heavier buckets,
+    and each bucket keeps its weights sorted to place an id within it,
+    so `rank` is exact (1 + number of ids with a strictly greater
+    weight) and `update` costs O(log buckets + bucket size).
+
+    Most accounts have a weight of exactly 0; these are only counted
+    (as part of bucket 0), so that they do not make up one huge bucket.
+    """
+
+    STEPS = 16
+    BUCKETS = 64 * STEPS + 1 # bucket 0 holds weights <= 1
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self._weights = array('d')
+        self._known = bytearray()
+        self._buckets = [array('d') for _ in range(self.BUCKETS)]
+        self._tree = [0] * (self.BUCKETS + 1)
+        self._count = 0
+        self._zeros = 0
+
+    @classmethod
+    def _bucket(cls, weight):
+        if weight <= 1:
+            return 0
+        return min(int(math.log2(weight) * cls.STEPS) + 1, cls.BUCKETS - 1)
+
+    def load(self, rows):
+        """Replace contents with (id, weight) rows."""
+        self._reset()
+        for _id, weight in rows:
+            weight = float(weight)
+            self._set(_id, weight)
+            if weight == 0:
+                self._zeros += 1
+            else:
+                self._buckets[self._bucket(weight)].append(weight)
+        self._buckets = [array('d', sorted(bucket)) for bucket in self._buckets]
+        self._rebuild_tree()
+
+    def update(self, _id, weight):
+        """Set the weight of `_id` (adding it if new)."""
+        weight = float(weight)
+        if _id in self:
+            old = self._weights[_id]
+            if old == weight:
+                return
+            idx = self._bucket(old)
+            if old == 0:
+                self._zeros -= 1
+            else:
+                bucket = self._buckets[idx]
+                del bucket[bisect.bisect_left(bucket, old)]
+            self._add_count(idx, -1)
+        self._set(_id, weight)
+        idx = self._bucket(weight)
+        if weight == 0:
+            self._zeros += 1
+        else:
+            bisect.insort(self._buckets[idx], weight)
+        self._add_count(idx, 1)
+
+    def rank(self, _id):
+        """Get 1-based rank of `_id` by descending weight, or None."""
+        if _id not in self:
+            return None
+        weight = self._weights[_id]
+        idx = self._bucket(weight)
+        bucket = self._buckets[idx]
+        heavier = self._count - self._prefix(idx + 1)
+        heavier += len(bucket) - bisect.bisect_right(bucket, weight)
+        if weight < 0:
+            heavier += self._zeros
+        return heavier + 1
+
+    def __contains__(self, _id):
+        return 0 <= _id < len(self._known) and self._known[_id]
+
+    def __len__(self):
+        return self._count
+
+    def _set(self, _id, weight):
+        if _id >= len(self._weights):
+            grow = max(_id + 1, len(self._weights) * 2) - len(self._weights)
+            self._weights.extend([0.0] * grow)
+            self._known.extend(bytes(grow))
+        if not self._known[_id]:
+            self._known[_id] = 1
+            self._count += 1
+        self._weights[_id] = weight
+
+    def _rebuild_tree(self):
+        self._tree = [0] * (self.BUCKETS + 1)
+        for idx, bucket in enumerate(self._buckets):
+            if bucket:
+                self._add_count(idx, len(bucket))
+        self._add_count(0, self._zeros)
+
+    def _add_count(self, idx, delta):
+        """Fenwick update of bucket `idx` size."""
+        i = idx + 1
+        while i <= self.BUCKETS:
+            self._tree[i] += delta
+            i += i & -i
+
+    def _prefix(self, end):
+        """Number of ids in buckets [0, end)."""
+        total = 0
+        i = end
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
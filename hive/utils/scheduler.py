@@ -0,0 +1,132 @@
+"""Background scheduler for periodic housekeeping jobs."""
+
+import logging
+import random
+import threading
+from collections import deque
+from time import perf_counter as perf, time
+
+log = logging.getLogger(__name__)
+
+class Job:
+    """A periodic job and its timing metrics."""
+    # pylint: disable=too-many-instance-attributes,too-few-public-methods
+
+    def __init__(self, name, func, interval, budget=None, apply=None):
+        # pylint: disable=too-many-arguments
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.budget = budget
+        self.apply = apply
+        self.due = 0
+        self.runs = 0
+        self.failures = 0
+        self.overruns = 0
+        self.secs = 0.0
+        self.max_secs = 0.0
+
+    def status(self):
+        """Get a one-line summary of the job's timing."""
+        avg = self.secs / self.runs if self.runs else 0
+        return ("%s: %d runs, %d failed, %d over budget, avg %.2fs, max %.2fs"
+                % (self.name, self.runs, self.failures, self.overruns,
+                   avg, self.max_secs))
+
+class JobScheduler:
+    """Runs periodic jobs on a worker thread, on a pooled db connection.
+
+    Jobs run one at a time, so a job never overlaps with itself or with
+    another; one which comes due while another runs waits for it. Each
+    run is a transaction with `statement_timeout` set to the job's time
+    budget. The next run is scheduled `interval` seconds (+/- `JITTER`)
+    after the previous one finished.
+
+    A job's `func(db)` must only touch the given db and thread-safe
+    state. Its optional `apply(result)` callback is run by `collect` on
+    the caller's thread, for updating in-memory state.
+    """
+
+    JITTER = 0.1
+
+    def __init__(self, db):
+        self._db = db # provides connections via `background()`
+        self._jobs = []
+        self._done = deque()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add(self, name, func, interval, budget=None, apply=None):
+        """Register a job; its first run is due after about `interval`."""
+        # pylint: disable=too-many-arguments
+        job = Job(name, func, interval, budget, apply)
+        self._reschedule(job)
+        self._jobs.append(job)
+        return job
+
+    def start(self):
+        """Start the worker thread."""
+        assert not self._thread, 'already started'
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='jobs', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop the worker thread once its current job (if any) finishes."""
+        if self._thread:
+            self._stop.set()
+            self._thread.join(timeout)
+            self._thread = None
+
+    def collect(self):
+        """Run `apply` callbacks of finished jobs. Returns their count."""
+        count = 0
+        while self._done:
+            job, result = self._done.popleft()
+            job.apply(result)
+            count += 1
+        return count
+
+    def report(self):
+        """Get timing metrics of all jobs."""
+        return '; '.join(job.status() for job in self._jobs)
+
+    def _reschedule(self, job):
+        jitter = random.uniform(-self.JITTER, self.JITTER)
+        job.due = time() + job.interval * (1 + jitter)
+
+    def _run(self):
+        while not self._stop.is_set():
+            job = min(self._jobs, key=lambda j: j.due)
+            wait = job.due - time()
+            if wait > 0:
+                self._stop.wait(wait)
+                continue
+            self._execute(job)
+            self._reschedule(job)
+
+    def _execute(self, job):
+        """Run `job` in a transaction on a background connection."""
+        start = perf()
+        try:
+            with self._db.background() as db:
+                if job.budget:
+                    db.query_one("SELECT set_config('statement_timeout', :ms, true)",
+                                 ms=str(int(job.budget * 1000)))
+                result = job.func(db)
+        except Exception: # pylint: disable=broad-except
+            job.failures += 1
+            log.exception("[JOBS] %s failed", job.name)
+            return
+        finally:
+            secs = perf() - start
+            job.runs += 1
+            job.secs += secs
+            job.max_secs = max(job.max_secs, secs)
+            if job.budget and secs > job.budget:
+                job.overruns += 1
+                log.warning("[JOBS] %s took %.2fs (budget %.2fs)",
+                            job.name, secs, job.budget)
+
+        if job.apply:
+            self._done.append((job, result))
@@ -90,6 +90,7 @@ class SteemStats(StatsAbstract):
         'get_block': 50,
         'get_blocks_batch': 5,
         'get_accounts': 3,
+        'get_active_votes': 2,
         'get_content': 4,
         'get_order_book': 20,
         'get_feed_history': 20,
@@ -136,6 +137,9 @@ class Stats:
 
     _db = DbStats()
     _steemd = SteemStats()
+    _caches = {}
+    _templates = set() # hashes of distinct sql texts seen
+    MAX_TEMPLATES = 100000
     _secs = 0.0
     _idle = 0.0
     _start = perf()
@@ -143,6 +147,8 @@ class Stats:
     @classmethod
     def log_db(cls, sql, secs):
         """Log a database query. Incoming SQL is normalized."""
+        if len(cls._templates) < cls.MAX_TEMPLATES:
+            cls._templates.add(hash(sql))
         if cls._db.DEBUG_SQL:
             sql = ' '.join(sql.split())
             cls._db.add(sql, secs * 1000)
@@ -156,6 +162,12 @@ class Stats:
         cls._steemd.add(method, secs * 1000, batch_size)
         cls.add_secs(secs)
 
+    @classmethod
+    def register_cache(cls, name, cache):
+        """Include a cache's `stats()` (hits, misses, entries, evictions)
+        in periodic reports."""
+        cls._caches[name] = cache
+
     @classmethod
     def log_idle(cls, secs):
         """Track idle time (e.g. sleeping until next block)"""
@@ -185,5 +197,28 @@ class Stats:
         if cls._secs > 1:
             cls._db.report(cls._secs)
             cls._steemd.report(cls._secs)
+        cls.report_caches()
+
+    @classmethod
+    def sql_templates(cls):
+        """Get the number of distinct sql texts seen (up to `MAX_TEMPLATES`).
+
+        A count which keeps growing points at queries which inline values
+        instead of binding them."""
+        return len(cls._templates)
+
+    @classmethod
+    def report_caches(cls):
+        """Emit hit rates and sizes of registered caches."""
+        if cls._templates:
+            log.info("SQL: %d distinct templates%s", cls.sql_templates(),
+                     '+' if cls.sql_templates() >= cls.MAX_TEMPLATES else '')
+        for name, cache in cls._caches.items():
+            hits, misses, entries, evictions = cache.stats()
+            total = hits + misses
+            if not total:
+                continue
+            log.info("Cache: %s -- %d entries, %.1f%% hits (%d/%d), %d evicted",
+                     name, entries, 100.0 * hits / total, hits, total, evictions)
 
 atexit.register(Stats.report)
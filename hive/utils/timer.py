@@ -23,8 +23,10 @@ class Timer:
     _full_total = None
     _start_time = None
 
-    # Lap checkpoints, # processed, last # processed
+    # Lap checkpoints, lap durations measured elsewhere, # processed,
+    # last # processed
     _laps = []
+    _lap_secs = {}
     _processed = 0
     _last_items = 0
 
@@ -38,10 +40,18 @@ class Timer:
     def batch_start(self):
         """Signal new batch; call at top of loop."""
         self._laps = []
+        self._lap_secs = {}
         self.batch_lap()
 
-    def batch_lap(self):
-        """Signal movement to next task within batch."""
+    def batch_lap(self, secs=None):
+        """Signal movement to next task within batch.
+
+        If the finished task ran concurrently (e.g. prefetched in a
+        thread), pass its actual duration as `secs` so that its rate
+        is not skewed by the overlap.
+        """
+        if secs is not None:
+            self._lap_secs[len(self._laps)] = secs
         self._laps.append(perf())
 
     def batch_finish(self, ops=None):
@@ -79,7 +89,7 @@ class Timer:
     def _rate(self, lap_idx=None):
         """Get the rate of last batch's lap_idx, pass None for overall."""
         secs = self._elapsed(lap_idx)
-        return self._last_items / secs
+        return self._last_items / secs if secs else 0
 
     def _eta(self):
         """Time to finish, based on most recent batch."""
@@ -90,4 +100,6 @@ class Timer:
     def _elapsed(self, lap_idx=None):
         if not lap_idx:
             return self._laps[-1] - self._laps[0]
+        if lap_idx in self._lap_secs:
+            return self._lap_secs[lap_idx]
         return self._laps[lap_idx] - self._laps[lap_idx-1]
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""Tests for grouped execution of query batches in the sync db adapter."""
+
+from hive.db.adapter import Db, _group_queries
+from hive.utils.lru import LruCache
+
+
+def _fake_db():
+    """Db without a connection, recording what it executes."""
+    db = Db.__new__(Db)
+    db._trx_active = False
+    db._prep_sql = LruCache(10)
+    db.calls = []
+    db._exec = lambda query, *args, **kwargs: db.calls.append(
+        (query.text, args[0] if args else kwargs))
+    return db
+
+
+def test_group_queries_keeps_order():
+    """Only consecutive queries with the same sql are grouped."""
+    queries = [("UPDATE a SET x = :x", {'x': 1}),
+               ("UPDATE a SET x = :x", {'x': 2}),
+               ("UPDATE b SET y = :y", {'y': 3}),
+               ("UPDATE a SET x = :x", {'x': 4})]
+    assert _group_queries(queries) == [
+        ("UPDATE a SET x = :x", [{'x': 1}, {'x': 2}]),
+        ("UPDATE b SET y = :y", [{'y': 3}]),
+        ("UPDATE a SET x = :x", [{'x': 4}])]
+
+
+def test_batch_queries_executemany():
+    """Runs of a template are sent at once, in the original order."""
+    db = _fake_db()
+    db.batch_queries([("DELETE FROM b WHERE y = :y", {'y': 1}),
+                      ("INSERT INTO b (y) VALUES (:y)", {'y': 2}),
+                      ("INSERT INTO b (y) VALUES (:y)", {'y': 3}),
+                      ("DELETE FROM b WHERE y = :y", {'y': 2})], trx=True)
+    assert db.calls == [("START TRANSACTION", {}),
+                        ("DELETE FROM b WHERE y = :y", {'y': 1}),
+                        ("INSERT INTO b (y) VALUES (:y)", [{'y': 2}, {'y': 3}]),
+                        ("DELETE FROM b WHERE y = :y", {'y': 2}),
+                        ("COMMIT", {})]
+    assert not db.is_trx_active()
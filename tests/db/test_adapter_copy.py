@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+"""Tests for COPY value formatting in the sync db adapter."""
+
+from decimal import Decimal
+
+from hive.db.adapter import _copy_value
+
+
+def test_copy_value_null_and_bool():
+    """NULL and booleans use postgres text-format literals."""
+    assert _copy_value(None) == '\\N'
+    assert _copy_value(True) == 't'
+    assert _copy_value(False) == 'f'
+
+
+def test_copy_value_escapes_specials():
+    """Backslash, tab and newlines are escaped so rows stay aligned."""
+    assert _copy_value('a\tb') == 'a\\tb'
+    assert _copy_value('a\nb\r') == 'a\\nb\\r'
+    assert _copy_value('c:\\dir') == 'c:\\\\dir'
+
+
+def test_copy_value_numbers():
+    """Numbers are written verbatim."""
+    assert _copy_value(12) == '12'
+    assert _copy_value(Decimal('1.500')) == '1.500'
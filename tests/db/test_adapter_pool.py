@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""Tests for the background connection pool of the sync db adapter."""
+
+import threading
+
+import pytest
+
+from hive.db.adapter import BackgroundPool
+
+
+class FakeConn:
+    """Stand-in for a `Db` connection."""
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        """Mark closed."""
+        self.closed = True
+
+
+def test_thread_affinity_and_reuse():
+    """Nested scopes in a thread share one connection; released ones are reused."""
+    made = []
+    pool = BackgroundPool(lambda: made.append(FakeConn()) or made[-1], 2)
+    conn = pool.acquire()
+    assert pool.acquire() is conn
+    pool.release()
+    pool.release()
+    assert pool.acquire() is conn
+    pool.release()
+    assert len(made) == 1
+
+
+def test_threads_get_distinct_connections():
+    """Concurrent threads never share a connection, and size is enforced."""
+    pool = BackgroundPool(FakeConn, 2)
+    held = []
+    ready = threading.Barrier(3)
+    done = threading.Event()
+
+    def worker():
+        held.append(pool.acquire())
+        ready.wait()
+        done.wait()
+        pool.release()
+
+    threads = [threading.Thread(target=worker) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    ready.wait()
+    assert held[0] is not held[1]
+
+    blocked = threading.Thread(target=lambda: held.append(pool.acquire()))
+    blocked.start()
+    blocked.join(0.05)
+    assert blocked.is_alive() # pool exhausted
+    done.set()
+    blocked.join(1)
+    assert held[2] in held[:2]
+
+
+def test_broken_connection_discarded():
+    """A connection released as broken is closed, not reused."""
+    pool = BackgroundPool(FakeConn, 1)
+    conn = pool.acquire()
+    pool.release(discard=True)
+    assert conn.closed
+    assert pool.acquire() is not conn
+    pool.release()
+    with pytest.raises(AssertionError):
+        pool.release()
@@ -1,8 +1,13 @@
 # -*- coding: utf-8 -*-
 """Tests for hive_posts_cache_temp sync module."""
 
+from datetime import datetime
+
 import pytest
 
+from hive.db.adapter import Db
+from hive.db.schema import (temp_cache_partitions, create_temp_cache_partitions,
+                            drop_temp_cache_partitions, TEMP_CACHE_PARTITIONS_AHEAD)
 from hive.indexer.cache_sync import CacheSync
 
 
@@ -22,3 +27,50 @@ def test_sync_skip_when_busy():
     """Calling sync() again while syncing skips (no exception)."""
     CacheSync.sync()
     CacheSync.sync()  # second call should skip and return
+
+
+def test_temp_cache_partitions_are_weekly():
+    """Partitions start on mondays and cover the requested range."""
+    parts = temp_cache_partitions(datetime(2026, 10, 14, 13, 0), datetime(2026, 10, 27))
+    assert [name for name, _, _ in parts] == ['hive_posts_cache_temp_p20261012',
+                                              'hive_posts_cache_temp_p20261019',
+                                              'hive_posts_cache_temp_p20261026']
+    assert parts[0][1] == datetime(2026, 10, 12)
+    assert parts[-1][2] == datetime(2026, 11, 2)
+    for (_, _, ubound), (_, lbound, _) in zip(parts, parts[1:]):
+        assert ubound == lbound
+
+
+class _StubDb:
+    """Records write queries, enforcing the sync adapter's write guard."""
+
+    def __init__(self, partitions=()):
+        self.partitions = list(partitions)
+        self.sqls = []
+
+    def query(self, sql, **kwargs):
+        assert Db._is_write_query(sql), sql
+        self.sqls.append(' '.join(sql.split()))
+
+    def query_col(self, sql, **kwargs):
+        return self.partitions
+
+
+def test_create_temp_cache_partitions_passes_write_guard():
+    """Missing partitions are filled from the default one, then attached."""
+    db = _StubDb(['hive_posts_cache_temp_p20261012'])
+    created = create_temp_cache_partitions(db, datetime(2026, 10, 14),
+                                           now=datetime(2026, 10, 14))
+    assert 'hive_posts_cache_temp_p20261012' not in created
+    assert created[0] == 'hive_posts_cache_temp_p20261019'
+    assert len(created) == TEMP_CACHE_PARTITIONS_AHEAD
+    attach = [sql for sql in db.sqls if 'ATTACH PARTITION' in sql]
+    assert len(attach) == len(created)
+
+
+def test_drop_temp_cache_partitions_passes_write_guard():
+    """Only partitions wholly before the cutoff are dropped."""
+    db = _StubDb(['hive_posts_cache_temp_p20260713', 'hive_posts_cache_temp_p20260720'])
+    dropped = drop_temp_cache_partitions(db, datetime(2026, 7, 22))
+    assert dropped == ['hive_posts_cache_temp_p20260713']
+    assert db.sqls[-1].startswith('DELETE FROM hive_posts_cache_temp_default')
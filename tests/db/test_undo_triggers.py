@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""Tests for undo journal triggers."""
+
+from hive.db.adapter import Db
+from hive.db.schema import create_undo_triggers, UNDO_DERIVED, UNDO_TABLES
+
+
+class _StubDb:
+    """Records statements, rejecting those the sync adapter would not commit."""
+
+    def __init__(self):
+        self.sqls = []
+
+    def query(self, sql, **kwargs):
+        # pylint: disable=unused-argument
+        assert Db._is_write_query(sql), sql
+        self.sqls.append(sql)
+
+
+def _trigger(table):
+    db = _StubDb()
+    create_undo_triggers(db, [table])
+    return db.sqls[-1]
+
+
+def test_triggers_skip_unjournaled_writes():
+    """No trigger call for writes made outside a journaled block."""
+    db = _StubDb()
+    create_undo_triggers(db)
+    triggers = [sql for sql in db.sqls if sql.startswith('CREATE TRIGGER')]
+    assert len(triggers) == len(UNDO_TABLES)
+    for sql in triggers:
+        assert "WHEN (current_setting('hive.undo_block', true) <> '')" in sql
+
+
+def test_cache_triggers_skip_derived_columns():
+    """Vote-only cache updates are not journaled."""
+    for table in ['hive_posts_cache', 'hive_posts_cache_temp']:
+        sql = _trigger(table)
+        tracked = sql.split(' UPDATE OF ')[1].split(' ON ')[0].split(', ')
+        assert 'title' in tracked and 'is_hidden' in tracked
+        for col in UNDO_DERIVED:
+            assert col not in tracked
+            assert "'-%s'" % col in sql
+
+
+def test_plain_triggers_journal_all_columns():
+    """Other tables journal every update, keyed by their primary key."""
+    sql = _trigger('hive_votes')
+    assert 'INSERT OR UPDATE OR DELETE ON hive_votes' in sql
+    assert sql.endswith("hive_undo_log('post_id', 'voter_id')")
@@ -0,0 +1 @@
+"""Hive indexer tests."""
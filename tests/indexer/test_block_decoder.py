@@ -0,0 +1,44 @@
+#pylint: disable=missing-docstring
+import ujson as json
+
+from hive.indexer.block_decoder import BlockDecoder, decode_lines, prefilter
+
+def _op(op_type, **value):
+    return {'type': op_type, 'value': value}
+
+def _block(num, txs):
+    return {'block_id': '%08x' % num + '0' * 32,
+            'previous': '%08x' % (num - 1) + '0' * 32,
+            'timestamp': '2016-03-24T16:05:00',
+            'witness': 'initminer',
+            'transaction_ids': ['tx%d_%d' % (num, i) for i in range(len(txs))],
+            'transactions': [{'operations': ops, 'signatures': ['x']}
+                             for ops in txs]}
+
+def test_prefilter_keeps_tx_alignment():
+    block = _block(5, [
+        [_op('vote_operation', voter='a'), _op('comment_operation', author='a')],
+        [_op('custom_json_operation', id='sm_market')],
+        [_op('transfer_operation', to='null', memo='@a/b'),
+         _op('transfer_operation', to='bob', memo='')],
+        [_op('custom_json_operation', id='follow')],
+    ])
+    out = prefilter(block)
+    assert out['op_count'] == 6
+    assert out['transaction_ids'] == block['transaction_ids']
+    assert [len(tx['operations']) for tx in out['transactions']] == [1, 0, 1, 1]
+    assert 'witness' not in out
+    assert 'signatures' not in out['transactions'][0]
+
+def test_decode_lines():
+    lines = [json.dumps(_block(n, [])) for n in (1, 2)]
+    out = decode_lines(lines)
+    assert [b['block_id'][:8] for b in out] == ['00000001', '00000002']
+
+def test_decoder_preserves_order():
+    chunks = [[json.dumps(_block(n, [])) for n in range(i, i + 10)]
+              for i in range(1, 101, 10)]
+    with BlockDecoder(2) as decoder:
+        nums = [int(b['block_id'][:8], 16)
+                for blocks in decoder.decode(iter(chunks)) for b in blocks]
+    assert nums == list(range(1, 101))
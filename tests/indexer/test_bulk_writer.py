@@ -0,0 +1,105 @@
+#pylint: disable=missing-docstring,protected-access,import-outside-toplevel
+import pytest
+
+from hive.db.adapter import Db
+
+class _StubDb:
+    """Records writes; serves `nextval` from a fake sequence."""
+
+    def __init__(self, seq=100):
+        self.seq = seq
+        self.calls = []
+
+    def query_one(self, sql, **kwargs):
+        self.calls.append((sql, kwargs))
+        return self.seq if 'nextval' in sql else kwargs.get('id')
+
+    def query(self, sql, **kwargs):
+        self.calls.append((sql, kwargs))
+
+    def copy_rows(self, table, cols, rows):
+        self.calls.append(('COPY', dict(table=table, cols=cols, rows=list(rows))))
+        return len(rows)
+
+    def names(self):
+        """Statement kinds: leading keyword, or function of a SELECT."""
+        words = [sql.split() for sql, _ in self.calls]
+        return [w[1].split('(')[0] if w[0] == 'SELECT' else w[0] for w in words]
+
+@pytest.fixture
+def db(monkeypatch):
+    stub = _StubDb()
+    monkeypatch.setattr(Db, '_instance', stub)
+    from hive.indexer import bulk_writer, follow
+    monkeypatch.setattr(bulk_writer, 'DB', stub)
+    monkeypatch.setattr(follow, 'DB', stub)
+    bulk_writer.BulkWriter.start()
+    yield stub
+    bulk_writer.BulkWriter.abort()
+
+def _post(pid):
+    return {'id': pid, 'is_valid': True, 'is_muted': False,
+            'is_deleted': False, 'is_pinned': False, 'parent_id': None,
+            'author': 'a', 'permlink': 'p%d' % pid, 'category': 'c',
+            'community_id': None, 'depth': 0, 'promoted': 0,
+            'created_at': '2019-01-01T00:00:00'}
+
+def test_post_ids_drawn_once_per_chunk(db):
+    from hive.indexer.bulk_writer import BulkWriter
+    ids = [BulkWriter.next_id('hive_posts') for _ in range(3)]
+    assert ids == [100, 101, 102]
+    assert db.names() == ['nextval']
+    for pid in ids:
+        assert BulkWriter.add('hive_posts', _post(pid), key=pid)
+    assert not BulkWriter.add('hive_posts', _post(101), key=101)
+
+    # pending rows are addressable and mutable until flushed
+    BulkWriter.get('hive_posts', 101)['is_deleted'] = True
+    assert BulkWriter.remove('hive_posts', 102)
+    assert BulkWriter.get('hive_posts', 102) is None
+
+def test_flush_copies_and_bumps_sequence(db):
+    from hive.indexer.bulk_writer import BulkWriter
+    for _ in range(3):
+        pid = BulkWriter.next_id('hive_posts')
+        BulkWriter.add('hive_posts', _post(pid), key=pid)
+    BulkWriter.add('hive_blocks', {'num': 1, 'hash': 'h', 'prev': None, 'txs': 0,
+                                   'ops': 0, 'created_at': 'x'}, key=1)
+    BulkWriter.add('hive_reblogs', {'account': 'a', 'post_id': 100,
+                                    'created_at': 'x'}, key=('a', 100))
+
+    assert BulkWriter.flush() == 5
+    # dependency order; setval moves the sequence past the last local id
+    assert db.names() == ['nextval', 'COPY', 'COPY', 'setval', 'INSERT']
+    copies = [kwargs for sql, kwargs in db.calls if sql == 'COPY']
+    assert [copy['table'] for copy in copies] == ['hive_blocks', 'hive_posts']
+    assert [row[0] for row in copies[1]['rows']] == [100, 101, 102]
+    assert db.calls[3][1]['id'] == 102
+    assert BulkWriter.get('hive_posts', 100) is None
+    assert BulkWriter.flush() == 0
+
+def test_follow_state_reads_pending_rows(db):
+    from hive.indexer.bulk_writer import BulkWriter
+    from hive.indexer.follow import Follow
+    BulkWriter.add('hive_follows', {'follower': 1, 'following': 2, 'state': 2,
+                                    'created_at': 'x'}, key=(1, 2))
+    assert Follow._get_follow_db_state(1, 2) == 2
+    assert not db.calls
+    Follow._get_follow_db_state(2, 1)
+    assert len(db.calls) == 1 and 'FROM hive_follows' in db.calls[0][0]
+
+def test_community_op_flushes_pending_rows(db, monkeypatch):
+    from hive.indexer import custom_op
+    from hive.indexer.bulk_writer import BulkWriter
+    pending = []
+    monkeypatch.setattr(custom_op, 'process_json_community_op',
+                        lambda *args: pending.append(len(db.calls)))
+    pid = BulkWriter.next_id('hive_posts')
+    BulkWriter.add('hive_posts', _post(pid), key=pid)
+    op = {'id': 'community', 'json': '["subscribe", {"community": "hive-1"}]',
+          'required_auths': [], 'required_posting_auths': ['a']}
+    custom_op.CustomOp.process_ops([op], custom_op.START_BLOCK + 1, 'x')
+    # post row was written before the community op read hive_posts
+    assert pending == [3]
+    assert db.names() == ['nextval', 'COPY', 'setval']
+    assert BulkWriter.get('hive_posts', pid) is None
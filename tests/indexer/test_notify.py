@@ -0,0 +1,58 @@
+#pylint: disable=missing-docstring,protected-access,import-outside-toplevel
+import pytest
+
+from hive.db.adapter import Db
+
+class _StubDb:
+    """Serves stored notif keys (newest post first); records COPYs."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.copied = []
+
+    def query_one(self, sql, **kwargs):
+        # pylint: disable=unused-argument
+        return None
+
+    def query_all(self, sql, **kwargs):
+        return self.rows[:kwargs['limit']]
+
+    def copy_rows(self, table, cols, rows):
+        self.copied.extend(rows)
+        return len(rows)
+
+@pytest.fixture
+def notify(monkeypatch):
+    stub = _StubDb([(5, 17, 1, 2), (4, 17, 1, 2), (4, 16, 1, 3), (3, 17, 9, 9)])
+    monkeypatch.setattr(Db, '_instance', stub)
+    from hive.indexer import notify as module
+    monkeypatch.setattr(module, 'DB', stub)
+    monkeypatch.setattr(module.Notify, 'MAX_KEYS', 3)
+    module.Notify.reset()
+    yield module.Notify
+    module.Notify.reset()
+
+def test_load_is_bounded_by_keys(notify):
+    notify.load_recent()
+    # post 3 may be partial; checked in the db from now on
+    assert notify._floor == 4
+    assert list(notify._recent) == [4, 5]
+    assert notify.exists('vote', 1, 2, 5)
+    assert not notify.exists('vote', 1, 3, 5)
+
+def test_keys_tracked_on_flush(notify):
+    notify.load_recent()
+    notify('vote', src_id=7, dst_id=8, post_id=6, when='x').write()
+    assert notify.exists('vote', 7, 8, 6) # queued
+    assert 6 not in notify._recent
+    notify.flush()
+    assert notify.exists('vote', 7, 8, 6)
+    # over MAX_KEYS: oldest post evicted, floor raised past it
+    assert list(notify._recent) == [5, 6]
+    assert notify._floor == 5
+
+def test_reset_drops_keys(notify):
+    notify.load_recent()
+    notify.reset()
+    assert notify._floor is None
+    assert not notify._recent and not notify._queue
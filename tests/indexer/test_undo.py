@@ -0,0 +1,49 @@
+#pylint: disable=missing-docstring,protected-access,import-outside-toplevel
+import ujson as json
+import pytest
+
+from hive.db.adapter import Db
+
+@pytest.fixture
+def undo(monkeypatch):
+    monkeypatch.setattr(Db, '_instance', object())
+    from hive.indexer.undo import UndoLog
+    return UndoLog
+
+def _table(sql):
+    words = sql.split()
+    return words[1] if words[0] == 'UPDATE' else words[2]
+
+def _actions(sqls):
+    return [(sql.split()[0], _table(sql), json.loads(params['rows']))
+            for sql, params in sqls]
+
+def test_revert_collapses_rows(undo):
+    rows = [
+        ('hive_posts', 'I', {'id': 5}, None),
+        ('hive_posts', 'U', {'id': 5}, {'children': 0}),
+        ('hive_accounts', 'U', {'id': 1}, {'post_count': 3}),
+        ('hive_accounts', 'U', {'id': 1}, {'post_count': 4, 'rank': 9}),
+        ('hive_post_tags', 'D', {'tag': 'a', 'post_id': 2}, {'tag': 'a', 'post_id': 2}),
+        ('hive_post_tags', 'I', {'tag': 'b', 'post_id': 2}, None),
+        ('hive_post_tags', 'D', {'tag': 'b', 'post_id': 2}, {'tag': 'b', 'post_id': 2}),
+    ]
+    assert _actions(undo._revert_sqls(rows)) == [
+        # inserted post: deleted, its updates are moot
+        ('DELETE', 'hive_posts', [{'id': 5}]),
+        # oldest value of each column wins
+        ('UPDATE', 'hive_accounts', [{'post_count': 3, 'rank': 9, 'id': 1}]),
+        # deleted tag restored; tag added and removed again: no-op
+        ('INSERT', 'hive_post_tags', [{'tag': 'a', 'post_id': 2}]),
+    ]
+
+def test_revert_one_statement_per_table_and_action(undo):
+    rows = [('hive_post_tags', 'I', {'tag': t, 'post_id': 1}, None) for t in 'xyz']
+    rows += [('hive_posts_cache_temp_p2026w40', 'I', {'post_id': 1}, None),
+             ('hive_posts', 'I', {'id': 1}, None)]
+    sqls = undo._revert_sqls(rows)
+    # children before parents
+    assert [_table(sql) for sql, _ in sqls] == [
+        'hive_posts_cache_temp_p2026w40', 'hive_post_tags', 'hive_posts']
+    assert len(json.loads(sqls[1][1]['rows'])) == 3
+    assert 'jsonb_populate_recordset' in sqls[0][0]
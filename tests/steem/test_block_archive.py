@@ -0,0 +1,63 @@
+#pylint: disable=missing-docstring
+from hive.steem.block.archive import BlockArchive
+from hive.utils.checkpoint import CheckpointReader, block_num_from_line
+
+class FakeClient:
+    def __init__(self):
+        self.calls = []
+
+    def get_blocks_range(self, lbound, ubound):
+        self.calls.append((lbound, ubound))
+        return [_block(num) for num in range(lbound, ubound)]
+
+def _block(num, fork=''):
+    return {'block_id': '%08x' % num + fork, 'timestamp': ''}
+
+def _nums(path, start=None):
+    return [block_num_from_line(line) for line in CheckpointReader(path).lines(start)]
+
+def test_segments_and_confirm(tmpdir):
+    archive = BlockArchive(FakeClient(), str(tmpdir), segment_size=10)
+    for num in range(1, 26):
+        archive.add(_block(num))
+    archive.confirm(22)
+    archive.close()
+    assert _nums(archive.segment_path(1)) == list(range(1, 11))
+    assert _nums(archive.segment_path(11)) == list(range(11, 21))
+    assert _nums(archive.segment_path(21)) == [21, 22]
+    assert archive.segment_path(20).endswith('/20.json.gz')
+
+def test_fork_replaces_pending(tmpdir):
+    archive = BlockArchive(FakeClient(), str(tmpdir), segment_size=100)
+    for num in range(1, 6):
+        archive.add(_block(num))
+    archive.add(_block(4, 'ff'))
+    archive.confirm(10)
+    archive.close()
+    lines = list(CheckpointReader(archive.segment_path(1)).lines())
+    assert len(lines) == 4
+    assert 'ff' in lines[-1]
+
+def test_resume_and_backfill(tmpdir):
+    client = FakeClient()
+    archive = BlockArchive(client, str(tmpdir), segment_size=100)
+    for num in range(1, 6):
+        archive.add(_block(num))
+    archive.confirm(5)
+    archive.close()
+
+    # restart later: duplicates skipped, gap fetched from client
+    archive = BlockArchive(client, str(tmpdir), segment_size=100)
+    for num in range(4, 11):
+        archive.add(_block(num))
+    archive.confirm(10)
+    archive.close()
+    assert not client.calls
+    assert _nums(archive.segment_path(1)) == list(range(1, 11))
+
+    archive = BlockArchive(client, str(tmpdir), segment_size=100)
+    archive.add(_block(15))
+    archive.confirm(15)
+    archive.close()
+    assert client.calls == [(11, 15)]
+    assert _nums(archive.segment_path(1), 9) == list(range(9, 16))
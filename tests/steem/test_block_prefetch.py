@@ -0,0 +1,61 @@
+#pylint: disable=missing-docstring
+import ujson as json
+import pytest
+
+from hive.steem.block.prefetch import BlockPrefetcher
+
+class FakeClient:
+    def __init__(self, fail_at=None):
+        self.calls = []
+        self._fail_at = fail_at
+
+    def get_blocks_range(self, lbound, ubound):
+        self.calls.append((lbound, ubound))
+        if self._fail_at is not None and lbound >= self._fail_at:
+            raise Exception('node down')
+        return [{'block_id': '%08x' % num, 'timestamp': ''}
+                for num in range(lbound, ubound)]
+
+def _nums(chunk):
+    return [int(block['block_id'], base=16) for block in chunk]
+
+def test_chunks_in_order():
+    client = FakeClient()
+    prefetcher = BlockPrefetcher(client, 1, 26, chunk_size=10, depth=2)
+    chunks = list(prefetcher.start().chunks())
+    assert [len(c) for c in chunks] == [10, 10, 5]
+    assert sum(map(_nums, chunks), []) == list(range(1, 26))
+    assert client.calls == [(1, 11), (11, 21), (21, 26)]
+
+def test_memory_cap_allows_single_chunk():
+    client = FakeClient()
+    prefetcher = BlockPrefetcher(client, 1, 101, chunk_size=10,
+                                 depth=5, max_mb=1)
+    prefetcher._max_bytes = 1 # pylint: disable=protected-access
+    chunks = list(prefetcher.start().chunks())
+    assert len(chunks) == 10
+    assert 'queue 0/5' in prefetcher.status()
+
+def test_error_raised_after_buffered_chunks():
+    client = FakeClient(fail_at=21)
+    prefetcher = BlockPrefetcher(client, 1, 41, chunk_size=10, depth=3)
+    chunks = prefetcher.start().chunks()
+    assert _nums(next(chunks)) == list(range(1, 11))
+    assert _nums(next(chunks)) == list(range(11, 21))
+    with pytest.raises(Exception):
+        next(chunks)
+
+def test_stop_early():
+    client = FakeClient()
+    prefetcher = BlockPrefetcher(client, 1, 10001, chunk_size=10, depth=1)
+    chunks = prefetcher.start().chunks()
+    next(chunks)
+    prefetcher.stop()
+    assert len(client.calls) < 1000
+
+def test_estimate_size():
+    from hive.steem.block.prefetch import estimate_size
+    blocks = FakeClient().get_blocks_range(1, 201)
+    assert estimate_size([]) == 0
+    actual = len(json.dumps(blocks))
+    assert abs(estimate_size(blocks) - actual) < actual * 0.05
@@ -0,0 +1,89 @@
+#pylint: disable=missing-docstring
+from datetime import datetime, timedelta
+
+from hive.steem.block.stream import BlockStream, ForkException
+
+class FakeClient:
+    """Chain of `head` blocks, 3s apart, the last one produced just now."""
+    def __init__(self, head):
+        self._head = head
+        self.calls = []
+        self._genesis = datetime.utcnow() - timedelta(seconds=3 * head)
+
+    def head_block(self):
+        return self._head
+
+    def get_blocks_range(self, lbound, ubound):
+        self.calls.append((lbound, ubound))
+        return [self.get_block(num) for num in range(lbound, ubound)]
+
+    def get_block(self, num, strict=True):
+        #pylint: disable=unused-argument
+        if num > self._head:
+            return None
+        date = self._genesis + timedelta(seconds=3 * num)
+        return {'block_id': '%08x' % num + '00' * 16,
+                'previous': '%08x' % (num - 1) + '00' * 16,
+                'timestamp': date.strftime('%Y-%m-%dT%H:%M:%S')}
+
+def _nums(group):
+    return [int(block['block_id'][:8], base=16) for block in group]
+
+def test_groups_while_behind():
+    stream = BlockStream.stream_groups(FakeClient(100), 51, min_gap=0, max_gap=None,
+                                       group_gap=10, group_size=15)
+    groups = [_nums(next(stream)) for _ in range(13)]
+    assert groups[0] == list(range(51, 66))
+    assert groups[1] == list(range(66, 81))
+    assert groups[2] == list(range(81, 91)) # caught up to within 10 of head
+    assert groups[3:] == [[num] for num in range(91, 101)]
+
+def test_single_blocks_when_disabled():
+    stream = BlockStream.stream_groups(FakeClient(100), 91, max_gap=None)
+    assert [_nums(next(stream)) for _ in range(3)] == [[91], [92], [93]]
+
+def test_catchup_in_batches():
+    client = FakeClient(200)
+    stream = BlockStream.stream(client, 81, min_gap=2, max_gap=None)
+    nums = [int(next(stream)['block_id'][:8], base=16) for _ in range(118)]
+    assert nums == list(range(81, 199))
+    assert client.calls == [(81, 131), (131, 181), (181, 201)]
+
+def test_catchup_keeps_fork_checks():
+    client = FakeClient(100)
+    real = client.get_block
+    def forked(num, strict=True):
+        block = real(num, strict)
+        if block and num == 60:
+            block['previous'] = 'ff' * 20
+        return block
+    client.get_block = forked
+    stream = BlockStream.stream(client, 51, max_gap=None)
+    nums = []
+    try:
+        for block in stream:
+            nums.append(int(block['block_id'][:8], base=16))
+    except ForkException:
+        pass
+    assert nums == list(range(51, 60))
+
+def test_catchup_short_range():
+    client = FakeClient(100)
+    real = client.get_blocks_range
+    def short(lbound, ubound):
+        return real(lbound, ubound)[:5] + [None]
+    client.get_blocks_range = short
+    stream = BlockStream.stream(client, 51, min_gap=0, max_gap=None)
+    nums = [int(next(stream)['block_id'][:8], base=16) for _ in range(50)]
+    assert nums == list(range(51, 101))
+
+def test_catchup_range_unavailable():
+    client = FakeClient(100)
+    def lagging(lbound, ubound):
+        client.calls.append((lbound, ubound))
+        raise AssertionError("result w/o block key")
+    client.get_blocks_range = lagging
+    stream = BlockStream.stream(client, 51, min_gap=0, max_gap=None)
+    nums = [int(next(stream)['block_id'][:8], base=16) for _ in range(50)]
+    assert nums == list(range(51, 101))
+    assert client.calls
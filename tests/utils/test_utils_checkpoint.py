@@ -0,0 +1,91 @@
+#pylint: disable=missing-docstring,redefined-outer-name
+import os
+import pytest
+
+from hive.utils.checkpoint import (CheckpointWriter, CheckpointReader,
+                                   block_num_from_line, convert, index_path)
+
+def _line(num):
+    return '{"block_id":"%08x00000000","previous":"","transactions":[]}' % num
+
+@pytest.fixture
+def lst(tmpdir):
+    path = str(tmpdir.join('2500.json.lst'))
+    with open(path, 'w') as f:
+        for num in range(1, 2501):
+            f.write(_line(num) + '\n')
+    return path
+
+def test_block_num_from_line():
+    assert block_num_from_line(_line(23494494)) == 23494494
+
+def test_convert_and_read_all(lst):
+    path = convert(lst, frame_size=100)
+    assert path.endswith('2500.json.gz')
+    assert os.path.exists(index_path(path))
+    reader = CheckpointReader(path)
+    assert reader.first_num() == 1
+    assert reader.last_num() == 2500
+    assert list(reader.lines()) == [_line(n) for n in range(1, 2501)]
+
+def test_seek(lst):
+    reader = CheckpointReader(convert(lst, frame_size=100))
+    lines = reader.lines(1234)
+    assert block_num_from_line(next(lines)) == 1234
+    assert len(list(lines)) == 2500 - 1234
+    assert list(reader.lines(2501)) == []
+
+def test_append_resume(tmpdir):
+    path = str(tmpdir.join('100.json.gz'))
+    writer = CheckpointWriter(path, frame_size=10)
+    for num in range(1, 46):
+        writer.append(num, _line(num))
+    writer.close()
+
+    writer = CheckpointWriter(path, frame_size=10)
+    assert writer.last_num() == 45
+    with pytest.raises(AssertionError):
+        writer.append(47, _line(47))
+    for num in range(46, 101):
+        writer.append(num, _line(num))
+    writer.close()
+
+    lines = list(CheckpointReader(path).lines(40))
+    assert lines == [_line(n) for n in range(40, 101)]
+
+def test_unindexed_tail_dropped(tmpdir):
+    path = str(tmpdir.join('20.json.gz'))
+    writer = CheckpointWriter(path, frame_size=10)
+    for num in range(1, 21):
+        writer.append(num, _line(num))
+    writer.close()
+
+    # simulate a crash after a frame write but before its index line
+    with open(path, 'ab') as f:
+        f.write(b'garbage')
+    with open(index_path(path), 'a') as f:
+        f.write('21 ')
+
+    writer = CheckpointWriter(path, frame_size=10)
+    writer.append(21, _line(21))
+    writer.close()
+    assert list(CheckpointReader(path).lines(19)) == [_line(n) for n in (19, 20, 21)]
+
+def test_index_replaced_atomically(tmpdir):
+    path = str(tmpdir.join('30.json.gz'))
+    writer = CheckpointWriter(path, frame_size=10)
+    for num in range(1, 31):
+        writer.append(num, _line(num))
+    writer.close()
+    with open(index_path(path), 'a') as f:
+        f.write('31 ')
+
+    # a leftover temp index from an earlier crash is simply overwritten
+    with open(index_path(path) + '.tmp', 'w') as f:
+        f.write('1 0\n')
+    writer = CheckpointWriter(path, frame_size=10)
+    assert writer.last_num() == 30
+    assert not os.path.exists(index_path(path) + '.tmp')
+    with open(index_path(path)) as f:
+        assert len(f.readlines()) == 3
+    writer.close()
@@ -0,0 +1,69 @@
+#pylint: disable=missing-docstring,protected-access
+from hive.utils.idmap import CompactIdMap
+
+def test_get_put():
+    ids = CompactIdMap(100)
+    assert ids.get('a/b') is None
+    ids.put('a/b', 1)
+    ids.put('a/c', 2)
+    assert ids.get('a/b') == 1
+    assert ids.get('a/c') == 2
+    assert 'a/c' in ids
+    assert 'a/d' not in ids
+    assert len(ids) == 2
+    assert ids.stats() == (2, 1, 2, 0)
+
+def test_grows_and_keeps_entries():
+    ids = CompactIdMap(100000)
+    for i in range(1, 5001):
+        ids.put('acct/post-%d' % i, i)
+    assert len(ids) == 5000
+    assert all(ids.get('acct/post-%d' % i) == i for i in range(1, 5001))
+
+def test_clock_eviction_prefers_unreferenced():
+    ids = CompactIdMap(500)
+    for i in range(1, 501):
+        ids.put('p%d' % i, i)
+    # first sweep clears all ref bits; re-reference a few
+    ids.put('p501', 501)
+    hot = ['p%d' % i for i in range(400, 420)]
+    for key in hot:
+        ids.get(key)
+    for i in range(502, 800):
+        ids.put('p%d' % i, i)
+    assert len(ids) == 500
+    assert ids.evictions == 299
+    assert all(key in ids for key in hot)
+    # every remaining entry is still reachable after backward shifts
+    present = [i for i in range(1, 800) if 'p%d' % i in ids]
+    assert len(present) == 500
+    assert all(ids.get('p%d' % i) == i for i in present)
+
+def test_put_remaps_same_key():
+    ids = CompactIdMap(10)
+    ids.put('x/y', 5)
+    ids.put('x/y', 6)
+    assert ids.get('x/y') == 6
+    assert len(ids) == 1
+
+def test_hash_collision_is_verified():
+    ids = CompactIdMap(10)
+    ids._hash = lambda key: 42
+    ids.put('x/y', 5)
+    # same 64-bit hash, different key: not aliased to x/y
+    assert ids.get('x/z') is None
+    assert 'x/z' not in ids
+    ids.put('x/z', 6)
+    assert ids.get('x/y') is None
+    assert ids.get('x/z') is None
+    assert ids._ambiguous == {42}
+
+def test_eviction_prunes_ambiguous():
+    ids = CompactIdMap(2)
+    ids._hash = lambda key: 42 if key in ('x/y', 'x/z') else (hash(key) & 0xffff) or 1
+    ids.put('x/y', 5)
+    ids.put('x/z', 6)
+    for i in range(1, 10):
+        ids.put('p%d' % i, i)
+    assert 'x/y' not in ids
+    assert not ids._ambiguous
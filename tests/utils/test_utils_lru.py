@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""Tests for the bounded LRU cache."""
+
+from hive.utils.lru import LruCache
+
+
+def test_lru_evicts_least_recently_used():
+    """A read refreshes an entry; the oldest unread one is evicted."""
+    cache = LruCache(2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert 'b' not in cache
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert len(cache) == 2
+
+
+def test_lru_stats():
+    """Hits, misses, entries and evictions are counted."""
+    cache = LruCache(1)
+    assert cache.get('a') is None
+    cache.put('a', 1)
+    cache.get('a')
+    cache.put('b', 2)
+    assert cache.stats() == (1, 1, 1, 1)
@@ -0,0 +1,41 @@
+#pylint: disable=missing-docstring
+from hive.utils.namemap import NameIdMap
+
+ROWS = [('steemit', 3), ('alice', 7), ('bob', 2), ('zed', 9), ('a', 1)]
+
+def test_lookup():
+    ids = NameIdMap.from_rows(ROWS)
+    assert len(ids) == 5
+    assert all(ids.get(name) == _id for name, _id in ROWS)
+    assert ids.get('carol') is None
+    assert 'bob' in ids
+    assert 'b' not in ids
+    assert 'zzz' not in ids
+
+def test_overlay():
+    ids = NameIdMap.from_rows(ROWS)
+    ids.add('carol', 10)
+    assert ids.get('carol') == 10
+    assert ids.overlay_size() == 1
+    assert sorted(ids.items()) == sorted(ROWS + [('carol', 10)])
+
+def test_snapshot_roundtrip(tmpdir):
+    path = str(tmpdir.join('accounts.snap'))
+    ids = NameIdMap.from_rows(ROWS)
+    ids.add('carol', 10)
+    assert ids.save(path) == 10
+
+    loaded, max_id = NameIdMap.load(path)
+    assert max_id == 10
+    assert loaded.max_name() == ('carol', 10)
+    assert len(loaded) == 6
+    assert loaded.get('zed') == 9
+    assert loaded.get('carol') == 10
+    assert loaded.get('nobody') is None
+
+def test_invalid_snapshot(tmpdir):
+    path = tmpdir.join('bad.snap')
+    path.write_binary(b'not a snapshot at all, just some bytes')
+    assert NameIdMap.load(str(path)) is None
+    path.write_binary(b'')
+    assert NameIdMap.load(str(path)) is None
@@ -0,0 +1,30 @@
+#pylint: disable=missing-docstring
+from datetime import datetime
+
+from hive.utils.payouts import PayoutSchedule
+
+def test_pop_due_in_order():
+    sched = PayoutSchedule()
+    sched.load([(1, datetime(2018, 1, 3), 'a/x'),
+                (2, datetime(2018, 1, 1), 'b/y'),
+                (3, datetime(2018, 1, 5), 'c/z')])
+    assert sched.pop_due('2017-12-31T00:00:00') == []
+    assert sched.pop_due('2018-01-03T00:00:00') == [(2, 'b/y'), (1, 'a/x')]
+    assert sched.pop_due('2018-01-04 00:00:00') == []
+    assert len(sched) == 1 and 3 in sched
+
+def test_reschedule_and_remove():
+    sched = PayoutSchedule()
+    sched.add(1, '2018-01-01T00:00:00', 'a/x')
+    sched.add(2, '2018-01-01T00:00:00', 'b/y')
+    sched.add(1, '2018-01-10T00:00:00', 'a/x') # stale entry left in heap
+    sched.remove(2)
+    assert sched.pop_due('2018-01-05T00:00:00') == []
+    assert sched.pop_due('2018-01-10T00:00:00') == [(1, 'a/x')]
+    assert not sched
+
+def test_stale_entries_purged():
+    sched = PayoutSchedule()
+    for i in range(5000):
+        sched.add(1, datetime(2018, 1, 1 + i % 28), 'a/x')
+    assert len(sched._heap) <= 2 * len(sched) + 1000
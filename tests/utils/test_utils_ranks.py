@@ -0,0 +1,44 @@
+#pylint: disable=missing-docstring
+import random
+
+from hive.utils.ranks import RankIndex
+
+def _expected(weights):
+    return {_id: 1 + sum(1 for w in weights.values() if w > weight)
+            for _id, weight in weights.items()}
+
+def test_load_and_rank():
+    ranks = RankIndex()
+    ranks.load([(1, 5.0), (2, 1e9), (3, 0), (4, 5.0), (7, 300.5)])
+    assert [ranks.rank(i) for i in (2, 7, 1, 4, 3)] == [1, 2, 3, 3, 5]
+    assert ranks.rank(5) is None
+    assert ranks.rank(100) is None
+    assert len(ranks) == 5
+
+def test_updates_match_full_sort():
+    rnd = random.Random(42)
+    weights = {i: rnd.choice([0, 1, rnd.random() * 1e12, rnd.random() * 1e6])
+               for i in range(1, 2001)}
+    ranks = RankIndex()
+    ranks.load(weights.items())
+    for _ in range(3000):
+        _id = rnd.randint(1, 2500)
+        weights[_id] = rnd.random() * 10 ** rnd.randint(0, 13)
+        ranks.update(_id, weights[_id])
+    expected = _expected(weights)
+    assert all(ranks.rank(_id) == rank for _id, rank in expected.items())
+
+def test_zero_weights_are_counted():
+    ranks = RankIndex()
+    ranks.load([(i, 0) for i in range(1, 1001)] + [(1001, 0.5), (1002, -1)])
+    assert not ranks._buckets[0].count(0.0)
+    assert ranks.rank(1001) == 1
+    assert ranks.rank(1) == ranks.rank(1000) == 2
+    assert ranks.rank(1002) == 1002
+    ranks.update(5, 3.0)
+    ranks.update(1001, 0)
+    ranks.update(1003, 0)
+    assert ranks.rank(5) == 1
+    assert ranks.rank(1001) == 2
+    assert ranks.rank(1002) == 1003
+    assert len(ranks) == 1003
@@ -0,0 +1,67 @@
+#pylint: disable=missing-docstring
+import time
+from contextlib import contextmanager
+
+from hive.utils.scheduler import JobScheduler
+
+class FakeDb:
+    def __init__(self):
+        self.log = []
+
+    @contextmanager
+    def background(self):
+        self.log.append('START TRANSACTION')
+        try:
+            yield self
+        except Exception:
+            self.log.append('ROLLBACK')
+            raise
+        self.log.append('COMMIT')
+
+    def query_one(self, sql, **kwargs):
+        self.log.append((sql, kwargs))
+
+def _wait_for(cond, secs=2):
+    end = time.time() + secs
+    while not cond() and time.time() < end:
+        time.sleep(0.01)
+    return cond()
+
+def test_runs_jobs_in_transactions_and_applies_results():
+    db = FakeDb()
+    applied = []
+    jobs = JobScheduler(db)
+    job = jobs.add('count', lambda db: len(db.log), 0.01, budget=2,
+                   apply=applied.append)
+    jobs.start()
+    assert _wait_for(lambda: job.runs >= 3)
+    jobs.stop()
+
+    assert db.log[:3] == ['START TRANSACTION',
+                          ("SELECT set_config('statement_timeout', :ms, true)",
+                           {'ms': '2000'}),
+                          'COMMIT']
+    assert applied == [] # callbacks only run on collect
+    assert jobs.collect() == job.runs
+    assert applied[:2] == [2, 5]
+
+def test_failed_job_rolls_back():
+    db = FakeDb()
+    jobs = JobScheduler(db)
+    def fail(db):
+        raise ValueError('boom')
+    job = jobs.add('fail', fail, 0.01)
+    ok = jobs.add('ok', lambda db: None, 0.01)
+    jobs.start()
+    assert _wait_for(lambda: job.runs >= 2 and ok.runs >= 2)
+    jobs.stop()
+    assert job.failures == job.runs
+    assert ok.failures == 0
+    assert 'ROLLBACK' in db.log
+    assert 'fail: ' in jobs.report()
+
+def test_jittered_schedule():
+    jobs = JobScheduler(FakeDb())
+    start = time.time()
+    job = jobs.add('slow', lambda db: None, 100)
+    assert start + 89 < job.due < time.time() + 111